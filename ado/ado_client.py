@@ -0,0 +1,243 @@
+import base64
+import json
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# --- ENDPOINTS ---
+# Standard ADO REST vs Licensing API (vsaex) live on different domains.
+# ADO_BASE_URL / ADO_LICENSING_URL point the scripts elsewhere (e.g. ado/bench/fake_ado.py).
+def org_url(org):
+    return f"{os.getenv('ADO_BASE_URL', 'https://dev.azure.com').rstrip('/')}/{org}"
+
+
+def licensing_url(org):
+    return f"{os.getenv('ADO_LICENSING_URL', 'https://vsaex.dev.azure.com').rstrip('/')}/{org}"
+
+
+# Graph (groups, memberships, subjects) lives on the identity domain
+def graph_url(org):
+    return f"{os.getenv('ADO_GRAPH_URL', 'https://vssps.dev.azure.com').rstrip('/')}/{org}"
+
+
+# Audit log (org-wide event stream)
+def audit_url(org):
+    return f"{os.getenv('ADO_AUDIT_URL', 'https://auditservice.dev.azure.com').rstrip('/')}/{org}"
+
+
+# Analytics OData (org-wide entity sets, e.g. .../WorkItems)
+def analytics_url(org):
+    return f"{os.getenv('ADO_ANALYTICS_URL', 'https://analytics.dev.azure.com').rstrip('/')}/{org}/_odata/v4.0-preview"
+
+
+# --- RATE BUDGET ---
+# One token bucket shared by all worker threads of a client.
+# ADO throttles per user/PAT, so every request of the process draws from the same budget.
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    # Stop handing out tokens for a while (Retry-After / X-RateLimit-Delay)
+    def pause(self, seconds):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+    # Multiplicative decrease when ADO signals pressure...
+    def slow_down(self):
+        with self.lock:
+            self.rate = max(self.max_rate / 20, self.rate / 2)
+
+    # ...additive increase back to the configured rate while things go well
+    def speed_up(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+# Process-wide budget: once set, every client created afterwards draws from this one bucket,
+# e.g. the stages of one org that run_orgs.py runs side by side in one process.
+_shared_bucket = None
+
+
+def share_rate_budget(rate, burst=None):
+    global _shared_bucket
+    _shared_bucket = TokenBucket(rate, burst or max(1, int(rate)))
+
+
+# Non-200 answer of get_json / post_json; status_code tells e.g. a rejected query (400) from the rest
+class AdoHttpError(RuntimeError):
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+# --- CLIENT ---
+class AdoClient:
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, pat, *, rate=None, burst=None, max_retries=None, pool_size=16, timeout=60, cache=None, metrics=None):
+        # Defaults can be tuned per run via env without touching the scripts
+        rate = rate or float(os.getenv("ADO_MAX_RPS", "10"))
+        burst = burst or max(1, int(rate))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("ADO_MAX_RETRIES", "5"))
+        self.timeout = timeout
+        self.cache = cache  # optional ResponseCache for get_json
+        self.metrics = metrics  # optional Metrics, records every HTTP attempt
+        self.bucket = _shared_bucket or TokenBucket(rate, burst)
+
+        encoded_pat = base64.b64encode(f":{pat}".encode()).decode()
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Basic {encoded_pat}",
+            "Content-Type": "application/json",
+        })
+
+        # keep-alive pool sized for the crawl thread pools
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    # Send one request, honouring the shared budget and ADO throttling headers.
+    # GETs are retried on 429/5xx and connection errors; other methods only on 429
+    # (ADO rejects throttled requests before processing them, so a replay is safe).
+    def request(self, method, url, *, params=None, json=None, headers=None):
+        idempotent = method.upper() == "GET"
+        attempt = 0
+
+        while True:
+            self.bucket.acquire()
+            t0 = time.monotonic()
+            try:
+                resp = self.session.request(
+                    method, url, params=params, json=json, headers=headers, timeout=self.timeout
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if self.metrics:
+                    self.metrics.record_http(method, url, type(e).__name__, time.monotonic() - t0, retry=attempt > 0)
+                if not idempotent or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                time.sleep(self._backoff(attempt))
+                continue
+
+            if self.metrics:
+                self.metrics.record_http(
+                    method, url, resp.status_code, time.monotonic() - t0,
+                    nbytes=len(resp.content), retry=attempt > 0, headers=resp.headers,
+                )
+            self._observe_rate_limit(resp)
+
+            retryable = resp.status_code == 429 or (idempotent and resp.status_code in self.RETRY_STATUSES)
+            if not retryable or attempt >= self.max_retries:
+                return resp
+
+            attempt += 1
+            delay = self._retry_after(resp) or self._backoff(attempt)
+            print(f"::warning::{method} {url} returned {resp.status_code}, retry {attempt}/{self.max_retries} in {delay:.1f}s")
+            self.bucket.pause(delay)
+
+    def get(self, url, params=None):
+        return self.request("GET", url, params=params)
+
+    def patch(self, url, payload, params=None):
+        return self.request(
+            "PATCH", url, params=params, json=payload,
+            headers={"Content-Type": "application/json-patch+json"},
+        )
+
+    # GET + status check + JSON decode (what the crawl scripts need).
+    # With a cache: fresh entries skip the network, stale ones are revalidated.
+    def get_json(self, url, params=None):
+        cache = self.cache
+        entry = cache.load(url, params) if cache else None
+
+        if entry and cache.is_fresh(url, entry):
+            cache.count_hit()
+            return json.loads(entry["body"])
+
+        headers = cache.validators(entry) if entry else None
+        resp = self.request("GET", url, params=params, headers=headers)
+
+        if resp.status_code == 304 and entry:
+            cache.refresh(url, params, entry)
+            return json.loads(entry["body"])
+
+        if resp.status_code != 200:
+            raise AdoHttpError(f"GET {url} failed: {resp.status_code} {resp.text}", resp.status_code)
+
+        if cache:
+            cache.store(url, params, resp)
+        return resp.json()
+
+    # POST + status check + JSON decode, for the read-only query endpoints (WIQL, workitemsbatch).
+    # Not cached: the body is part of the request.
+    def post_json(self, url, payload, params=None):
+        resp = self.request("POST", url, params=params, json=payload)
+        if resp.status_code != 200:
+            raise AdoHttpError(f"POST {url} failed: {resp.status_code} {resp.text}", resp.status_code)
+        return resp.json()
+
+    # --- THROTTLING ---
+    # https://learn.microsoft.com/en-us/azure/devops/integrate/concepts/rate-limits
+    def _observe_rate_limit(self, resp):
+        h = resp.headers
+
+        if resp.status_code in (429, 503):
+            self.bucket.slow_down()
+            return
+
+        delay = _to_float(h.get("X-RateLimit-Delay"))
+        remaining = _to_float(h.get("X-RateLimit-Remaining"))
+        limit = _to_float(h.get("X-RateLimit-Limit"))
+
+        if delay:
+            # ADO is already delaying us - back off before it turns into 429s
+            self.bucket.slow_down()
+            self.bucket.pause(delay)
+        elif remaining is not None and limit and remaining < 0.1 * limit:
+            self.bucket.slow_down()
+        else:
+            self.bucket.speed_up()
+
+    @staticmethod
+    def _retry_after(resp):
+        return _to_float(resp.headers.get("Retry-After"))
+
+    @staticmethod
+    def _backoff(attempt):
+        # exponential backoff with jitter, capped at one minute
+        return min(60.0, 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,572 @@
+import argparse
+import hashlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlsplit
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from metrics import endpoint_template  # noqa: E402
+
+# (users, projects, WITs per process)
+SCALES = {
+    "small": (2_000, 20, 10),
+    "medium": (10_000, 100, 20),
+    "large": (50_000, 500, 40),
+}
+
+# license display name, licensingSource, weight
+LICENSES = [
+    ("Basic", "account", 60),
+    ("Stakeholder", "account", 22),
+    ("Basic + Test Plans", "account", 6),
+    ("Visual Studio Enterprise subscription", "msdn", 10),
+    ("Visual Studio Professional subscription", "msdn", 2),
+]
+
+BASE_WITS = ["Bug", "Task", "User Story", "Feature", "Epic", "Issue", "Test Case", "Test Plan", "Test Suite"]
+SYSTEM_FIELDS = 40   # System.* / Microsoft.VSTS.* fields on every WIT
+WORK_ITEMS = 100     # work items per project
+STATES = ["New", "Active", "Resolved", "Closed", "Removed"]
+NEVER = "0001-01-01T00:00:00Z"
+
+ENTITLEMENT_NAME_FILTER = re.compile(r"name eq '((?:[^']|'')*)'")
+
+WIQL_AFTER_ID = re.compile(r"\[System\.Id\]\s*>\s*(\d+)")
+WIQL_CHANGED_SINCE = re.compile(r"\[System\.ChangedDate\]\s*>=\s*'([^']+)'")
+
+ODATA_PROJECTS = re.compile(r"Project/ProjectName in \(([^)]*)\)")
+ODATA_NOT_NULL = re.compile(r"(\w+) ne null")
+ODATA_IIF = re.compile(r"iif\((\w+) ne null, 1, 0\) as (\w+)")
+ODATA_APPLY = re.compile(r"filter\((?P<filter>.*?)\)(?:/compute\((?P<compute>.*)\))?"
+                         r"/groupby\(\(Project/ProjectName\), aggregate\(\$count as Count(?:, \w+ with sum as \w+)*\)\)")
+
+
+def iso(dt):
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+# --- SYNTHETIC ORG ---
+# Deterministic for a given seed, so runs at the same scale are comparable.
+class SyntheticOrg:
+    def __init__(self, users, projects, wits, processes=5, custom_fields=300, work_items=WORK_ITEMS, seed=42):
+        rng = random.Random(seed)
+        now = datetime.now(timezone.utc)
+
+        def guid():
+            return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+        # users as compact tuples; entitlement JSON is rendered per request
+        weights = [w for _, _, w in LICENSES]
+        self.users = []
+        for i in range(users):
+            license_name, source, _ = rng.choices(LICENSES, weights)[0]
+            created = now - timedelta(days=rng.randint(1, 1500))
+            if rng.random() < 0.1:
+                last = NEVER
+            else:
+                last = iso(max(created, now - timedelta(days=rng.randint(0, 400), minutes=rng.randint(0, 1440))))
+            self.users.append([guid(), f"user{i:06d}@bench.example", license_name, source, last, iso(created)])
+        self.original_licenses = [u[2] for u in self.users]
+        self.user_index = {u[0]: i for i, u in enumerate(self.users)}
+
+        # org field catalogue
+        self.fields = [
+            {"referenceName": f"System.Field{i:02d}", "name": f"System Field {i:02d}",
+             "type": rng.choice(["string", "integer", "dateTime", "html"]), "isIdentity": i % 10 == 0}
+            for i in range(SYSTEM_FIELDS)
+        ] + [
+            {"referenceName": f"Custom.Field{i:04d}", "name": f"Custom Field {i:04d}",
+             "type": rng.choice(["string", "integer", "double", "boolean", "dateTime"]), "isIdentity": False}
+            for i in range(custom_fields)
+        ]
+        custom_refs = [f["referenceName"] for f in self.fields[SYSTEM_FIELDS:]]
+        system_refs = [f["referenceName"] for f in self.fields[:SYSTEM_FIELDS]]
+        self.field_names = {f["referenceName"]: f["name"] for f in self.fields}
+
+        # processes: WIT name -> field refs (system fields plus a few custom ones)
+        self.processes = []
+        for p in range(processes):
+            wit_names = (BASE_WITS + [f"Custom Type {i:02d}" for i in range(wits)])[:wits]
+            self.processes.append({
+                "typeId": guid(),
+                "name": "Agile" if p == 0 else f"Agile Inherited {p:02d}",
+                "wits": {w: system_refs + rng.sample(custom_refs, rng.randint(0, 8)) for w in wit_names},
+            })
+
+        # projects, round-robin over processes
+        self.projects = [
+            {"id": guid(), "name": f"Project {i:04d}", "process": i % processes}
+            for i in range(projects)
+        ]
+        for i, p in enumerate(self.projects):
+            p["lastUpdateTime"] = iso(now - timedelta(days=i % 365))
+        self.projects_by_id = {p["id"]: p for p in self.projects}
+        self.projects_by_name = {p["name"]: p for p in self.projects}
+
+        # work items: id -> [project index, type, state, changed date, changed by], ids ascending per project
+        self.work_items = {}
+        self.project_work_items = [[] for _ in self.projects]
+        for n in range(projects * work_items):
+            p = n % projects
+            wit = rng.choice(list(self.processes[self.projects[p]["process"]]["wits"]))
+            changed = iso(now - timedelta(days=rng.randint(0, 400), minutes=rng.randint(0, 1440)))
+            who = self.users[rng.randrange(users)][1] if users else "nobody@bench.example"
+            self.work_items[n + 1] = [p, wit, rng.choice(STATES), changed, who]
+            self.project_work_items[p].append(n + 1)
+
+        # Graph: two groups, "Service Accounts" nested in "License Keepers" (index based, no rng draws)
+        service = {"descriptor": "vssgp.fake-service-accounts", "displayName": "Service Accounts",
+                   "members": [self.user_descriptor(i) for i in range(0, users, 331)]}
+        keepers = {"descriptor": "vssgp.fake-license-keepers", "displayName": "License Keepers",
+                   "members": [self.user_descriptor(i) for i in range(5, users, 97)] + [service["descriptor"]]}
+        self.groups = {}
+        for g in (keepers, service):
+            g["principalName"] = f"[BENCH]\\{g['displayName']}"
+            self.groups[g["descriptor"]] = g
+        self.lock = threading.Lock()
+        self.audit = []  # decorated audit log entries, oldest first
+        self.rng = rng
+
+    def reset(self):
+        with self.lock:
+            for user, license_name in zip(self.users, self.original_licenses):
+                user[2] = license_name
+            self.audit = []
+
+    # caller holds self.lock
+    def log_event(self, action, **data):
+        self.audit.append({"id": str(uuid.uuid4()), "actionId": action, "area": "Licensing",
+                           "timestamp": iso(datetime.now(timezone.utc)), "data": data})
+
+    # Org churn between two scans: new users, removed users (both in the audit log) and logins (not audited)
+    def churn(self, added=0, removed=0, logins=0):
+        now = datetime.now(timezone.utc)
+        with self.lock:
+            for _ in range(removed):
+                eid, email, license_name = self.users.pop(self.rng.randrange(len(self.users)))[:3]
+                self.log_event("Licensing.Removed", UserIdentifier=email, AccessLevel=license_name)
+            for n in range(added):
+                eid = str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+                email = f"new{len(self.users):06d}.{n}@bench.example"
+                self.users.append([eid, email, "Basic", "account", NEVER, iso(now)])
+                self.log_event("Licensing.Assigned", UserIdentifier=email, AccessLevel="Basic")
+            for i in self.rng.sample(range(len(self.users)), min(logins, len(self.users))):
+                self.users[i][4] = iso(now)
+            self.user_index = {u[0]: i for i, u in enumerate(self.users)}
+            self.original_licenses = [u[2] for u in self.users]
+
+    # Is custom field `ref` filled on work item `i`? Fields have a stable fill rate of 0-100 %,
+    # and only count on work item types that carry them.
+    def filled(self, i, ref):
+        p, wit = self.work_items[i][:2]
+        if ref not in self.processes[self.projects[p]["process"]]["wits"][wit]:
+            return False
+        return zlib.crc32(f"{i}:{ref}".encode()) % 100 < zlib.crc32(ref.encode()) % 101
+
+    def user_descriptor(self, i):
+        return f"aad.{self.users[i][0]}"
+
+    def subject(self, descriptor):
+        if descriptor in self.groups:
+            g = self.groups[descriptor]
+            return {"subjectKind": "group", "descriptor": descriptor, "displayName": g["displayName"],
+                    "principalName": g["principalName"]}
+        i = self.user_index.get(descriptor.split(".", 1)[-1])
+        if i is None:
+            return None
+        email = self.users[i][1]
+        return {"subjectKind": "user", "descriptor": descriptor, "displayName": email.split("@")[0],
+                "principalName": email, "mailAddress": email}
+
+    def project(self, id_or_name):
+        return self.projects_by_id.get(id_or_name) or self.projects_by_name[id_or_name]
+
+    def entitlement(self, i):
+        eid, email, license_name, source, last, created = self.users[i]
+        return {
+            "id": eid,
+            "user": {"principalName": email, "displayName": email.split("@")[0], "descriptor": f"aad.{eid}"},
+            "accessLevel": {"licenseDisplayName": license_name, "licensingSource": source,
+                            "accountLicenseType": license_name.split()[0].lower()},
+            "lastAccessedDate": last,
+            "dateCreated": created,
+        }
+
+    def demote(self, eid):
+        i = self.user_index.get(eid)
+        if i is None:
+            return None
+        with self.lock:
+            previous = self.users[i][2]
+            self.users[i][2] = "Stakeholder"
+            self.log_event("Licensing.Modified", UserIdentifier=self.users[i][1],
+                           PreviousAccessLevel=previous, AccessLevel="Stakeholder")
+        return self.entitlement(i)
+
+
+# --- SERVER ---
+class FakeAdoServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, org, *, latency_ms=0.0, throttle_rate=0.0, retry_after=1.0,
+                 page_size=100, seed=42):
+        super().__init__(address, Handler)
+        self.org = org
+        self.latency_ms = latency_ms
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.page_size = page_size
+        self.rng = random.Random(seed)
+        self.stats = {}
+        self.stats_lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def record(self, method, path, status, nbytes):
+        key = f"{method} {endpoint_template('http://fake' + path).split('/', 1)[1]}"
+        with self.stats_lock:
+            s = self.stats.setdefault(key, {"count": 0, "bytes": 0, "statuses": {}})
+            s["count"] += 1
+            s["bytes"] += nbytes
+            s["statuses"][str(status)] = s["statuses"].get(str(status), 0) + 1
+
+    def snapshot(self):
+        with self.stats_lock:
+            endpoints = json.loads(json.dumps(self.stats))
+        return {"total_calls": sum(s["count"] for s in endpoints.values()), "endpoints": endpoints}
+
+    def reset(self):
+        with self.stats_lock:
+            self.stats = {}
+        self.org.reset()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like ADO
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_PATCH(self):
+        self.dispatch("PATCH")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def dispatch(self, method):
+        parts = urlsplit(self.path)
+        path = unquote(parts.path)
+        params = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        server = self.server
+
+        # control endpoints (not counted)
+        if path == "/_bench/stats":
+            return self.send_json(200, server.snapshot(), record=False)
+        if path == "/_bench/reset" and method == "POST":
+            server.reset()
+            return self.send_json(200, {"reset": True}, record=False)
+        if path == "/_bench/churn" and method == "POST":
+            server.org.churn(**(body or {}))
+            return self.send_json(200, {"users": len(server.org.users)}, record=False)
+
+        if server.latency_ms:
+            time.sleep(server.latency_ms / 1000 * server.rng.uniform(0.5, 1.5))
+        if server.throttle_rate and server.rng.random() < server.throttle_rate:
+            return self.send_json(429, {"message": "throttled (fake)"}, headers={
+                "Retry-After": f"{server.retry_after:g}",
+                "X-RateLimit-Resource": "fake-ado",
+                "X-RateLimit-Remaining": "0",
+                "X-RateLimit-Limit": "200",
+            })
+
+        segments = [s for s in path.split("/") if s]
+        if segments[1:2] == ["_odata"] and segments[3:] == ["WorkItems"] and method == "GET":
+            return self.send_json(*self.odata_work_items(params))
+        if "_apis" not in segments:
+            return self.send_json(404, {"message": f"not found: {path}"})
+        api = segments.index("_apis")
+        project = segments[1] if api == 2 else None
+        route = segments[api + 1:]
+
+        try:
+            status, payload = self.route(method, project, route, params, body)
+        except KeyError as e:
+            status, payload = 404, {"message": f"not found: {e}"}
+        self.send_json(status, payload)
+
+    # --- ROUTES ---
+    def route(self, method, project, route, params, body):
+        org = self.server.org
+
+        if route[:1] == ["userentitlements"]:
+            if method == "PATCH" and len(route) == 2:
+                user = org.demote(route[1])
+                if user is None:
+                    return 404, {"message": f"entitlement {route[1]} not found"}
+                return 200, {"isSuccess": True, "userEntitlement": user}
+            if method == "PATCH":
+                return 200, self.patch_entitlements(body or [])
+            if len(route) == 2:
+                i = org.user_index.get(route[1])
+                if i is None:
+                    return 404, {"message": f"entitlement {route[1]} not found"}
+                return 200, org.entitlement(i)
+            return 200, self.list_entitlements(params)
+
+        if route == ["audit", "auditlog"]:
+            return 200, self.audit_log(params)
+
+        if route == ["graph", "subjectquery"] and method == "POST":
+            query = (body or {}).get("query", "").lower()
+            value = [org.subject(d) for d, g in org.groups.items()
+                     if query in g["displayName"].lower() or query in g["principalName"].lower()]
+            return 200, {"count": len(value), "value": value}
+
+        if route[:2] == ["graph", "Memberships"] and len(route) == 3:
+            group = org.groups.get(route[2])
+            members = group["members"] if group and params.get("direction") == "Down" else []
+            value = [{"containerDescriptor": route[2], "memberDescriptor": m} for m in members]
+            return 200, {"count": len(value), "value": value}
+
+        if route == ["graph", "subjectlookup"] and method == "POST":
+            keys = [k["descriptor"] for k in (body or {}).get("lookupKeys", [])]
+            return 200, {"value": {d: s for d in keys if (s := org.subject(d))}}
+
+        if route == ["wit", "fields"] and project is None:
+            return 200, {"count": len(org.fields), "value": org.fields}
+
+        if route == ["projects"]:
+            value = [{"id": p["id"], "name": p["name"], "state": "wellFormed", "lastUpdateTime": p["lastUpdateTime"]}
+                     for p in org.projects]
+            return 200, {"count": len(value), "value": value}
+
+        if route[:1] == ["projects"] and len(route) == 2:
+            p = org.projects_by_id[route[1]]
+            proc = org.processes[p["process"]]
+            return 200, {"id": p["id"], "name": p["name"], "capabilities": {
+                "processTemplate": {"templateName": proc["name"], "templateTypeId": proc["typeId"]}}}
+
+        if route == ["work", "processes"]:
+            value = []
+            for i, proc in enumerate(org.processes):
+                item = {"typeId": proc["typeId"], "name": proc["name"]}
+                if params.get("$expand") == "projects":
+                    item["projects"] = [{"id": p["id"], "name": p["name"]} for p in org.projects if p["process"] == i]
+                value.append(item)
+            return 200, {"count": len(value), "value": value}
+
+        if route == ["wit", "wiql"] and method == "POST" and project is not None:
+            return 200, self.wiql(project, (body or {}).get("query", ""), params)
+
+        if route == ["wit", "workitemsbatch"] and method == "POST":
+            return 200, self.work_items_batch(body or {})
+
+        if route[:2] == ["wit", "workitemtypes"] and project is not None:
+            wits = org.processes[org.project(project)["process"]]["wits"]
+            if len(route) == 2:
+                value = [{"name": name, "fields": [{"referenceName": r, "name": org.field_names[r]} for r in refs]}
+                         for name, refs in wits.items()]
+                return 200, {"count": len(value), "value": value}
+            if len(route) == 4 and route[3] == "fields":
+                refs = wits[route[2]]
+                return 200, {"count": len(refs), "value": [{"referenceName": r, "name": org.field_names[r]} for r in refs]}
+
+        return 404, {"message": f"unsupported route: {'/'.join(route)}"}
+
+    # preview.2: top/skip paging; otherwise: search endpoint with continuation tokens
+    def list_entitlements(self, params):
+        org = self.server.org
+        total = len(org.users)
+        name = ENTITLEMENT_NAME_FILTER.search(params.get("$filter", ""))
+        if name:
+            members = [org.entitlement(i) for i, u in enumerate(org.users) if name.group(1).replace("''", "'").lower() in u[1]]
+            return {"totalCount": len(members), "members": members, "continuationToken": None}
+        if "top" in params or params.get("api-version", "").endswith("preview.2"):
+            skip = int(params.get("skip", 0))
+            top = int(params.get("top", 100))
+            items = [org.entitlement(i) for i in range(skip, min(total, skip + top))]
+            return {"totalCount": total, "items": items}
+
+        start = int(params.get("continuationToken") or 0)
+        end = min(total, start + self.server.page_size)
+        return {
+            "totalCount": total,
+            "members": [org.entitlement(i) for i in range(start, end)],
+            "continuationToken": str(end) if end < total else None,
+        }
+
+    # startTime/endTime window, batchSize entries per page, continuation token = offset
+    def audit_log(self, params):
+        org = self.server.org
+        start, end = params.get("startTime", ""), params.get("endTime", "9999")
+        entries = [e for e in org.audit if start <= e["timestamp"] < end]
+        offset = int(params.get("continuationToken") or 0)
+        size = int(params.get("batchSize", 200))
+        page = entries[offset:offset + size]
+        more = offset + size < len(entries)
+        return {"decoratedAuditLogEntries": page, "continuationToken": str(offset + size) if more else None,
+                "hasMore": more}
+
+    # Only the WIQL shapes the scripts send: ID paging + optional ChangedDate lower bound
+    def wiql(self, project, query, params):
+        org = self.server.org
+        p = org.projects.index(org.project(project))
+        after = WIQL_AFTER_ID.search(query)
+        since = WIQL_CHANGED_SINCE.search(query)
+        after_id = int(after.group(1)) if after else 0
+        since_dt = datetime.fromisoformat(since.group(1).replace("Z", "+00:00")) if since else None
+        top = int(params.get("$top", 20000))
+
+        ids = []
+        for i in org.project_work_items[p]:
+            if i <= after_id:
+                continue
+            if since_dt and datetime.fromisoformat(org.work_items[i][3].replace("Z", "+00:00")) < since_dt:
+                continue
+            ids.append(i)
+            if len(ids) == top:
+                break
+        return {"queryType": "flat", "workItems": [{"id": i, "url": f"/_apis/wit/workItems/{i}"} for i in ids]}
+
+    # Analytics: only filter(<projects> [and <property> ne null])
+    #            [/compute(iif(<property> ne null, 1, 0) as <alias>, ...)]
+    #            /groupby((Project/ProjectName), aggregate($count as Count[, <alias> with sum as <alias>, ...]))
+    def odata_work_items(self, params):
+        org = self.server.org
+        apply = ODATA_APPLY.fullmatch(params.get("$apply", ""))
+        if not apply:
+            return 400, {"error": {"code": "0", "message": f"unsupported $apply: {params.get('$apply', '')}"}}
+        condition = apply.group("filter")
+
+        projects = ODATA_PROJECTS.search(condition)
+        names = [n.replace("''", "'") for n in re.findall(r"'((?:[^']|'')*)'", projects.group(1))] if projects else \
+            [p["name"] for p in org.projects]
+        not_null = ODATA_NOT_NULL.search(condition)
+        counted = ODATA_IIF.findall(apply.group("compute") or "")
+        for prop in ([not_null.group(1)] if not_null else []) + [prop for prop, _ in counted]:
+            if prop.replace("_", ".", 1) not in org.field_names:
+                return 400, {"error": {"code": "0", "message": f"Could not find a property named '{prop}'"}}
+        ref = not_null.group(1).replace("_", ".", 1) if not_null else None
+
+        value = []
+        for name in names:
+            p = org.projects_by_name.get(name)
+            if p is None:
+                continue
+            ids = [i for i in org.project_work_items[org.projects.index(p)] if not ref or org.filled(i, ref)]
+            if ids:
+                row = {"Project": {"ProjectName": name}, "Count": len(ids)}
+                for prop, alias in counted:
+                    row[alias] = sum(1 for i in ids if org.filled(i, prop.replace("_", ".", 1)))
+                value.append(row)
+        return 200, {"@odata.context": "fake", "value": value}
+
+    def work_items_batch(self, body):
+        org = self.server.org
+        value = []
+        for i in body.get("ids", [])[:200]:
+            item = org.work_items.get(i)
+            if item is None:
+                value.append(None)
+                continue
+            _, wit, state, changed, who = item
+            fields = {"System.Id": i, "System.WorkItemType": wit, "System.State": state,
+                      "System.ChangedDate": changed,
+                      "System.ChangedBy": {"displayName": who.split("@")[0], "uniqueName": who}}
+            wanted = body.get("fields")
+            value.append({"id": i, "fields": {k: v for k, v in fields.items() if not wanted or k in wanted}})
+        return {"count": len(value), "value": value}
+
+    # collection-level JSON Patch, answered synchronously
+    def patch_entitlements(self, ops):
+        results = []
+        for op in ops:
+            eid = op.get("path", "").strip("/").split("/")[0]
+            user = self.server.org.demote(eid)
+            if user is None:
+                results.append({"userId": eid, "isSuccess": False, "errors": [{"key": eid, "value": "not found"}]})
+            else:
+                results.append({"userId": eid, "isSuccess": True, "result": user})
+        return {"id": str(uuid.uuid4()), "status": "succeeded", "isSuccess": all(r["isSuccess"] for r in results),
+                "results": results}
+
+    def send_json(self, status, payload, headers=None, record=True):
+        data = json.dumps(payload).encode("utf-8")
+        etag = '"' + hashlib.sha256(data).hexdigest()[:32] + '"'
+
+        # conditional GETs, as used by ado/response_cache.py
+        if status == 200 and self.command == "GET" and self.headers.get("If-None-Match") == etag:
+            status, data = 304, b""
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        if status in (200, 304):
+            self.send_header("ETag", etag)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+        if record:
+            self.server.record(self.command, urlsplit(self.path).path, status, len(data))
+
+
+def make_server(scale="small", *, users=None, projects=None, wits=None, host="127.0.0.1", port=0, **options):
+    default_users, default_projects, default_wits = SCALES[scale]
+    org = SyntheticOrg(users or default_users, projects or default_projects, wits or default_wits,
+                       seed=options.get("seed", 42))
+    return FakeAdoServer((host, port), org, **options)
+
+
+# --- MAIN ---
+# Standalone server for manual runs, e.g.
+#   python ado/bench/fake_ado.py --scale large --latency-ms 30 --port 8080
+#   ADO_BASE_URL=http://127.0.0.1:8080 ADO_LICENSING_URL=http://127.0.0.1:8080 ADO_ORG=BENCH ADO_PAT=x python ado/get_org_users.py
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the ADO endpoints used by the scripts")
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--users", type=int)
+    parser.add_argument("--projects", type=int)
+    parser.add_argument("--wits", type=int, help="work item types per process")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="mean injected latency per request")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--page-size", type=int, default=100, help="entitlements per continuation page")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+
+    server = make_server(
+        args.scale, users=args.users, projects=args.projects, wits=args.wits, host=args.host, port=args.port,
+        latency_ms=args.latency_ms, throttle_rate=args.throttle_rate, retry_after=args.retry_after,
+        page_size=args.page_size,
+    )
+    org = server.org
+    print(f"::notice::Fake ADO on {server.url}: {len(org.users)} users, {len(org.projects)} projects, "
+          f"{len(org.processes)} processes, {len(org.fields)} fields")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
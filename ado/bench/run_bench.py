@@ -0,0 +1,239 @@
+import argparse
+import csv
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from datetime import datetime, timezone
+from pathlib import Path
+
+from fake_ado import SCALES, make_server
+
+BENCH_DIR = Path(__file__).resolve().parent
+ADO_DIR = BENCH_DIR.parent
+RESULTS_DIR = BENCH_DIR / "results"
+BENCH_ORG = "BENCH"
+
+# step -> (script, extra env, output CSV whose rows count as the step's throughput)
+STEPS = {
+    "users": ("get_org_users.py", {"USERS_FETCH_MODE": "single"}, "users_latest.csv"),
+    "users_stream": ("get_org_users.py", {"USERS_FETCH_MODE": "stream"}, "users_latest.csv"),
+    # audit log since the previous users step applied to its snapshot (only the users it names are re-fetched)
+    "users_incremental": ("get_org_users.py", {"USERS_REFRESH": "incremental"}, "users_latest.csv"),
+    # users scan + exempt group enrichment (Graph), rules written by main()
+    "users_exempt": ("get_org_users.py", {"USERS_FETCH_MODE": "single",
+                                          "DEMOTE_RULES_FILE": str(RESULTS_DIR / "exempt_rules.json")}, "users_latest.csv"),
+    "demote_dry_run": ("demote_org_users.py", {"EXECUTION_MODE": "DRY_RUN"}, "users_with_status.csv"),
+    "demote_all": ("demote_org_users.py", {"EXECUTION_MODE": "DEMOTE_ALL"}, "demotions.csv"),
+    "fields": ("get_org_fields.py", {"FIELDS_CRAWL_MODE": "project", "FIELDS_INCREMENTAL": "0"}, "ado_project_fields.csv"),
+    "fields_process": ("get_org_fields.py", {"FIELDS_CRAWL_MODE": "process", "FIELDS_INCREMENTAL": "0"},
+                       "ado_project_fields.csv"),
+    # incremental mode without a crawl state (= full crawl that leaves the markers), then again on that state
+    "fields_state": ("get_org_fields.py", {"FIELDS_CRAWL_MODE": "project"}, "ado_project_fields.csv"),
+    "fields_incremental": ("get_org_fields.py", {"FIELDS_CRAWL_MODE": "project"}, "ado_project_fields.csv"),
+    "stats": ("get_project_stats.py", {"STATS_FULL_REFRESH": "1"}, "project_workitem_counts.csv"),
+    # runs on the state left by `stats`: WIQL ID lists only, nothing changed to fetch
+    "stats_incremental": ("get_project_stats.py", {}, "project_workitem_counts.csv"),
+}
+DEFAULT_STEPS = "users,users_stream,users_incremental,demote_dry_run,fields,fields_process,fields_state,fields_incremental,stats,stats_incremental"
+
+
+def count_rows(path):
+    if not path.exists():
+        return 0
+    with path.open("r", newline="", encoding="utf-8") as f:
+        return max(0, sum(1 for _ in csv.reader(f)) - 1)
+
+
+def call(server_url, path, method="GET"):
+    req = urllib.request.Request(server_url + path, method=method, data=b"" if method == "POST" else None)
+    with urllib.request.urlopen(req) as resp:
+        return json.loads(resp.read())
+
+
+# --- RUN ONE STEP ---
+# Runs the script as its own process (as in CI) and reaps it with wait4 for its peak RSS.
+def run_step(name, server_url, env, log_dir):
+    script, step_env, output = STEPS[name]
+    before = call(server_url, "/_bench/stats")
+
+    log_file = log_dir / f"{name}.log"
+    t0 = time.monotonic()
+    with log_file.open("w", encoding="utf-8") as log:
+        proc = subprocess.Popen([sys.executable, str(ADO_DIR / script)], env={**env, **step_env},
+                                stdout=log, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+    wall = time.monotonic() - t0
+
+    after = call(server_url, "/_bench/stats")
+    calls = {
+        endpoint: s["count"] - before["endpoints"].get(endpoint, {}).get("count", 0)
+        for endpoint, s in after["endpoints"].items()
+    }
+    calls = {k: v for k, v in sorted(calls.items()) if v}
+    throttled = sum(
+        s["statuses"].get("429", 0) - before["endpoints"].get(k, {}).get("statuses", {}).get("429", 0)
+        for k, s in after["endpoints"].items()
+    )
+
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak_rss_mb = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    rows = count_rows(ADO_DIR / "outputs" / BENCH_ORG / output)
+    total_calls = sum(calls.values())
+
+    return {
+        "step": name,
+        "exit_code": proc.returncode,
+        "wall_seconds": round(wall, 2),
+        "cpu_seconds": round(usage.ru_utime + usage.ru_stime, 2),
+        "peak_rss_mb": round(peak_rss_mb, 1),
+        "rows": rows,
+        "rows_per_second": round(rows / wall, 1) if wall else None,
+        "calls": total_calls,
+        "calls_per_second": round(total_calls / wall, 1) if wall else None,
+        "throttled": throttled,
+        "calls_by_endpoint": calls,
+        "log": str(log_file),
+    }
+
+
+# --- REGRESSION CHECK ---
+# A step regresses when wall time or peak RSS grows by more than `tolerance` vs the baseline run
+def compare(results, baseline, tolerance):
+    base = {r["step"]: r for r in baseline["steps"]}
+    regressions = []
+    for r in results:
+        b = base.get(r["step"])
+        if not b:
+            continue
+        for metric in ("wall_seconds", "peak_rss_mb", "calls"):
+            if b[metric] and r[metric] > b[metric] * (1 + tolerance):
+                regressions.append(f"{r['step']}: {metric} {b[metric]} -> {r[metric]}")
+    return regressions
+
+
+def print_table(results, baseline=None):
+    base = {r["step"]: r for r in (baseline or {}).get("steps", [])}
+    header = ["Step", "Exit", "Wall s", "CPU s", "Peak RSS MB", "Rows", "Rows/s", "Calls", "Calls/s", "429s"]
+    if base:
+        header.append("Wall vs baseline")
+    print("| " + " | ".join(header) + " |")
+    print("|" + "---|" * len(header))
+    for r in results:
+        cells = [r["step"], r["exit_code"], r["wall_seconds"], r["cpu_seconds"], r["peak_rss_mb"], r["rows"],
+                 r["rows_per_second"], r["calls"], r["calls_per_second"], r["throttled"]]
+        if base:
+            b = base.get(r["step"])
+            cells.append(f"{(r['wall_seconds'] / b['wall_seconds'] - 1) * 100:+.0f}%" if b and b["wall_seconds"] else "")
+        print("| " + " | ".join(str(c) for c in cells) + " |")
+
+
+# --- MAIN ---
+# e.g.
+#   python ado/bench/run_bench.py --scale large --latency-ms 20
+#   python ado/bench/run_bench.py --steps users_stream,fields --baseline ado/bench/results/baseline.json
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ADO scripts against a local fake org")
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--users", type=int)
+    parser.add_argument("--projects", type=int)
+    parser.add_argument("--wits", type=int, help="work item types per process")
+    parser.add_argument("--steps", default=DEFAULT_STEPS, help=f"comma separated, from: {', '.join(STEPS)}")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--max-rps", type=float, default=1000.0, help="ADO_MAX_RPS for the scripts")
+    parser.add_argument("--http-cache", action="store_true", help="keep the field crawl's HTTP cache on")
+    parser.add_argument("--out", type=Path, default=RESULTS_DIR / "latest.json")
+    parser.add_argument("--baseline", type=Path, help="previous result JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed growth vs baseline (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    steps = [s.strip() for s in args.steps.split(",") if s.strip()]
+    unknown = [s for s in steps if s not in STEPS]
+    if unknown:
+        parser.error(f"unknown step(s): {', '.join(unknown)}")
+
+    baseline = None
+    if args.baseline:
+        with args.baseline.open("r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    t0 = time.monotonic()
+    server = make_server(
+        args.scale, users=args.users, projects=args.projects, wits=args.wits,
+        latency_ms=args.latency_ms, throttle_rate=args.throttle_rate, retry_after=args.retry_after,
+    )
+    org = server.org
+    print(f"::notice::Synthetic org: {len(org.users)} users, {len(org.projects)} projects, "
+          f"{len(org.processes)} processes, {len(org.fields)} fields (built in {time.monotonic() - t0:.1f}s)")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    # fresh outputs for the bench org, so no step reuses a previous run's files
+    output_dir = ADO_DIR / "outputs" / BENCH_ORG
+    shutil.rmtree(output_dir, ignore_errors=True)
+    output_dir.mkdir(parents=True)
+    RESULTS_DIR.mkdir(exist_ok=True)
+    with (RESULTS_DIR / "exempt_rules.json").open("w", encoding="utf-8") as f:
+        json.dump({"exempt_groups": ["License Keepers"]}, f)
+
+    env = {
+        **os.environ,
+        "ADO_ORG": BENCH_ORG,
+        "ADO_PAT": "bench",
+        "ADO_BASE_URL": server.url,
+        "ADO_LICENSING_URL": server.url,
+        "ADO_ANALYTICS_URL": server.url,
+        "ADO_GRAPH_URL": server.url,
+        "ADO_AUDIT_URL": server.url,
+        "ADO_MAX_RPS": str(args.max_rps),
+        "ADO_HTTP_CACHE": "1" if args.http_cache else "0",
+        "PYTHONUNBUFFERED": "1",
+    }
+    env.pop("GITHUB_STEP_SUMMARY", None)
+
+    results = []
+    for name in steps:
+        print(f"→ {name} ...")
+        result = run_step(name, server.url, env, RESULTS_DIR)
+        results.append(result)
+        if result["exit_code"] != 0:
+            print(f"::error::{name} exited with {result['exit_code']} (log: {result['log']})")
+
+    server.shutdown()
+
+    print()
+    print_table(results, baseline)
+
+    report = {
+        "finished": datetime.now(timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z"),
+        "python": sys.version.split()[0],
+        "org": {"users": len(org.users), "projects": len(org.projects), "processes": len(org.processes),
+                "fields": len(org.fields)},
+        "options": {"latency_ms": args.latency_ms, "throttle_rate": args.throttle_rate, "max_rps": args.max_rps,
+                    "http_cache": args.http_cache},
+        "steps": results,
+    }
+    with args.out.open("w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1)
+    print(f"\n::notice::Results written to {args.out}")
+
+    failed = [r["step"] for r in results if r["exit_code"] != 0]
+    regressions = []
+    if baseline and baseline.get("org") != report["org"]:
+        print(f"::warning::Baseline was run on a different org size ({baseline.get('org')}), not comparing")
+    elif baseline:
+        regressions = compare(results, baseline, args.tolerance)
+    for line in regressions:
+        print(f"::error::Regression (> {args.tolerance:.0%}) {line}")
+    if failed or regressions:
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from hashing import file_sha256
+
+# stage outcomes (failures are "exit <code>" / "error: ...")
+OK = "ok"
+UNCHANGED = "unchanged"
+BLOCKED = "blocked"
+
+STATE_VERSION = 1
+
+
+# --- STAGE ---
+# One unit of work: run() reads `inputs` and writes `outputs` (paths). `params` are settings that change
+# the result (e.g. the Excel mode). Stages that read from ADO (always=True) run every time; their
+# outputs still feed the skip decision of the stages after them.
+class Stage:
+    def __init__(self, name, run, *, inputs=(), outputs=(), params=None, after=(), always=False):
+        self.name = name
+        self.run = run
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.params = params or {}
+        self.after = set(after)
+        self.always = always
+
+
+# --- DAG ---
+# Stages wired by the files they share (a stage runs after the stage producing one of its inputs)
+# plus explicit `after`. A stage is skipped when the content hashes of its inputs and params match
+# its last successful run and its outputs are still the files it wrote then; mtimes play no part,
+# so a fresh git checkout in CI doesn't make everything look new (or old).
+# Hashes live in <state_dir>/.dag_<name>.json. Independent stages run side by side.
+class Dag:
+    def __init__(self, name, state_dir):
+        self.state_path = state_dir / f".dag_{name}.json"
+        self.stages = {}
+        self.seconds = {}  # wall time per stage of the last run()
+        self.lock = threading.Lock()
+        self.state = {}
+        if self.state_path.exists():
+            try:
+                with self.state_path.open("r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("version") == STATE_VERSION:
+                    self.state = data.get("stages", {})
+            except json.JSONDecodeError:
+                pass
+
+    def add(self, name, run, **options):
+        self.stages[name] = Stage(name, run, **options)
+
+    def dependencies(self, stage):
+        producers = {str(p): s.name for s in self.stages.values() for p in s.outputs}
+        deps = set(stage.after) | {producers[str(p)] for p in stage.inputs if str(p) in producers}
+        deps.discard(stage.name)
+        return deps
+
+    # path -> sha256 (None when missing), keyed relative to the state file
+    def hashes(self, paths):
+        return {
+            os.path.relpath(p, self.state_path.parent): file_sha256(p) if p.exists() else None
+            for p in paths
+        }
+
+    def fingerprint(self, stage):
+        return {"inputs": self.hashes(stage.inputs), "params": json.loads(json.dumps(stage.params, sort_keys=True, default=str))}
+
+    def run_stage(self, stage):
+        fingerprint = self.fingerprint(stage)
+        previous = self.state.get(stage.name)
+        if (
+            not stage.always
+            and previous
+            and previous["fingerprint"] == fingerprint
+            and all(previous["outputs"].get(k) == v and v is not None for k, v in self.hashes(stage.outputs).items())
+        ):
+            print(f"::notice::[{stage.name}] inputs unchanged, skipped")
+            return UNCHANGED
+
+        print(f"\n=== {stage.name} ===")
+        t0 = time.monotonic()
+        try:
+            stage.run()
+        except SystemExit as e:
+            if e.code not in (None, 0):
+                return f"exit {e.code}"
+        except Exception as e:
+            print(f"::error::{stage.name} failed: {e!r}")
+            return f"error: {e!r}"
+        finally:
+            self.seconds[stage.name] = round(time.monotonic() - t0, 1)
+
+        with self.lock:
+            self.state[stage.name] = {"fingerprint": fingerprint, "outputs": self.hashes(stage.outputs)}
+        return OK
+
+    # Runs `only` (default: all stages) in dependency order, up to `workers` at a time.
+    # Stages after a failed one are not run (BLOCKED). Returns {stage name: outcome}.
+    def run(self, only=None, workers=None):
+        names = list(only or self.stages)
+        pending = {n: self.dependencies(self.stages[n]) & set(names) for n in names}
+        results = {}
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=workers or len(names) or 1) as pool:
+            while pending or running:
+                ready = [n for n, deps in pending.items() if deps <= results.keys()]
+                for name in ready:
+                    deps = pending.pop(name)
+                    if any(results[d] not in (OK, UNCHANGED) for d in deps):
+                        results[name] = BLOCKED
+                        print(f"::warning::[{name}] not run, a stage it depends on failed")
+                    else:
+                        running[pool.submit(self.run_stage, self.stages[name])] = name
+                if ready and not running:
+                    continue  # only blocked stages this round, re-check the rest
+                if not running:
+                    raise RuntimeError(f"Stages depend on each other in a cycle: {', '.join(pending)}")
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)] = future.result()
+
+        self.save()
+        return results
+
+    def save(self):
+        partial = self.state_path.with_name(self.state_path.name + ".partial")
+        with partial.open("w", encoding="utf-8") as f:
+            json.dump({"version": STATE_VERSION, "stages": self.state}, f, indent=1, sort_keys=True)
+        partial.replace(self.state_path)
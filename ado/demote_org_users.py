@@ -1,57 +1,67 @@
-import requests
-import base64
 import os
-import pandas as pd
 from datetime import datetime, timezone
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import json 
+import csv
+import hashlib
+import time
+
+from ado_client import AdoClient, licensing_url
+from demotion_rules import load_rules, evaluate, rules_sha256, threshold_for, REASON_GONE, REASON_GRACE
+from user_changes import load_changes
+from group_exemptions import load_exemptions
+from hashing import file_sha256
+from metrics import Metrics
+from user_snapshot import by_inactivity, canonical, read_snapshot, scanned_at, with_days_inactive
 
-
-# --- CONFIG ---
-ADO_ORG = os.getenv("ADO_ORG")
-ADO_PAT = os.getenv("ADO_PAT")
-GITHUB_RUN_ID = os.getenv("GITHUB_RUN_ID","local")
-GITHUB_SHA = os.getenv("GITHUB_SHA","local")
-
-if not ADO_ORG or not ADO_PAT:
-    print("::error:: Environment variables ADO_ORG_URL or ADO_PAT are missing.")
-    exit(1)
-
-EXECUTION_MODE = os.getenv("EXECUTION_MODE", "DRY_RUN") # Options: DRY_RUN, DEMOTE_ONE, DEMOTE_ALL
-threshold_str = os.getenv("DEMOTE_THRESHOLD_DAYS", "90")
-try:
-    THRESHOLD_DAYS = int(threshold_str)
-except ValueError:
-    print(f"::error::Invalid DEMOTE_THRESHOLD_DAYS: {threshold_str}")
-    exit(1)
-
-# --- AUTH / LICENSING ORG URL ---
-encoded_pat = base64.b64encode(f":{ADO_PAT}".encode()).decode()
-LICENSING_ORG_URL = f"https://vsaex.dev.azure.com/{ADO_ORG}"
-
-
-# --- LOAD CSV ---
 BASE_DIR = Path(__file__).resolve().parent
-output_dir = BASE_DIR / "outputs" / ADO_ORG
 
-input_csv = output_dir / "users_latest.csv"
-output_csv = output_dir / "users_with_status.csv"
 
-# --- LOGS ---
-demotions_log = output_dir / "demotions_APPEND_ONLY.log"
-demotions_csv = output_dir / "demotions.csv"
+# --- RUN CONTEXT ---
+# Everything one demotion run works with: client, rules, mode and the files under outputs/<ORG>
+class DemoteRun:
+    def __init__(self, org, pat, *, mode="DRY_RUN", threshold_days=90, rules_file=None,
+                 batch_size=20, workers=4, gh_run_id="local", gh_sha="local", metrics=None):
+        self.org = org
+        self.mode = mode
+        self.threshold_days = threshold_days
+        self.batch_size = batch_size  # DEMOTE_ALL: users per collection-level PATCH
+        self.workers = workers        # ...and PATCHes in flight at once
+        self.gh_run_id = gh_run_id
+        self.gh_sha = gh_sha
+
+        # --- CLIENT / LICENSING ORG URL ---
+        self.metrics = metrics or Metrics("demote")
+        self.client = AdoClient(pat, metrics=self.metrics)
+        self.licensing_url = licensing_url(org)
+
+        # --- RULES ---
+        # Declarative eligibility policy (see README); threshold_days overrides its default threshold
+        self.rules_file = rules_file or BASE_DIR / "demotion_rules.json"
+        self.rules = load_rules(self.rules_file, threshold_days)
+
+        # --- CSVs ---
+        self.output_dir = BASE_DIR / "outputs" / org
+        self.input_csv = self.output_dir / "users_latest.csv"
+        self.output_csv = self.output_dir / "users_with_status.csv"
+        self.changes_json = self.output_dir / "users_changes.json"           # written by get_org_users.py
+        self.exemptions_json = self.output_dir / "users_exemptions.json"     # ...as is this (exempt_groups)
+        self.status_meta = self.output_dir / "users_with_status.meta.json"   # which snapshot + rules the status was built from
+
+        # --- LOGS ---
+        self.demotions_log = self.output_dir / "demotions_APPEND_ONLY.log"
+        self.demotions_csv = self.output_dir / "demotions.csv"
+        self.demotions_checkpoint = self.output_dir / "demotions.checkpoint.json"  # log offset already in demotions.csv
 
 
-if not input_csv.exists():
-    print(f"::error:: Input CSV not found: {input_csv}")
-    exit(1)
-
 # --- FUNCTIONS ---
 
 # Append a single demotion event as line-delimited JSON to demotions.log
-def append_demotion_event(*, org, entitlement_id, email, old_license, new_license,
+def append_demotion_event(log_path, *, org, entitlement_id, email, old_license, new_license,
                           days_inactive, threshold_days, source, mode,
                           gh_run_id, gh_sha):
+    import pandas as pd
 
     ts = datetime.now(timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z")
     event = {
@@ -69,110 +79,277 @@ def append_demotion_event(*, org, entitlement_id, email, old_license, new_licens
         "ghSha": gh_sha,
     }
 
-    demotions_log.parent.mkdir(parents=True, exist_ok=True)
-    with demotions_log.open("a", encoding="utf-8") as f:
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    with log_path.open("a", encoding="utf-8") as f:
         f.write(json.dumps(event, ensure_ascii=False) + "\n")
 
 
-# Rebuild demotions.csv from demotions.log, sorted by newest first
-def rebuild_demotions_csv():
+# demotions.csv column <- log event key
+DEMOTIONS_CSV_COLUMNS = {
+    "TimestampUtc": "ts",
+    "Org": "org",
+    "Email": "email",
+    "UserEntitlementId": "userEntitlementId",
+    "OldLicense": "oldLicense",
+    "NewLicense": "newLicense",
+    "DaysInactive": "daysInactive",
+    "ThresholdDays": "thresholdDays",
+    "Source": "source",
+    "Mode": "mode",
+    "GitHubRunId": "ghRunId",
+    "CommitSha": "ghSha",
+}
+
+# bytes before the checkpoint offset that must still match (detects a rewritten log)
+CHECKPOINT_TAIL_BYTES = 4096
+
+
+def log_tail_sha256(run, offset):
+    with run.demotions_log.open("rb") as f:
+        start = max(0, offset - CHECKPOINT_TAIL_BYTES)
+        f.seek(start)
+        return hashlib.sha256(f.read(offset - start)).hexdigest()
+
+
+def write_demotions_checkpoint(run, offset):
+    with run.demotions_checkpoint.open("w", encoding="utf-8") as f:
+        json.dump({"offset": offset, "tail_sha256": log_tail_sha256(run, offset)}, f, indent=1)
+
+
+# Offset of the first log byte not yet in demotions.csv, or None if the checkpoint can't be trusted
+def load_demotions_checkpoint(run):
+    if not run.demotions_checkpoint.exists() or not run.demotions_csv.exists():
+        return None
+    try:
+        with run.demotions_checkpoint.open("r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+        offset = int(checkpoint["offset"])
+    except (json.JSONDecodeError, KeyError, TypeError, ValueError):
+        return None
+
+    if offset > run.demotions_log.stat().st_size or log_tail_sha256(run, offset) != checkpoint.get("tail_sha256"):
+        return None
+    return offset
+
+
+# Log events of the whole lines in raw (bad lines are ignored)
+def parse_events(raw):
+    events = []
+    for line in raw.decode("utf-8").splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            events.append(json.loads(line))
+        except json.JSONDecodeError:
+            # ignore bad lines
+            continue
+    return events
+
+
+# demotions.csv rows of the events, newest first (same timestamp: later log line first).
+# Full rebuild and incremental prepend both write through here, so they produce the same bytes.
+def write_demotion_rows(f, events):
+    writer = csv.writer(f, lineterminator="\n")
+    ordered = sorted(enumerate(events), key=lambda ie: (ie[1].get("ts", ""), ie[0]), reverse=True)
+    writer.writerows([e.get(key, "") for key in DEMOTIONS_CSV_COLUMNS.values()] for _, e in ordered)
+
+
+# Rebuild demotions.csv from demotions.log, sorted by newest first.
+# Incremental: parse only the lines appended since the checkpoint and prepend them;
+# full rebuild only when the checkpoint is missing or no longer matches the log.
+def rebuild_demotions_csv(run):
+
+    if not run.demotions_log.exists():
+        return
+
+    offset = load_demotions_checkpoint(run)
+    if offset is None:
+        rebuild_demotions_csv_full(run)
+        return
+
+    # only whole lines; a line still being written is picked up next time
+    with run.demotions_log.open("rb") as f:
+        f.seek(offset)
+        chunk = f.read()
+    complete = chunk[:chunk.rfind(b"\n") + 1]
+    if not complete:
+        return
+
+    events = parse_events(complete)
+
+    with run.demotions_csv.open("r", encoding="utf-8", newline="") as f:
+        header = f.readline()
+        existing = f.read()
+
+    # newest first, above the rows already in the CSV
+    tmp = run.demotions_csv.with_name(run.demotions_csv.name + ".tmp")
+    with tmp.open("w", encoding="utf-8", newline="") as f:
+        f.write(header)
+        write_demotion_rows(f, events)
+        f.write(existing)
+    tmp.replace(run.demotions_csv)
+
+    write_demotions_checkpoint(run, offset + len(complete))
+    print(f"::notice::Prepended {len(events)} new demotion(s) to {run.demotions_csv.name}.")
+
+
+# Full rebuild: parse the whole log
+def rebuild_demotions_csv_full(run):
+
+    with run.demotions_log.open("rb") as f:
+        raw = f.read()
+    complete = raw[:raw.rfind(b"\n") + 1]
 
-    if not demotions_log.exists():
+    events = parse_events(complete)
+    if not events:
         return
 
-    rows = []
-    with demotions_log.open("r", encoding="utf-8") as f:
+    tmp = run.demotions_csv.with_name(run.demotions_csv.name + ".tmp")
+    with tmp.open("w", encoding="utf-8", newline="") as f:
+        csv.writer(f, lineterminator="\n").writerow(DEMOTIONS_CSV_COLUMNS)
+        write_demotion_rows(f, events)
+    tmp.replace(run.demotions_csv)
+
+    write_demotions_checkpoint(run, len(complete))
+    print(f"::notice::Rebuilt {run.demotions_csv.name} from the full log ({len(events)} demotions).")
+
+
+# Entitlement IDs logged as demoted since the snapshot was scanned (lets DEMOTE_ALL resume after a crash).
+# Older entries don't count: a user demoted back then may have been re-licensed and gone inactive again.
+# Unknown scan time -> nothing is skipped (the PATCH is idempotent, a repeat only costs a call).
+def load_demoted_ids(run):
+    ids = set()
+    since = scanned_at(run.input_csv)
+    if not run.demotions_log.exists() or since is None:
+        return ids
+
+    with run.demotions_log.open("r", encoding="utf-8") as f:
         for line in f:
             line = line.strip()
             if not line:
                 continue
             try:
-                rows.append(json.loads(line))
+                event = json.loads(line)
             except json.JSONDecodeError:
-                # ignore bad lines
                 continue
+            try:
+                ts = datetime.fromisoformat(str(event.get("ts")).replace("Z", "+00:00"))
+            except ValueError:
+                continue
+            if ts >= since and str(event.get("newLicense", "")).lower() == "stakeholder":
+                ids.add(str(event.get("userEntitlementId")))
+    return ids
+
+
+# IDs to re-evaluate if the changefeed applies to the existing status CSV, else None.
+# It applies only when the status was built from exactly the changefeed's base snapshot
+# with the same rules and group exemptions, and the scan judged threshold crossings with these
+# rules too; anything else (first run, rules edit, skipped scan, group membership change, scan
+# and demotion step configured with different thresholds) means full rebuild.
+def changed_ids_since_status(run, snapshot_sha, exemptions_sha):
+    changes = load_changes(run.changes_json)
+    if not changes or not run.output_csv.exists() or not run.status_meta.exists():
+        return None
+
+    with run.status_meta.open("r", encoding="utf-8") as f:
+        meta = json.load(f)
+
+    if changes.get("snapshot_sha256") != snapshot_sha or changes.get("rules_sha256") != rules_sha256(run.rules):
+        return None
+    if meta.get("snapshot_sha256") != changes.get("base_sha256") or meta.get("rules_sha256") != rules_sha256(run.rules):
+        return None
+    if meta.get("exemptions_sha256") != exemptions_sha:
+        return None
+
+    return {str(c["UserEntitlementId"]) for c in changes.get("changes", [])}
+
+
+# Was users_with_status.csv built from exactly the current snapshot, rules and group exemptions?
+# Decided on content hashes (users_with_status.meta.json), not mtimes: after a git checkout in CI
+# every file looks equally new.
+def status_up_to_date(run):
+    if not run.output_csv.exists() or not run.status_meta.exists():
+        return False
+
+    with run.status_meta.open("r", encoding="utf-8") as f:
+        meta = json.load(f)
+
+    exemptions_sha = file_sha256(run.exemptions_json) if run.rules["exempt_groups"] and run.exemptions_json.exists() else None
+    return (
+        meta.get("snapshot_sha256") == file_sha256(run.input_csv)
+        and meta.get("rules_sha256") == rules_sha256(run.rules)
+        and meta.get("exemptions_sha256") == exemptions_sha
+    )
 
-    if not rows:
-        return
-
-    df_log = pd.DataFrame(rows)
-    # Map to human-facing columns
-    df_log["TimestampUtc"] = df_log["ts"]
-    df_log["Org"] = df_log.get("org", "")
-    df_log["Email"] = df_log.get("email", "")
-    df_log["UserEntitlementId"] = df_log.get("userEntitlementId", "")
-    df_log["OldLicense"] = df_log.get("oldLicense", "")
-    df_log["NewLicense"] = df_log.get("newLicense", "")
-    df_log["DaysInactive"] = df_log.get("daysInactive", "")
-    df_log["ThresholdDays"] = df_log.get("thresholdDays", "")
-    df_log["Source"] = df_log.get("source", "")
-    df_log["Mode"] = df_log.get("mode", "")
-    df_log["GitHubRunId"] = df_log.get("ghRunId", "")
-    df_log["CommitSha"] = df_log.get("ghSha", "")
-
-    cols = [
-        "TimestampUtc",
-        "Org",
-        "Email",
-        "UserEntitlementId",
-        "OldLicense",
-        "NewLicense",
-        "DaysInactive",
-        "ThresholdDays",
-        "Source",
-        "Mode",
-        "GitHubRunId",
-        "CommitSha",
-    ]
-
-    df_log = df_log.sort_values(by="TimestampUtc", ascending=False)
-    df_log[cols].to_csv(demotions_csv, index=False)
 
+# users_with_status.csv: snapshot columns + flags in canonical order (by UserEntitlementId), like
+# users_latest.csv, so a nightly rebuild only shows users whose flags actually changed
+def write_status(run, df_status):
+    canonical(df_status).to_csv(run.output_csv, index=False)
 
-# Rebuild users_with_status.csv from users_latest.csv
-def analyze_and_flag():
-    print(f"::notice::Rebuilding status from latest snapshot for org {ADO_ORG} (threshold {THRESHOLD_DAYS} days).")
-    print(f"::notice::Input CSV: {input_csv}")
 
-    df = pd.read_csv(input_csv)
+# Rebuild users_with_status.csv from users_latest.csv.
+# snapshot: the same table already in memory (e.g. handed over by the users scan), saves re-reading the CSV
+def analyze_and_flag(run, snapshot=None):
+    import pandas as pd
 
-    # Ensure Demotion_Status column exists (fresh)
-    if 'Demotion_Status' not in df.columns:
-        df['Demotion_Status'] = ''
-    else:
-        # We intentionally discard old statuses on rebuild
-        df['Demotion_Status'] = ''
+    print(f"::notice::Rebuilding status from latest snapshot for org {run.org} (threshold {run.threshold_days} days).")
+    print(f"::notice::Input CSV: {run.input_csv}")
 
+    # Days Inactive as of the scan that produced the snapshot
+    df = snapshot.copy() if snapshot is not None else read_snapshot(run.input_csv)
     total = len(df)
-    demote_count = 0
+    snapshot_sha = file_sha256(run.input_csv)
+
+    # members of the exempt groups, resolved by the users scan
+    group_members = load_exemptions(run.exemptions_json, run.rules["exempt_groups"])
+    exemptions_sha = file_sha256(run.exemptions_json) if run.rules["exempt_groups"] else None
 
-    print(f"::notice:: Marking candidates (Threshold: {THRESHOLD_DAYS} days)...")
+    print(f"::notice:: Marking candidates (rules: {run.rules_file.name}, default threshold: {run.rules['threshold_days']} days)...")
 
-    for index, row in df.iterrows():
-        days_inactive = row.get('Days Inactive', 0)
-        license_type = row.get('License', '')
-        source = row.get('Source', '')
+    changed_ids = changed_ids_since_status(run, snapshot_sha, exemptions_sha)
 
-        # Must be inactive long enough, NOT already free, NOT paid MSDN
-        should_demote = (
-            source == "account"
-            and "stakeholder" not in license_type.lower()
-            and days_inactive >= THRESHOLD_DAYS
+    if changed_ids is None:
+        # We intentionally discard old statuses on full rebuild
+        # Vectorized policy: one boolean mask per rule, first matching reason wins
+        df['Demotion_Status'], df['Demotion_Reason'] = evaluate(df, run.rules, group_members=group_members)
+    else:
+        # Incremental: carry statuses over and re-evaluate only what the changefeed touched,
+        # plus users in their grace period (that rule depends on the calendar, not the snapshot)
+        prev = pd.read_csv(run.output_csv, dtype={'UserEntitlementId': str})
+        prev = prev.set_index('UserEntitlementId')[['Demotion_Status', 'Demotion_Reason']]
+        df = df.join(prev, on='UserEntitlementId')
+        df['Demotion_Status'] = df['Demotion_Status'].fillna('')
+
+        recheck = (
+            df['UserEntitlementId'].astype(str).isin(changed_ids)
+            | df['Demotion_Reason'].isna()
+            | (df['Demotion_Reason'] == REASON_GRACE)
         )
+        print(f"::notice::Changefeed applies – re-evaluating {int(recheck.sum())} of {total} users.")
 
-        if should_demote:
-            df.at[index, 'Demotion_Status'] = 'Demote'
-            demote_count += 1
+        status, reason = evaluate(df[recheck], run.rules, group_members=group_members)
+        df.loc[recheck, 'Demotion_Status'] = status
+        df.loc[recheck, 'Demotion_Reason'] = reason
 
-    # Sort: Highest inactivity at top
-    df = df.sort_values(by='Days Inactive', ascending=False)
+    demote_count = int((df['Demotion_Status'] == 'Demote').sum())
 
-    # save new CSV
-    df.to_csv(output_csv, index=False)
+    for reason, count in df['Demotion_Reason'].value_counts().items():
+        print(f"  {reason}: {count}")
+
+    # Report order: highest inactivity at top (the CSV itself is stored in canonical order)
+    df = by_inactivity(df)
+
+    # save new CSV (+ what it was built from, for the next incremental run)
+    write_status(run, df)
+    with run.status_meta.open("w", encoding="utf-8") as f:
+        json.dump({"snapshot_sha256": snapshot_sha, "rules_sha256": rules_sha256(run.rules),
+                   "exemptions_sha256": exemptions_sha}, f, indent=1)
 
     print(f"::notice::Total users in CSV: {total}")
     print(f"::notice::Users flagged as demote candidates: {demote_count}")
-    print(f"::notice::Output saved to: {output_csv}")
+    print(f"::notice::Output saved to: {run.output_csv}")
 
     # Return status + candidates
     df_status = df
@@ -182,6 +359,7 @@ def analyze_and_flag():
 
 # Print a full list of candidates without changing anything.
 def demote_dry_run(df_status, candidates):
+    import pandas as pd
 
     candidate_count = len(candidates)
     print(f"::notice::[DRY RUN] Found {candidate_count} candidates flaggd for demotion.")
@@ -193,17 +371,76 @@ def demote_dry_run(df_status, candidates):
     pd.set_option('display.width', 1000)
     
     # Print clean table
-    cols_to_show = ['Email', 'Days Inactive', 'License', 'Last Login']
+    cols_to_show = ['Email', 'Days Inactive', 'License', 'Last Login', 'Demotion_Reason']
     print(candidates[cols_to_show].to_string(index=False))
 
 
+# --- FRESHNESS CHECK ---
+# Re-read candidates from ADO right before their PATCH and evaluate the rules on that: the snapshot
+# may be hours old, and after an incremental users refresh Last Login of users without licensing
+# events lags until the next full resync. Returns (eligible IDs, {ID: reason no longer a candidate},
+# {ID: error}); users that couldn't be re-read are not demoted.
+def recheck_candidates(run, entitlement_ids):
+    from get_org_users import entitlements_to_frame, fetch_entitlement
+
+    def fetch(entitlement_id):
+        try:
+            return entitlement_id, fetch_entitlement(run.client, run.licensing_url, entitlement_id), None
+        except Exception as e:
+            return entitlement_id, None, f"re-check failed: {e!r}"
+
+    with run.metrics.stage("recheck"), ThreadPoolExecutor(max_workers=run.workers) as pool:
+        fetched = list(pool.map(fetch, entitlement_ids))
+
+    errors = {eid: error for eid, _, error in fetched if error}
+    skipped = {eid: REASON_GONE for eid, item, error in fetched if item is None and not error}
+    items = [item for _, item, _ in fetched if item is not None]
+    if not items:
+        return set(), skipped, errors
+
+    fresh = with_days_inactive(entitlements_to_frame(items), datetime.now(timezone.utc))
+    group_members = load_exemptions(run.exemptions_json, run.rules["exempt_groups"])
+    status, reason = evaluate(fresh, run.rules, group_members=group_members)
+    ids = fresh["UserEntitlementId"].astype(str)
+    eligible = set(ids[status == "Demote"])
+    skipped.update(zip(ids[status != "Demote"], reason[status != "Demote"]))
+    return eligible, skipped, errors
+
+
+# Candidates that are no longer eligible keep no "Demote" flag in the status CSV
+def clear_flags(df_status, skipped):
+    for entitlement_id, reason in skipped.items():
+        print(f"::notice::Skipping {entitlement_id}: no longer a candidate in ADO ({reason})")
+        row = df_status['UserEntitlementId'].astype(str) == entitlement_id
+        df_status.loc[row, 'Demotion_Status'] = ''
+        df_status.loc[row, 'Demotion_Reason'] = reason
+
+
 # Demote the top candidate (longest inactive) and update status + audit logs
-def demote_one(df_status, candidates):
+def demote_one(run, df_status, candidates):
+    import pandas as pd
+
     candidate_count = len(candidates)
     print(f"::notice::[DEMOTE ONE] Processing the first candidate out of {candidate_count}...")
 
-    # Take the most inactive candidate (df was already sorted when creating users_with_status.csv)
-    candidate = candidates.iloc[0]
+    # Take the most inactive candidate that is still one in ADO
+    # (load_status hands the table over sorted by inactivity)
+    candidate = None
+    for _, row in candidates.iterrows():
+        if pd.isna(row['UserEntitlementId']) or not str(row['UserEntitlementId']).strip():
+            candidate = row  # fails below
+            break
+        eligible, skipped, errors = recheck_candidates(run, [str(row['UserEntitlementId'])])
+        if errors:
+            raise RuntimeError(f"Could not re-check {row['Email']} before demoting: {errors}")
+        clear_flags(df_status, skipped)
+        if eligible:
+            candidate = row
+            break
+    if candidate is None:
+        write_status(run, df_status)
+        print("::notice::No candidate is still eligible in ADO; status CSV updated.")
+        return
 
     entitlement_id = candidate.get('UserEntitlementId')
     email = candidate.get('Email')
@@ -212,8 +449,7 @@ def demote_one(df_status, candidates):
     source = candidate.get('Source', '')
 
     if pd.isna(entitlement_id) or not str(entitlement_id).strip():
-        print(f"::error:: Candidate {email} has no UserEntitlementId in CSV. Aborting.")
-        exit(1)
+        raise RuntimeError(f"Candidate {email} has no UserEntitlementId in CSV. Aborting.")
 
     print(f"::notice::Will demote user:")
     print(f"  Email          : {email}")
@@ -221,11 +457,7 @@ def demote_one(df_status, candidates):
     print(f"  Current license: {current_license}")
     print(f"  Days inactive  : {days_inactive}")
 
-    url = f"{LICENSING_ORG_URL}/_apis/userentitlements/{entitlement_id}?api-version=7.1-preview.3"
-    headers = {
-        'Authorization': f'Basic {encoded_pat}',
-        'Content-Type': 'application/json-patch+json'
-    }
+    url = f"{run.licensing_url}/_apis/userentitlements/{entitlement_id}?api-version=7.1-preview.3"
     payload = [
         {
             "op": "replace",
@@ -237,15 +469,12 @@ def demote_one(df_status, candidates):
     ]
 
     try:
-        resp = requests.patch(url, headers=headers, json=payload)
+        resp = run.client.patch(url, payload)
     except Exception as e:
-        print(f"::error::HTTP error while calling ADO: {e}")
-        exit(1)
+        raise RuntimeError(f"HTTP error while calling ADO: {e}") from e
 
     if resp.status_code not in (200, 201):
-        print(f"::error::Failed to demote user. Status: {resp.status_code}")
-        print(f"::error::Response: {resp.text}")
-        exit(1)
+        raise RuntimeError(f"Failed to demote user. Status: {resp.status_code}. Response: {resp.text}")
 
     # Response body shape is flaky; we know what we set it to.
     _updated = resp.json()
@@ -256,63 +485,267 @@ def demote_one(df_status, candidates):
 
     # 1) Append to append-only demotions.log
     append_demotion_event(
-        org=ADO_ORG,
+        run.demotions_log,
+        org=run.org,
         entitlement_id=entitlement_id,
         email=email,
         old_license=current_license,
         new_license=new_license,
         days_inactive=days_inactive,
-        threshold_days=THRESHOLD_DAYS,
+        threshold_days=threshold_for(current_license, run.rules),
         source=source,
-        mode=EXECUTION_MODE,
-        gh_run_id=GITHUB_RUN_ID,
-        gh_sha=GITHUB_SHA,
+        mode=run.mode,
+        gh_run_id=run.gh_run_id,
+        gh_sha=run.gh_sha,
     )
 
     # 2) Rebuild demotions.csv for humans
-    rebuild_demotions_csv()
+    rebuild_demotions_csv(run)
 
     # 3) Mark this user as demoted in the status CSV (so we don't try again)
     df_status.loc[
         df_status['UserEntitlementId'].astype(str) == str(entitlement_id),
         'Demotion_Status'
     ] = 'Demote DONE'
-    df_status.to_csv(output_csv, index=False)
-    print(f"::notice::Status CSV updated ({output_csv}).")
-    print(f"::notice::Demotions log updated ({demotions_log}).")
-    print(f"::notice::Demotions CSV updated ({demotions_csv}).")
+    write_status(run, df_status)
+    print(f"::notice::Status CSV updated ({run.output_csv}).")
+    print(f"::notice::Demotions log updated ({run.demotions_log}).")
+    print(f"::notice::Demotions CSV updated ({run.demotions_csv}).")
 
 
-# --- MAIN ---
-print(f"::notice:: Execution mode for demotion: {EXECUTION_MODE}")
-
-# Decide whether we need to rebuild status CSV from latest snapshot
-t_input = input_csv.stat().st_mtime
-t_status = output_csv.stat().st_mtime if output_csv.exists() else 0
-
-if (not output_csv.exists()) or (t_input > t_status):
-    print("::notice::Status CSV missing or older than users_latest. Rebuilding flags from latest snapshot.")
-    df_status, candidates = analyze_and_flag()
-else:
-    print("::notice::Status CSV is newer than or same as users_latest. Reusing existing flags.")
-    df_status = pd.read_csv(output_csv)
+# Demote one batch with a single collection-level JSON Patch.
+# Returns {entitlement_id: error or None}; users without a clear result count as failed
+# (they are not logged, so the next run simply retries them - the patch is idempotent).
+# Never raises: a failing batch must not stop the others from being logged.
+def demote_batch(run, entitlement_ids):
+    try:
+        return patch_batch(run, entitlement_ids)
+    except Exception as e:
+        return {eid: f"error: {e!r}" for eid in entitlement_ids}
+
+
+def patch_batch(run, entitlement_ids):
+    url = f"{run.licensing_url}/_apis/userentitlements?api-version=7.1-preview.3"
+    payload = [
+        {
+            "from": "",
+            "op": "replace",
+            "path": f"/{entitlement_id}/accessLevel",
+            "value": {
+                "accountLicenseType": "stakeholder"
+            }
+        }
+        for entitlement_id in entitlement_ids
+    ]
+
+    try:
+        resp = run.client.patch(url, payload)
+    except Exception as e:
+        return {eid: f"HTTP error: {e}" for eid in entitlement_ids}
+
+    if resp.status_code not in (200, 201, 202):
+        return {eid: f"status {resp.status_code}: {resp.text[:200]}" for eid in entitlement_ids}
+
+    operation = resp.json()
+
+    # Large batches may be processed asynchronously - poll the operation reference
+    for _ in range(30):
+        if operation.get("results") or operation.get("status") not in ("queued", "inProgress", "notSet"):
+            break
+        if not operation.get("url"):
+            break
+        time.sleep(2)
+        operation = run.client.get_json(operation["url"])
+
+    outcome = {eid: "no result reported by ADO" for eid in entitlement_ids}
+    for result in operation.get("results") or []:
+        eid = str(result.get("userId") or (result.get("result") or {}).get("id") or "")
+        if eid not in outcome:
+            continue
+        if result.get("isSuccess"):
+            outcome[eid] = None
+        else:
+            errors = result.get("errors") or []
+            outcome[eid] = "; ".join(str(e.get("value", e)) if isinstance(e, dict) else str(e) for e in errors) or "failed"
+    return outcome
+
+
+# Demote all candidates in batched PATCHes with bounded concurrency.
+# Every success is appended to the log as soon as its batch completes, and users
+# already logged as demoted are skipped, so a crashed run resumes where it stopped.
+def demote_all(run, df_status, candidates):
+    already_done = load_demoted_ids(run)
+    candidate_ids = candidates['UserEntitlementId'].astype(str)
+    todo = candidates[~candidate_ids.isin(already_done)]
+
+    print(f"::notice::[DEMOTE ALL] {len(candidates)} candidates, {len(candidates) - len(todo)} already demoted since the scan, {len(todo)} to go.")
+    print(f"::notice::Batch size {run.batch_size}, {run.workers} batch(es) in flight.")
+
+    missing_id = todo['UserEntitlementId'].isna() | (todo['UserEntitlementId'].astype(str).str.strip() == "")
+    if missing_id.any():
+        print(f"::warning::Skipping {int(missing_id.sum())} candidate(s) without UserEntitlementId.")
+        todo = todo[~missing_id]
+
+    rows = {str(r['UserEntitlementId']): r for r in todo.to_dict("records")}
+
+    # only users still eligible in ADO right now are patched
+    eligible, skipped, errors = recheck_candidates(run, list(rows))
+    clear_flags(df_status, skipped)
+    for entitlement_id, error in errors.items():
+        print(f"::error::Failed to demote {rows[entitlement_id].get('Email')} ({entitlement_id}): {error}")
+    print(f"::notice::Re-checked {len(rows)} candidate(s) in ADO: {len(eligible)} still eligible, "
+          f"{len(skipped)} no longer candidates, {len(errors)} not readable.")
+
+    ids = [eid for eid in rows if eid in eligible]
+    batches = [ids[i:i + run.batch_size] for i in range(0, len(ids), run.batch_size)]
+
+    demoted = set()
+    failed = len(errors)
+    with ThreadPoolExecutor(max_workers=run.workers) as pool:
+        futures = [pool.submit(demote_batch, run, batch) for batch in batches]
+
+        # results are handled here on the main thread, so log writes never interleave
+        for future in as_completed(futures):
+            for entitlement_id, error in future.result().items():
+                row = rows[entitlement_id]
+                if error:
+                    failed += 1
+                    print(f"::error::Failed to demote {row.get('Email')} ({entitlement_id}): {error}")
+                    continue
+
+                append_demotion_event(
+                    run.demotions_log,
+                    org=run.org,
+                    entitlement_id=entitlement_id,
+                    email=row.get('Email'),
+                    old_license=row.get('License'),
+                    new_license="Stakeholder",
+                    days_inactive=row.get('Days Inactive'),
+                    threshold_days=threshold_for(row.get('License'), run.rules),
+                    source=row.get('Source', ''),
+                    mode=run.mode,
+                    gh_run_id=run.gh_run_id,
+                    gh_sha=run.gh_sha,
+                )
+                demoted.add(entitlement_id)
+                print(f"  demoted: {row.get('Email')}")
+
+    # Rebuild demotions.csv once for the whole run
+    rebuild_demotions_csv(run)
+
+    # Mark everyone demoted now or in an earlier (crashed) run
+    done_ids = demoted | already_done
+    df_status.loc[
+        df_status['UserEntitlementId'].astype(str).isin(done_ids) & (df_status['Demotion_Status'] == 'Demote'),
+        'Demotion_Status'
+    ] = 'Demote DONE'
+    write_status(run, df_status)
+
+    print(f"::notice::[DEMOTE ALL] Demoted {len(demoted)} user(s), {failed} failed.")
+    print(f"::notice::Status CSV updated ({run.output_csv}).")
+    print(f"::notice::Demotions log updated ({run.demotions_log}).")
+    print(f"::notice::Demotions CSV updated ({run.demotions_csv}).")
+
+    if failed:
+        raise RuntimeError("Some demotions failed; re-run to retry them (already demoted users are skipped).")
+
+
+# --- STATUS ---
+# Flags for this run: rebuilt from the snapshot (in memory or users_latest.csv) when the
+# status CSV is missing or older, otherwise the existing users_with_status.csv is reused.
+def load_status(run, snapshot=None):
+    import pandas as pd
+
+    if snapshot is None and not run.input_csv.exists():
+        raise RuntimeError(f"Input CSV not found: {run.input_csv}")
+
+    if snapshot is not None or not status_up_to_date(run):
+        print("::notice::Status CSV missing or built from other inputs. Rebuilding flags from latest snapshot.")
+        with run.metrics.stage("analyze"):
+            return analyze_and_flag(run, snapshot)
+
+    print("::notice::Status CSV was built from the current snapshot, rules and exemptions. Reusing existing flags.")
+    df_status = by_inactivity(with_days_inactive(pd.read_csv(run.output_csv), scanned_at(run.input_csv)))
     candidates = df_status[df_status['Demotion_Status'] == 'Demote']
+    return df_status, candidates
+
+
+# Run the configured mode on the flagged candidates
+def execute(run, df_status, candidates):
+    candidate_count = len(candidates)
+
+    if candidate_count == 0:
+        print("::notice::No candidates found marked for demotion.")
+        return
+
+    with run.metrics.stage("demote"):
+        # --- MODE 1: DRY RUN ---
+        if run.mode == "DRY_RUN":
+            demote_dry_run(df_status, candidates)
+
+        # --- MODE 2: DEMOTE ONE ---
+        elif run.mode == "DEMOTE_ONE":
+            demote_one(run, df_status, candidates)
+
+        # --- MODE 3: DEMOTE ALL ---
+        elif run.mode == "DEMOTE_ALL":
+            demote_all(run, df_status, candidates)
 
-candidate_count = len(candidates)
 
-if candidate_count == 0:
-    print("::notice::No candidates found marked for demotion.")
-    exit(0)
+# --- CONFIG ---
+# DemoteRun keyword arguments from the environment (exits on invalid values)
+def config_from_env():
+    ado_org = os.getenv("ADO_ORG")
+    ado_pat = os.getenv("ADO_PAT")
+
+    if not ado_org or not ado_pat:
+        print("::error:: Environment variables ADO_ORG_URL or ADO_PAT are missing.")
+        exit(1)
 
-# --- MODE 1: DRY RUN ---
-if EXECUTION_MODE == "DRY_RUN":
-    demote_dry_run(df_status, candidates)
+    execution_mode = os.getenv("EXECUTION_MODE", "DRY_RUN") # Options: DRY_RUN, DEMOTE_ONE, DEMOTE_ALL
+    threshold_str = os.getenv("DEMOTE_THRESHOLD_DAYS", "90")
+    try:
+        threshold_days = int(threshold_str)
+    except ValueError:
+        print(f"::error::Invalid DEMOTE_THRESHOLD_DAYS: {threshold_str}")
+        exit(1)
+
+    # DEMOTE_ALL: users per collection-level PATCH, and PATCHes in flight at once
+    try:
+        batch_size = max(1, int(os.getenv("DEMOTE_BATCH_SIZE", "20")))
+        workers = max(1, int(os.getenv("DEMOTE_WORKERS", "4")))
+    except ValueError:
+        print("::error::Invalid DEMOTE_BATCH_SIZE or DEMOTE_WORKERS")
+        exit(1)
+
+    return {
+        "org": ado_org,
+        "pat": ado_pat,
+        "mode": execution_mode,
+        "threshold_days": threshold_days,
+        "rules_file": Path(os.getenv("DEMOTE_RULES_FILE", BASE_DIR / "demotion_rules.json")),
+        "batch_size": batch_size,
+        "workers": workers,
+        "gh_run_id": os.getenv("GITHUB_RUN_ID", "local"),
+        "gh_sha": os.getenv("GITHUB_SHA", "local"),
+    }
+
+
+# --- MAIN ---
+def main():
+    run = DemoteRun(**config_from_env())
+    print(f"::notice:: Execution mode for demotion: {run.mode}")
+
+    # metrics are written even when a mode fails
+    try:
+        df_status, candidates = load_status(run)
+        execute(run, df_status, candidates)
+    except RuntimeError as e:
+        print(f"::error::{e}")
+        exit(1)
+    finally:
+        run.metrics.write(run.output_dir)
 
-# --- MODE 2: DEMOTE ONE ---
-elif EXECUTION_MODE == "DEMOTE_ONE":
-    demote_one(df_status, candidates)
 
-# --- MODE 3: DEMOTE ALL ---
-elif EXECUTION_MODE == "DEMOTE_ALL":
-    print(f"::notice::[DEMOTE ALL] Found {candidate_count} candidates.")
-    print("::notice::NOT IMPLEMENTED YET (Safety Lock). No changes were made.")
+if __name__ == "__main__":
+    main()
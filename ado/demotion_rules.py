@@ -0,0 +1,108 @@
+import hashlib
+import json
+import re
+from datetime import datetime, timezone
+
+
+# --- DEFAULT POLICY ---
+# Same rule the flag loop used to hardcode: source == account, not stakeholder, days >= threshold.
+# Everything here can be overridden from demotion_rules.json.
+DEFAULT_RULES = {
+    "sources": ["account"],             # licensingSource values we may demote (never msdn)
+    "skip_licenses": ["stakeholder"],   # license substrings that are already free
+    "threshold_days": 90,               # default inactivity threshold
+    "license_thresholds": {},           # per-license overrides, e.g. {"Basic + Test Plans": 180}
+    "exempt_emails": [],                # never demote these users
+    "exempt_domains": [],               # ...or anyone with these email domains
+    "exempt_groups": [],                # ...or members (also nested) of these ADO / Entra groups
+    "grace_period_days": 0,             # never demote users created less than N days ago
+}
+
+# Reasons, in priority order: the first one that applies is recorded
+REASON_SOURCE = "source_not_eligible"
+REASON_FREE = "already_free_license"
+REASON_EXEMPT_EMAIL = "exempt_email"
+REASON_EXEMPT_DOMAIN = "exempt_domain"
+REASON_EXEMPT_GROUP = "exempt_group"
+REASON_GRACE = "grace_period"
+REASON_BELOW = "below_threshold"
+REASON_DEMOTE = "inactive_over_threshold"
+REASON_GONE = "not_in_org"  # set by the demotion step's re-check: entitlement no longer exists
+
+
+# Load the declarative policy; env DEMOTE_THRESHOLD_DAYS (threshold_days) wins over the file
+def load_rules(path=None, threshold_days=None):
+    rules = dict(DEFAULT_RULES)
+    if path and path.exists():
+        with path.open("r", encoding="utf-8") as f:
+            rules.update(json.load(f))
+    if threshold_days is not None:
+        rules["threshold_days"] = threshold_days
+    return rules
+
+
+# Identifies the policy a changefeed / status CSV was computed with
+def rules_sha256(rules):
+    return hashlib.sha256(json.dumps(rules, sort_keys=True).encode()).hexdigest()
+
+
+# Inactivity threshold that applies to a single license
+def threshold_for(license_name, rules):
+    overrides = {k.lower(): v for k, v in rules["license_thresholds"].items()}
+    return overrides.get(str(license_name).lower(), rules["threshold_days"])
+
+
+# Per-row inactivity threshold (license override or default)
+def thresholds(df, rules):
+    overrides = {k.lower(): v for k, v in rules["license_thresholds"].items()}
+    return (
+        df["License"].astype(object).fillna("").str.lower()
+        .map(overrides)
+        .fillna(rules["threshold_days"])
+    )
+
+
+# Evaluate the policy as boolean masks over the whole frame.
+# group_members: exempt e-mails resolved by the users scan (group_exemptions.py)
+# Returns (Demotion_Status, Demotion_Reason) series aligned with df.
+def evaluate(df, rules, now=None, group_members=None):
+    import pandas as pd  # lazy: load_rules() alone should not pull in pandas
+
+    now = now or datetime.now(timezone.utc)
+
+    # astype(object): License may be categorical (columnar ingestion), which can't be filled with ""
+    email = df["Email"].astype(object).fillna("").str.lower()
+    license_lower = df["License"].astype(object).fillna("").str.lower()
+    days = pd.to_numeric(df["Days Inactive"], errors="coerce").fillna(0)
+
+    not_eligible_source = ~df["Source"].isin(rules["sources"])
+
+    skip = [re.escape(s.lower()) for s in rules["skip_licenses"]]
+    already_free = license_lower.str.contains("|".join(skip)) if skip else pd.Series(False, index=df.index)
+
+    exempt_email = email.isin({e.lower() for e in rules["exempt_emails"]})
+    exempt_domain = email.str.rsplit("@", n=1).str[-1].isin({d.lower().lstrip("@") for d in rules["exempt_domains"]})
+    exempt_group = email.isin(group_members or set())
+
+    # 0001-01-01 sentinel and blanks become NaT -> never "recently created"
+    created = pd.to_datetime(df["Created"], utc=True, errors="coerce", format="ISO8601")
+    created_age = (now - created).dt.days
+    in_grace = created_age < rules["grace_period_days"]
+
+    below_threshold = days < thresholds(df, rules)
+
+    # apply lowest priority first, so higher-priority reasons overwrite it
+    reason = pd.Series(REASON_DEMOTE, index=df.index)
+    for mask, label in reversed([
+        (not_eligible_source, REASON_SOURCE),
+        (already_free, REASON_FREE),
+        (exempt_email, REASON_EXEMPT_EMAIL),
+        (exempt_domain, REASON_EXEMPT_DOMAIN),
+        (exempt_group, REASON_EXEMPT_GROUP),
+        (in_grace, REASON_GRACE),
+        (below_threshold, REASON_BELOW),
+    ]):
+        reason = reason.mask(mask, label)
+
+    status = pd.Series("", index=df.index).mask(reason == REASON_DEMOTE, "Demote")
+    return status, reason
@@ -0,0 +1,201 @@
+import csv
+import json
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from ado_client import AdoClient, AdoHttpError, analytics_url
+
+FILL_RATE_COLUMNS = ["Project", "FieldRefName", "FieldName", "WorkItems", "Filled", "FillRate"]
+
+# Long text fields are not in the Analytics model, so they can't be counted server-side
+SKIP_TYPES = {"html", "plainText", "history"}
+
+# Project names per filter(... in (...)) and fields counted per query: keeps the query URL
+# well below its length limit
+PROJECTS_PER_QUERY = 50
+FIELDS_PER_QUERY = 10
+
+STATE_VERSION = 1
+
+
+# --- ODATA HELPERS ---
+# Custom.ReleaseTrain -> Custom_ReleaseTrain (Analytics property name)
+def odata_property(ref_name):
+    return ref_name.replace(".", "_")
+
+
+def odata_quote(value):
+    return "'" + value.replace("'", "''") + "'"
+
+
+def project_filter(projects):
+    return f"Project/ProjectName in ({', '.join(odata_quote(p) for p in projects)})"
+
+
+def chunks(values, size):
+    return [values[i:i + size] for i in range(0, len(values), size)]
+
+
+# Work items per project, and per field how many of them have it filled, counted by Analytics:
+# compute() turns "field filled" into 0/1 per work item, groupby + aggregate sums those up, so
+# several fields share one query and only one row per project comes back, not the work items.
+# Returns ({project: work items}, {ref: {project: filled}}).
+def count_filled(client, workitems_url, projects, refs):
+    apply = f"filter({project_filter(projects)})"
+    if refs:
+        apply += "/compute(" + ", ".join(f"iif({odata_property(ref)} ne null, 1, 0) as F{i}"
+                                         for i, ref in enumerate(refs)) + ")"
+    aggregates = ["$count as Count"] + [f"F{i} with sum as F{i}" for i in range(len(refs))]
+    apply += f"/groupby((Project/ProjectName), aggregate({', '.join(aggregates)}))"
+
+    rows = {}
+    url, params = workitems_url, {"$apply": apply}
+    while url:
+        data = client.get_json(url, params=params)
+        for row in data.get("value", []):
+            rows[row["Project"]["ProjectName"]] = row
+        url, params = data.get("@odata.nextLink"), None  # server-driven paging, link has the query
+    totals = {project: int(row["Count"]) for project, row in rows.items()}
+    filled = {ref: {project: int(row[f"F{i}"] or 0) for project, row in rows.items()} for i, ref in enumerate(refs)}
+    return totals, filled
+
+
+# --- CATALOGUE -> QUERIES ---
+# custom field ref -> (name, type, projects it is attached to), from ado_project_fields.csv
+def custom_fields_by_project(catalog_csv):
+    fields = {}
+    projects = defaultdict(set)
+    with catalog_csv.open("r", newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            if row["IsCustom"] != "Yes":
+                continue
+            ref = row["FieldRefName"]
+            fields[ref] = (row["FieldName"], row["FieldType"])
+            projects[ref].add(row["Project"])
+    return {ref: (name, field_type, sorted(projects[ref])) for ref, (name, field_type) in sorted(fields.items())}
+
+
+# {(project, ref): row} of an earlier report (empty when there is none)
+def read_fill_rates(path):
+    if not path.exists():
+        return {}
+    with path.open("r", newline="", encoding="utf-8") as f:
+        return {(row["Project"], row["FieldRefName"]): row for row in csv.DictReader(f)}
+
+
+# --- SCHEDULE ---
+# Incremental runs only count the projects the crawl re-read; everything is counted again on the first
+# run, after a full crawl and every full_days days (fill rates also move in projects whose fields don't).
+def load_state(path):
+    if not path.exists():
+        return {}
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            state = json.load(f)
+    except json.JSONDecodeError:
+        return {}
+    return state if state.get("version") == STATE_VERSION else {}
+
+
+def save_state(path, full_count):
+    partial = path.with_name(path.name + ".partial")
+    with partial.open("w", encoding="utf-8") as f:
+        json.dump({"version": STATE_VERSION, "full_count": full_count.isoformat(timespec="seconds")}, f, indent=1)
+    partial.replace(path)
+
+
+# Why this run has to count every project, or None when the re-crawled ones are enough
+def full_count_reason(state, recrawled, now, full_days):
+    if recrawled is None:
+        return "full crawl"
+    if not state:
+        return "no earlier full count"
+    age = now - datetime.fromisoformat(state["full_count"])
+    if age >= timedelta(days=full_days):
+        return f"last full count {age.days} day(s) ago (FIELDS_FILL_RATE_FULL_DAYS={full_days:g})"
+    return None
+
+
+# --- FILL RATE ---
+# Per chunk of projects, one query per FIELDS_PER_QUERY custom fields attached to any of them
+# (each also counts the projects' work items), run with bounded concurrency.
+# projects: count only these (plus projects with a catalogue row the earlier report lacks) and keep
+# the earlier rows of the rest; None = count every project. Returns the number of rows written to out_csv.
+def collect_fill_rates(org, pat, catalog_csv, out_csv, *, projects=None, workers=8, metrics=None):
+    fields = custom_fields_by_project(catalog_csv)
+    skipped = [ref for ref, (_, field_type, _) in fields.items() if field_type in SKIP_TYPES]
+    fields = {ref: f for ref, f in fields.items() if ref not in skipped}
+    if skipped:
+        print(f"::notice::Fill rate: skipping {len(skipped)} long text field(s) not available in Analytics")
+
+    client = AdoClient(pat, pool_size=workers, metrics=metrics)
+    workitems_url = f"{analytics_url(org)}/WorkItems"
+    all_projects = sorted({p for _, _, attached in fields.values() for p in attached})
+
+    previous = read_fill_rates(out_csv) if projects is not None else {}
+    if projects is not None:
+        missing = {p for ref, (_, _, attached) in fields.items() for p in attached if (p, ref) not in previous}
+        counted = sorted(set(all_projects) & (set(projects) | missing))
+        print(f"Fill rate: counting {len(counted)} of {len(all_projects)} projects "
+              f"({len(set(counted) - missing)} re-crawled, {len(missing)} without earlier counts)")
+    else:
+        counted = all_projects
+
+    jobs = []
+    for chunk in chunks(counted, PROJECTS_PER_QUERY):
+        in_chunk = set(chunk)
+        refs = [ref for ref, (_, _, projects) in fields.items() if in_chunk.intersection(projects)]
+        jobs += [(chunk, batch) for batch in chunks(refs, FIELDS_PER_QUERY)] or [(chunk, [])]
+    print(f"Fill rate: {len(fields)} custom fields in {len(counted)} projects -> {len(jobs)} Analytics queries")
+
+    # A field Analytics doesn't know (yet) fails its whole query with a 400: halve the batch until
+    # it is found, skip it and count the rest. Returns (totals, filled, unavailable refs).
+    def run(job):
+        projects, refs = job
+        try:
+            return (*count_filled(client, workitems_url, projects, refs), set())
+        except AdoHttpError as e:
+            if e.status_code != 400 or not refs:
+                raise
+        if len(refs) == 1:
+            print(f"::warning::Fill rate: Analytics can't count {refs[0]}, skipped")
+            totals, _, _ = run((projects, []))
+            return totals, {}, set(refs)
+        half = len(refs) // 2
+        (totals, filled, unavailable), (totals_2, filled_2, unavailable_2) = \
+            run((projects, refs[:half])), run((projects, refs[half:]))
+        return {**totals, **totals_2}, {**filled, **filled_2}, unavailable | unavailable_2
+
+    totals = {}
+    filled = defaultdict(dict)
+    unavailable = set()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for job_totals, job_filled, job_unavailable in pool.map(run, jobs):
+            totals.update(job_totals)
+            for ref, counts in job_filled.items():
+                filled[ref].update(counts)
+            unavailable |= job_unavailable
+
+    counted = set(counted)
+    rows = 0
+    partial = out_csv.with_name(out_csv.name + ".partial")
+    with partial.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f, delimiter=",")
+        writer.writerow(FILL_RATE_COLUMNS)
+        for ref, (name, _, attached) in fields.items():
+            for project in attached:
+                if project not in counted:
+                    row = previous[(project, ref)]
+                    writer.writerow([project, ref, name, row["WorkItems"], row["Filled"], row["FillRate"]])
+                elif ref in unavailable:
+                    continue
+                else:
+                    total = totals.get(project, 0)
+                    count = filled[ref].get(project, 0)
+                    writer.writerow([project, ref, name, total, count, round(100 * count / total, 1) if total else ""])
+                rows += 1
+    partial.replace(out_csv)
+
+    print(f"✅ Written {rows} fill rate rows to: {out_csv}")
+    return rows
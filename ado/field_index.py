@@ -0,0 +1,255 @@
+import argparse
+import csv
+import os
+from pathlib import Path
+
+import numpy as np
+
+BASE_DIR = Path(__file__).resolve().parent  # folder where this script lives
+
+CLUSTER_COLUMNS = [
+    "Cluster",
+    "ProcessName",
+    "Projects",
+    "Fields",
+    "NearestProcess",
+    "Jaccard",
+    "OnlyHere",
+    "OnlyInNearest",
+]
+
+# processes at least this similar (Jaccard of their field sets) end up in one cluster
+DEFAULT_CLUSTER_THRESHOLD = 0.9
+
+
+# --- INDEX ---
+# Projects × fields incidence matrix of ado_project_fields.csv: one bool row per project, one column
+# per field ref name. Set questions become vectorised NumPy ops instead of groupbys over the long
+# table: a column is "projects using the field", column sums find single-project fields, and
+# Jaccard similarity of all pairs is one matrix product (|A ∩ B| = A·B). At thousands of projects
+# and fields that is a few MB and well below a second.
+class FieldIndex:
+    def __init__(self, projects, processes, fields, field_names, is_custom, matrix):
+        self.projects = projects          # project names, sorted (row labels)
+        self.processes = processes        # process name per project
+        self.fields = fields              # field ref names, sorted (column labels)
+        self.field_names = field_names    # display name per field
+        self.is_custom = is_custom        # bool per field
+        self.matrix = matrix              # projects × fields, bool
+        self.project_pos = {p: i for i, p in enumerate(projects)}
+        self.field_pos = {f: i for i, f in enumerate(fields)}
+
+    @classmethod
+    def from_csv(cls, csv_path):
+        # one process per project, one name / custom flag per field: first row wins
+        process_of, name_of, custom_of, pairs = {}, {}, {}, []
+        with open(csv_path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                project, field = row["Project"], row["FieldRefName"]
+                process_of.setdefault(project, row["ProcessName"])
+                name_of.setdefault(field, row["FieldName"])
+                custom_of.setdefault(field, row["IsCustom"] == "Yes")
+                pairs.append((project, field))
+
+        projects, fields = sorted(process_of), sorted(name_of)
+        project_pos = {p: i for i, p in enumerate(projects)}
+        field_pos = {f: i for i, f in enumerate(fields)}
+        matrix = np.zeros((len(projects), len(fields)), dtype=bool)
+        if pairs:
+            rows, cols = zip(*((project_pos[p], field_pos[f]) for p, f in pairs))
+            matrix[list(rows), list(cols)] = True
+
+        return cls(
+            projects,
+            np.array([process_of[p] for p in projects], dtype=object),
+            fields,
+            np.array([name_of[f] for f in fields], dtype=object),
+            np.array([custom_of[f] for f in fields], dtype=bool),
+            matrix,
+        )
+
+    def project_row(self, project):
+        if project not in self.project_pos:
+            raise KeyError(f"Unknown project: {project}")
+        return self.project_pos[project]
+
+    def field_col(self, field_ref):
+        if field_ref not in self.field_pos:
+            raise KeyError(f"Unknown field: {field_ref}")
+        return self.field_pos[field_ref]
+
+    # --- QUERIES ---
+    # (project, process) of every project using the field
+    def projects_using(self, field_ref):
+        rows = np.flatnonzero(self.matrix[:, self.field_col(field_ref)])
+        return [(self.projects[i], self.processes[i]) for i in rows]
+
+    # (ref, name, is custom) of the fields no other project uses
+    def unique_fields(self, project):
+        row = self.matrix[self.project_row(project)]
+        cols = np.flatnonzero(row & (self.matrix.sum(axis=0) == 1))
+        return [(self.fields[j], self.field_names[j], bool(self.is_custom[j])) for j in cols]
+
+    # (project, process, Jaccard) of the `top` projects with the most similar field sets
+    def similar_projects(self, project, top=10):
+        i = self.project_row(project)
+        scores = jaccard(self.matrix[i:i + 1], self.matrix)[0]
+        scores[i] = -1  # not itself
+        best = np.argsort(-scores, kind="stable")[:top]
+        return [(self.projects[k], self.processes[k], float(scores[k])) for k in best]
+
+    # Process × fields incidence: a process uses a field when any of its projects does
+    def process_matrix(self):
+        names, codes = np.unique(self.processes.astype(str), return_inverse=True)
+        members = np.zeros((len(names), len(self.projects)), dtype=np.float32)
+        members[codes, np.arange(len(self.projects))] = 1
+        return list(names), members.sum(axis=1).astype(int), (members @ self.matrix.astype(np.float32)) > 0
+
+    # (process, process, Jaccard) of the `top` most similar process pairs
+    def similar_processes(self, top=20):
+        names, _, matrix = self.process_matrix()
+        scores = np.triu(jaccard(matrix, matrix), k=1)
+        a, b = np.triu_indices(len(names), k=1)
+        order = np.argsort(-scores[a, b], kind="stable")[:top]
+        return [(names[a[k]], names[b[k]], float(scores[a[k], b[k]])) for k in order]
+
+    # --- CLUSTERS ---
+    # Processes linked by a Jaccard >= threshold, grouped transitively (single linkage, i.e. the
+    # connected components of that graph). Each multi-process cluster is a consolidation candidate;
+    # OnlyHere / OnlyInNearest are the fields that would have to be added or dropped to merge a
+    # process into its nearest one. Clusters are numbered largest first, singletons are left out.
+    def process_clusters(self, threshold=DEFAULT_CLUSTER_THRESHOLD):
+        names, project_counts, matrix = self.process_matrix()
+        scores = jaccard(matrix, matrix)
+        np.fill_diagonal(scores, -1)
+
+        labels = components(scores >= threshold)
+        sizes = np.bincount(labels)
+        # cluster number by size (largest first), ties by the first process name in it
+        order = sorted((c for c in range(len(sizes)) if sizes[c] > 1),
+                       key=lambda c: (-sizes[c], np.flatnonzero(labels == c)[0]))
+        numbers = {c: n for n, c in enumerate(order, start=1)}
+
+        rows = []
+        for i, name in enumerate(names):
+            if labels[i] not in numbers:
+                continue
+            nearest = int(np.argmax(scores[i]))
+            rows.append([
+                numbers[labels[i]],
+                name,
+                int(project_counts[i]),
+                int(matrix[i].sum()),
+                names[nearest],
+                round(float(scores[i, nearest]), 3),
+                int((matrix[i] & ~matrix[nearest]).sum()),
+                int((matrix[nearest] & ~matrix[i]).sum()),
+            ])
+        return sorted(rows, key=lambda r: (r[0], r[1]))
+
+
+# Jaccard similarity of every row of a with every row of b (bool matrices, same columns).
+# float32 counts are exact up to 2^24 fields.
+def jaccard(a, b):
+    a32 = a.astype(np.float32)
+    b32 = b.astype(np.float32)
+    inter = a32 @ b32.T
+    union = a32.sum(axis=1)[:, None] + b32.sum(axis=1)[None, :] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+# Connected component label per node of a symmetric adjacency matrix (union-find over the edges)
+def components(adjacency):
+    parent = np.arange(len(adjacency))
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in zip(*np.nonzero(np.triu(adjacency, k=1))):
+        parent[root(i)] = root(j)
+    roots = np.array([root(i) for i in range(len(parent))], dtype=int)
+    return np.unique(roots, return_inverse=True)[1]
+
+
+# --- REPORT ---
+# outputs/<ORG>/process_clusters.csv from the field catalogue
+def write_cluster_report(csv_path, report_path, threshold=DEFAULT_CLUSTER_THRESHOLD):
+    rows = FieldIndex.from_csv(csv_path).process_clusters(threshold)
+    partial = report_path.with_name(report_path.name + ".partial")
+    with partial.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(CLUSTER_COLUMNS)
+        writer.writerows(rows)
+    partial.replace(report_path)
+    clusters = len({r[0] for r in rows})
+    print(f"::notice::{clusters} process cluster(s) with Jaccard >= {threshold:g} ({len(rows)} processes): {report_path}")
+    return rows
+
+
+def print_rows(headers, rows):
+    print("\t".join(headers))
+    for row in rows:
+        print("\t".join(f"{v:.3f}" if isinstance(v, float) else str(v) for v in row))
+    if not rows:
+        print("(none)")
+
+
+# --- MAIN ---
+# Query entry point, e.g.
+#   python ado/field_index.py field Custom.CostCenter
+#   python ado/field_index.py unique "My Project"
+#   python ado/field_index.py similar "My Project" --top 5
+#   python ado/field_index.py processes
+#   python ado/field_index.py clusters --threshold 0.9
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query the project × field incidence index of the field catalogue")
+    parser.add_argument("--org", default=os.getenv("ADO_ORG"), help="ADO org (default: $ADO_ORG)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_field = sub.add_parser("field", help="projects using a field")
+    p_field.add_argument("field_ref")
+
+    p_unique = sub.add_parser("unique", help="fields no other project uses")
+    p_unique.add_argument("project")
+
+    p_similar = sub.add_parser("similar", help="projects with the most similar field sets (Jaccard)")
+    p_similar.add_argument("project")
+    p_similar.add_argument("--top", type=int, default=10)
+
+    p_processes = sub.add_parser("processes", help="most similar process pairs (Jaccard)")
+    p_processes.add_argument("--top", type=int, default=20)
+
+    p_clusters = sub.add_parser("clusters", help="process consolidation candidates")
+    p_clusters.add_argument("--threshold", type=float, default=DEFAULT_CLUSTER_THRESHOLD)
+
+    args = parser.parse_args(argv)
+    if not args.org:
+        parser.error("--org or ADO_ORG is required")
+
+    csv_path = BASE_DIR / "outputs" / args.org / "ado_project_fields.csv"
+    if not csv_path.exists():
+        print(f"❌ Error: No field catalogue at {csv_path}")
+        exit(1)
+
+    index = FieldIndex.from_csv(csv_path)
+    try:
+        if args.command == "field":
+            print_rows(["project", "process"], index.projects_using(args.field_ref))
+        elif args.command == "unique":
+            print_rows(["field_ref_name", "field_name", "is_custom"], index.unique_fields(args.project))
+        elif args.command == "similar":
+            print_rows(["project", "process", "jaccard"], index.similar_projects(args.project, args.top))
+        elif args.command == "processes":
+            print_rows(["process", "process", "jaccard"], index.similar_processes(args.top))
+        elif args.command == "clusters":
+            print_rows(CLUSTER_COLUMNS, index.process_clusters(args.threshold))
+    except KeyError as e:
+        print(f"❌ Error: {e.args[0]}")
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+from collections import defaultdict
+
+
+# --- REPORTS ---
+# Each report consumes catalog rows one at a time (dicts keyed by the CSV columns)
+# and keeps only the distinct sets it needs, so reports can be fed while the crawl
+# streams rows out - no second pass over the CSV. To add a report: subclass Report,
+# implement add() / header() / rows(), and list it in default_reports().
+class Report:
+    sheet_name = ""
+
+    def add(self, row):
+        raise NotImplementedError
+
+    def header(self):
+        raise NotImplementedError
+
+    def rows(self):
+        raise NotImplementedError
+
+
+# <group_by...> | number of distinct <distinct> values, optionally only for custom fields
+class DistinctCount(Report):
+    def __init__(self, sheet_name, group_by, distinct, count_name, custom_only=False):
+        self.sheet_name = sheet_name
+        self.group_by = group_by
+        self.distinct = distinct
+        self.count_name = count_name
+        self.custom_only = custom_only
+        self.groups = defaultdict(set)
+
+    def add(self, row):
+        if self.custom_only and row["IsCustom"] != "Yes":
+            return
+        self.groups[tuple(row[c] for c in self.group_by)].add(row[self.distinct])
+
+    def header(self):
+        return [*self.group_by, self.count_name]
+
+    def rows(self):
+        # most used first, ties by key so the workbook is deterministic
+        counted = [[*key, len(values)] for key, values in self.groups.items()]
+        return sorted(counted, key=lambda r: (-r[-1], r[:-1]))
+
+
+# Custom field × process matrix: number of projects on each process using the field
+class ProcessCustomFieldMatrix(Report):
+    sheet_name = "process_custom_field_matrix"
+
+    def __init__(self):
+        self.projects = defaultdict(lambda: defaultdict(set))  # (ref, name) -> process -> projects
+        self.processes = set()
+
+    def add(self, row):
+        if row["IsCustom"] != "Yes":
+            return
+        self.projects[(row["FieldRefName"], row["FieldName"])][row["ProcessName"]].add(row["Project"])
+        self.processes.add(row["ProcessName"])
+
+    def header(self):
+        return ["FieldRefName", "FieldName", *sorted(self.processes), "Total"]
+
+    def rows(self):
+        out = []
+        for (ref, name), by_process in self.projects.items():
+            counts = [len(by_process.get(p, ())) for p in sorted(self.processes)]
+            out.append([ref, name, *counts, sum(counts)])
+        return sorted(out, key=lambda r: (-r[-1], r[0]))
+
+
+# Fields used by exactly one project (snowflakes and consolidation candidates)
+class SingleProjectFields(Report):
+    sheet_name = "single_project_fields"
+
+    def __init__(self):
+        self.fields = {}                  # ref -> (name, is_custom)
+        self.projects = defaultdict(set)  # ref -> projects
+
+    def add(self, row):
+        ref = row["FieldRefName"]
+        self.fields[ref] = (row["FieldName"], row["IsCustom"])
+        self.projects[ref].add(row["Project"])
+
+    def header(self):
+        return ["FieldRefName", "FieldName", "IsCustom", "Project"]
+
+    def rows(self):
+        out = [
+            [ref, *self.fields[ref], next(iter(projects))]
+            for ref, projects in self.projects.items()
+            if len(projects) == 1
+        ]
+        return sorted(out, key=lambda r: (r[3], r[0]))
+
+
+def default_reports():
+    return [
+        DistinctCount("projects_custom_fields", ["Project"], "FieldRefName", "CustomFieldCount", custom_only=True),
+        DistinctCount("process_projects", ["ProcessName"], "Project", "ProjectCount"),
+        DistinctCount("fields_project_counts", ["FieldRefName", "FieldName"], "Project", "ProjectCount", custom_only=True),
+        ProcessCustomFieldMatrix(),
+        SingleProjectFields(),
+    ]
+
+
+# Fan-out of one row stream to all reports
+class FieldCatalogReports:
+    def __init__(self, reports=None):
+        self.reports = reports if reports is not None else default_reports()
+
+    def add(self, row):
+        for report in self.reports:
+            report.add(row)
+
+    def sheet_names(self):
+        return [r.sheet_name for r in self.reports]
+
+    # (sheet name, header, rows) per report, in workbook order
+    def sheets(self):
+        for report in self.reports:
+            yield report.sheet_name, report.header(), report.rows()
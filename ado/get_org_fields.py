@@ -1,112 +1,339 @@
-import requests
-import base64
 import os
-from datetime import datetime
+from datetime import datetime, timezone
 import csv
+import hashlib
+import json
 from pathlib import Path
-import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 
+import requests
 
-# --- QUERY PROJECTS AND  BUILD CSV ---
-def build_csv():
-    # --- AUTH ---
-    encoded_pat = base64.b64encode(f":{ADO_PAT}".encode()).decode()
-    headers = {
-        "Authorization": f"Basic {encoded_pat}",
-        "Content-Type": "application/json"
+from ado_client import AdoClient, org_url
+from response_cache import ResponseCache
+from history_store import db_path_for, record_csv
+from hashing import file_sha256
+from field_reports import FieldCatalogReports
+from field_fill_rate import collect_fill_rates, full_count_reason, load_state as load_fill_rate_state, \
+    save_state as save_fill_rate_state
+from metrics import Metrics
+from dag import Dag, OK, UNCHANGED
+
+BASE_DIR = Path(__file__).resolve().parent  # folder where this script lives
+
+API_VERSION = "7.0"
+
+CRAWL_STATE_VERSION = 2
+
+FILL_RATE_SHEET = "custom_field_fill_rate"
+
+# = field_index.DEFAULT_CLUSTER_THRESHOLD; field_index (NumPy) is only imported by the clusters stage
+DEFAULT_CLUSTER_THRESHOLD = 0.9
+
+CSV_COLUMNS = [
+    "Project",
+    "ProcessName",
+    "FieldName",
+    "FieldRefName",
+    "FieldType",
+    "IsIdentity",
+    "IsCustom",
+]
+
+
+# --- CRAWL: PROJECT MODE ---
+# Per project: process name (includeCapabilities), WIT list, then fields per WIT.
+# Returns [(project_name, process_name, field_refs)] in project order.
+def crawl_by_project(ado_get, pool, base_url, projects):
+
+    # pass 1: process name + WIT list per project
+    def fetch_project(p):
+        project_name = p.get("name")
+        project_id = p.get("id")
+
+        # get process name for this project (one extra call)
+        proj_detail_url = f"{base_url}/_apis/projects/{project_id}"
+        proj_detail = ado_get(
+            proj_detail_url,
+            params={"api-version": API_VERSION, "includeCapabilities": "true"}
+        )
+        capabilities = proj_detail.get("capabilities", {})
+        proc_tmpl = capabilities.get("processTemplate", {})
+        process_name = proc_tmpl.get("templateName", "")
+
+        # list WITs for this project
+        wits_url = f"{base_url}/{project_name}/_apis/wit/workitemtypes"
+        wits_data = ado_get(wits_url, params={"api-version": API_VERSION})
+        wit_names = [w.get("name") for w in wits_data.get("value", [])]
+
+        return project_name, process_name, wit_names
+
+    # executor.map keeps input order, so rows come out in the same order as a sequential crawl
+    crawled = list(pool.map(fetch_project, projects))
+#    crawled = list(pool.map(fetch_project, projects[:3])) # speeds up testing to process only 3 projects
+
+    for project_name, process_name, _ in crawled:
+        print(f"→ Project: {project_name} (process: {process_name})")
+
+    # pass 2: fields attached to each WIT of each project
+    wit_jobs = [(project_name, wit_name) for project_name, _, wit_names in crawled for wit_name in wit_names]
+    wit_results = pool.map(lambda job: fetch_wit_fields(ado_get, base_url, *job), wit_jobs)
+
+    # collect all field referenceNames used in each project (across all WITs)
+    project_field_refs = {project_name: set() for project_name, _, _ in crawled}
+    for (project_name, _), ref_names in zip(wit_jobs, wit_results):
+        project_field_refs[project_name].update(ref_names)
+
+    return [(name, process, project_field_refs[name]) for name, process, _ in crawled]
+
+
+# --- CRAWL: PROCESS MODE ---
+# Projects on the same process share WIT definitions, so resolve process -> projects
+# in one call and read the WIT list (which embeds field instances) once per process.
+# Projects missing from the process mapping fall back to the per-project crawl.
+def crawl_by_process(ado_get, pool, base_url, projects):
+    procs_url = f"{base_url}/_apis/work/processes"
+    procs_data = ado_get(procs_url, params={"api-version": API_VERSION, "$expand": "projects"})
+    procs = procs_data.get("value", [])
+
+    project_process = {}
+    for proc in procs:
+        for proj in proc.get("projects") or []:
+            project_process[proj.get("id")] = proc
+
+    print(f"Found {len(procs)} processes in org\n")
+
+    # one representative project per process (first in project order)
+    representatives = {}
+    for p in projects:
+        proc = project_process.get(p.get("id"))
+        if proc:
+            representatives.setdefault(proc.get("typeId"), p.get("name"))
+
+    process_ids = list(representatives)
+    process_fields = dict(zip(process_ids, pool.map(
+        lambda name: fetch_project_wit_fields(ado_get, base_url, name), representatives.values()
+    )))
+
+    unmapped = [p for p in projects if p.get("id") not in project_process]
+    if unmapped:
+        print(f"::warning::{len(unmapped)} project(s) not found in process list, crawling them per project")
+    fallback = {name: (process, refs) for name, process, refs in crawl_by_project(ado_get, pool, base_url, unmapped)}
+
+    crawled = []
+    for p in projects:
+        project_name = p.get("name")
+        proc = project_process.get(p.get("id"))
+        if proc:
+            process_name = proc.get("name", "")
+            print(f"→ Project: {project_name} (process: {process_name})")
+            crawled.append((project_name, process_name, process_fields[proc.get("typeId")]))
+        else:
+            crawled.append((project_name, *fallback[project_name]))
+
+    return crawled
+
+
+# Field referenceNames of all WITs of one project, from the WIT list (fields embedded)
+def fetch_project_wit_fields(ado_get, base_url, project_name):
+    wits_url = f"{base_url}/{project_name}/_apis/wit/workitemtypes"
+    wits_data = ado_get(wits_url, params={"api-version": API_VERSION})
+
+    field_refs = set()
+    for wit in wits_data.get("value", []):
+        if "fields" in wit:
+            field_refs.update(wf.get("referenceName") for wf in wit["fields"] if wf.get("referenceName"))
+        else:
+            # payload without embedded fields - ask the WIT directly
+            field_refs.update(fetch_wit_fields(ado_get, base_url, project_name, wit.get("name")))
+    return field_refs
+
+
+# Field referenceNames attached to one WIT of one project
+def fetch_wit_fields(ado_get, base_url, project_name, wit_name):
+    wit_fields_url = f"{base_url}/{project_name}/_apis/wit/workitemtypes/{wit_name}/fields"
+    wit_fields_data = ado_get(wit_fields_url, params={"api-version": API_VERSION})
+    return [wf.get("referenceName") for wf in wit_fields_data.get("value", []) if wf.get("referenceName")]
+
+
+# --- CRAWL: INCREMENTAL ---
+# Re-crawl only projects whose change markers moved since the last run (plus new ones);
+# the rest comes from the crawl state, deleted projects simply drop out.
+# Markers per project: lastUpdateTime, its process, and that process' field fingerprint.
+# work/processes carries no revision, so the fingerprint is the hash of the field set of one
+# project per process (one WIT list call per process, usually a 304 with the HTTP cache).
+# Returns (crawled, state, names of the re-crawled projects) - crawled in the same shape and order
+# as the full crawls.
+def crawl_incremental(ado_get, pool, base_url, projects, previous, crawl_mode):
+    procs_url = f"{base_url}/_apis/work/processes"
+    procs_data = ado_get(procs_url, params={"api-version": API_VERSION, "$expand": "projects"})
+
+    project_process = {}
+    for proc in procs_data.get("value", []):
+        for proj in proc.get("projects") or []:
+            project_process[proj.get("id")] = proc
+
+    representatives = {}
+    for p in projects:
+        proc = project_process.get(p.get("id"))
+        if proc:
+            representatives.setdefault(proc.get("typeId"), p.get("name"))
+    process_ids = list(representatives)
+    process_fields = dict(zip(process_ids, pool.map(
+        lambda name: fetch_project_wit_fields(ado_get, base_url, name), representatives.values()
+    )))
+    fingerprints = {
+        type_id: hashlib.sha256("\n".join(sorted(refs)).encode()).hexdigest() for type_id, refs in process_fields.items()
     }
 
-    API_VERSION = "7.0"
-    BASE_URL = f"https://dev.azure.com/{ADO_ORG}"
+    known = previous.get("projects", {})
+    markers = {}
+    stale = []
+    for p in projects:
+        proc = project_process.get(p.get("id"))
+        type_id = proc.get("typeId") if proc else None
+        markers[p.get("id")] = {
+            "lastUpdateTime": p.get("lastUpdateTime"),
+            "process": type_id,
+            "process_fields": fingerprints.get(type_id),
+        }
+        entry = known.get(p.get("id"))
+        if not entry or entry.get("marker") != markers[p.get("id")]:
+            stale.append(p)
+
+    # process mode: stale projects on a known process take its fields as read above (no extra call)
+    recrawled = {}
+    if crawl_mode == "process":
+        for p in stale:
+            proc = project_process.get(p.get("id"))
+            if proc:
+                print(f"→ Project: {p.get('name')} (process: {proc.get('name', '')})")
+                recrawled[p.get("id")] = (proc.get("name", ""), process_fields[proc.get("typeId")])
+    by_project = [p for p in stale if p.get("id") not in recrawled]
+    for p, (_, process_name, refs) in zip(by_project, crawl_by_project(ado_get, pool, base_url, by_project)):
+        recrawled[p.get("id")] = (process_name, refs)
+
+    crawled = []
+    state = {}
+    for p in projects:
+        project_id = p.get("id")
+        if project_id in recrawled:
+            process_name, refs = recrawled[project_id]
+        else:
+            process_name, refs = known[project_id]["process_name"], set(known[project_id]["fields"])
+        crawled.append((p.get("name"), process_name, refs))
+        state[project_id] = {"name": p.get("name"), "marker": markers[project_id],
+                             "process_name": process_name, "fields": sorted(refs)}
+
+    new = sum(1 for p in stale if p.get("id") not in known)
+    removed = len(set(known) - set(state))
+    print(f"::notice::Incremental crawl: {len(stale)} of {len(projects)} projects re-crawled "
+          f"({new} new, {len(stale) - new} changed), {removed} removed")
+
+    return crawled, {"version": CRAWL_STATE_VERSION, "crawl_mode": crawl_mode, "projects": state}, \
+        {p.get("name") for p in stale}
+
+
+# Per-project crawl results + markers of the last run; missing/unreadable = full crawl.
+# The modes derive rows differently (representative project vs per project), so a state
+# written in the other mode is not reused either.
+def load_crawl_state(path, crawl_mode):
+    if not path.exists():
+        return {}
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            state = json.load(f)
+    except json.JSONDecodeError:
+        return {}
+    if state.get("version") != CRAWL_STATE_VERSION:
+        return {}
+    if state.get("crawl_mode") != crawl_mode:
+        print(f"::notice::Crawl state was written in {state.get('crawl_mode')} mode, full {crawl_mode} crawl instead")
+        return {}
+    return state
+
+
+def save_crawl_state(path, state):
+    partial = path.with_name(path.name + ".partial")
+    with partial.open("w", encoding="utf-8") as f:
+        json.dump(state, f, separators=(",", ":"))
+    partial.replace(path)
+
+
+# --- QUERY PROJECTS AND  BUILD CSV ---
+def build_csv(org, pat, *, crawl_mode="project", workers=8, http_cache=True, http_cache_mb=200, incremental=True,
+              metrics=None):
+    metrics = metrics or Metrics("fields")
+    base_url = org_url(org)
 
-    def ado_get(url, params=None):
-        resp = requests.get(url, headers=headers, params=params)
-        if resp.status_code != 200:
-            raise RuntimeError(f"GET {url} failed: {resp.status_code} {resp.text}")
-        return resp.json()
+    # on-disk cache of GET responses, revalidated with ETag / Last-Modified
+    cache = None
+    if http_cache:
+        cache = ResponseCache(BASE_DIR / "outputs" / org / ".http_cache", max_bytes=http_cache_mb * 1024 * 1024)
+
+    # one pooled client for all crawl threads (shared rate budget + throttling backoff)
+    client = AdoClient(pat, pool_size=workers, cache=cache, metrics=metrics)
+    ado_get = client.get_json
 
     # --- FETCH ORG FIELDS (for type/isIdentity, etc.) ---
-    fields_url = f"{BASE_URL}/_apis/wit/fields"
-    fields_data = ado_get(fields_url, params={"api-version": API_VERSION})
+    fields_url = f"{base_url}/_apis/wit/fields"
+    with metrics.stage("fetch"):
+        fields_data = ado_get(fields_url, params={"api-version": API_VERSION})
     fields = fields_data.get("value", [])
     field_defs = {f["referenceName"]: f for f in fields}
 
     print(f"Found {len(fields)} org fields\n")
 
     # --- FETCH ALL PROJECTS ---
-    projects_url = f"{BASE_URL}/_apis/projects"
-    projects_data = ado_get(projects_url, params={"api-version": API_VERSION})
+    projects_url = f"{base_url}/_apis/projects"
+    with metrics.stage("fetch"):
+        projects_data = ado_get(projects_url, params={"api-version": API_VERSION})
     projects = projects_data.get("value", [])
 
     print(f"Found {len(projects)} projects in org\n")
 
-    # --- WRITE CSV ---
-    output_path = BASE_DIR / "outputs" / ADO_ORG  # outputs/<ORG> next to the script
+    # --- CRAWL PROJECTS (bounded concurrency) ---
+    output_path = BASE_DIR / "outputs" / org  # outputs/<ORG> next to the script
     output_path.mkdir(parents=True, exist_ok=True)
 
-    csv_file = output_path / f"ado_project_fields.csv"
-
-    with csv_file.open("w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f, delimiter=",")
-        writer.writerow([
-            "Project",
-            "ProcessName",
-            "FieldName",
-            "FieldRefName",
-            "FieldType",
-            "IsIdentity",
-            "IsCustom",
-        ])
-
-        total_rows = 0
-
-        for p in projects:
-    #    for p in projects[:3]: # speeds up testing to process only 3 projects
-
-            project_name = p.get("name")
-            project_id = p.get("id")
+    # incremental without a (usable) state = every project is new, i.e. a full crawl that leaves markers
+    state_file = output_path / ".fields_crawl_state.json"
+    state = None
+    recrawled = None  # names of the projects read this run; None = all of them
 
-            # get process name for this project (one extra call)
-            proj_detail_url = f"{BASE_URL}/_apis/projects/{project_id}"
-            proj_detail = ado_get(
-                proj_detail_url,
-                params={"api-version": API_VERSION, "includeCapabilities": "true"}
-            )
-            capabilities = proj_detail.get("capabilities", {})
-            proc_tmpl = capabilities.get("processTemplate", {})
-            process_name = proc_tmpl.get("templateName", "")
+    print(f"Crawling in {crawl_mode} mode with {workers} worker(s){' (incremental)' if incremental else ''}\n")
 
-            print(f"→ Project: {project_name} (process: {process_name})")
-
-            # collect all field referenceNames used in this project (across all WITs)
-            project_field_refs = set()
+    with metrics.stage("fetch"), ThreadPoolExecutor(max_workers=workers) as pool:
+        if incremental:
+            previous = load_crawl_state(state_file, crawl_mode)
+            crawled, state, recrawled = crawl_incremental(ado_get, pool, base_url, projects, previous, crawl_mode)
+        elif crawl_mode == "process":
+            crawled = crawl_by_process(ado_get, pool, base_url, projects)
+        else:
+            crawled = crawl_by_project(ado_get, pool, base_url, projects)
 
-            # list WITs for this project
-            wits_url = f"{BASE_URL}/{project_name}/_apis/wit/workitemtypes"
-            wits_data = ado_get(wits_url, params={"api-version": API_VERSION})
-            wits = wits_data.get("value", [])
+    # --- WRITE CSV ---
+    csv_file = output_path / f"ado_project_fields.csv"
 
-            for wit in wits:
-                wit_name = wit.get("name")
+    # summary reports are aggregated online, row by row, while the CSV is written
+    reports = FieldCatalogReports()
 
-                wit_fields_url = f"{BASE_URL}/{project_name}/_apis/wit/workitemtypes/{wit_name}/fields"
-                wit_fields_data = ado_get(wit_fields_url, params={"api-version": API_VERSION})
-                wit_fields = wit_fields_data.get("value", [])
+    # (rows are shaped, written and aggregated in one loop, so transform is part of csv_write)
+    with metrics.stage("csv_write"), csv_file.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f, delimiter=",")
+        writer.writerow(CSV_COLUMNS)
 
-                for wf in wit_fields:
-                    ref_name = wf.get("referenceName")
-                    if ref_name:
-                        project_field_refs.add(ref_name)
+        total_rows = 0
 
+        for project_name, process_name, field_refs in crawled:
             # now dump one row per (project, field)
-            for ref_name in sorted(project_field_refs):
+            for ref_name in sorted(field_refs):
                 meta = field_defs.get(ref_name, {})
                 field_name = meta.get("name", ref_name)
                 field_type = meta.get("type", "")
                 is_identity = meta.get("isIdentity", False)
                 is_custom = ref_name.startswith("Custom.")
 
-                writer.writerow([
+                row = [
                     project_name,
                     process_name,
                     field_name,
@@ -114,17 +341,121 @@ def build_csv():
                     field_type,
                     "Yes" if is_identity else "No",
                     "Yes" if is_custom else "No",
-                ])
+                ]
+                writer.writerow(row)
+                reports.add(dict(zip(CSV_COLUMNS, row)))
                 total_rows += 1
 
     print(f"\n✅ Written {total_rows} rows to: {output_path}")
 
+    # markers for the next run, saved only once the CSV is complete
+    if state is not None:
+        save_crawl_state(state_file, state)
+
+    if cache:
+        print(f"::notice::HTTP {cache.summary()}")
+
+    return reports, recrawled
+
 
 # --- CREATE EXCEL ---
-def build_excel():
-        
-    csv_path = BASE_DIR / "outputs" / ADO_ORG / "ado_project_fields.csv"
-    xlsx_path = BASE_DIR / "outputs" / ADO_ORG / "ado_project_fields.xlsx"
+# reports: aggregates already collected by build_csv(); None = collect them from the CSV
+def build_excel(org, reports=None, excel_mode="stream"):
+
+    csv_path = BASE_DIR / "outputs" / org / "ado_project_fields.csv"
+    xlsx_path = BASE_DIR / "outputs" / org / "ado_project_fields.xlsx"
+    fill_rate_path = BASE_DIR / "outputs" / org / "custom_field_fill_rate.csv"
+    if not fill_rate_path.exists():
+        fill_rate_path = None
+
+    if excel_mode == "pandas":
+        build_excel_pandas(csv_path, xlsx_path, fill_rate_path)
+    else:
+        build_excel_stream(csv_path, xlsx_path, reports, fill_rate_path)
+
+
+# Streaming workbook: rows go straight from the CSV into a write-only workbook
+# (constant memory, no DataFrame, no copy). Summary sheets come from the online
+# reports filled during the crawl, or are filled on this same pass when the crawl
+# was skipped. The CSV hash (+ report set) is stored in the workbook properties,
+# so an unchanged CSV does not regenerate the workbook at all.
+# The fill rate CSV (if any) becomes the last sheet and is part of that hash tag too.
+def build_excel_stream(csv_path, xlsx_path, reports=None, fill_rate_path=None):
+    from contextlib import closing
+    from openpyxl import Workbook, load_workbook
+
+    source_sha = file_sha256(csv_path)
+    feed_reports = reports is None
+    reports = reports or FieldCatalogReports()
+    source_tag = f"source-sha256:{source_sha};reports:{','.join(reports.sheet_names())}"
+    if fill_rate_path:
+        source_tag += f";fill-rate-sha256:{file_sha256(fill_rate_path)}"
+
+    if xlsx_path.exists():
+        # read-only workbooks keep the file open until closed (and Windows won't let it be rewritten)
+        try:
+            with closing(load_workbook(xlsx_path, read_only=True)) as existing:
+                existing_tag = existing.properties.description
+        except Exception:
+            existing_tag = None
+        if existing_tag == source_tag:
+            print(f"[build_excel] CSVs unchanged (sha256 {source_sha[:12]}), keeping {xlsx_path.name}")
+            return
+
+    print(f"[build_excel] Streaming CSV from: {csv_path}")
+
+    wb = Workbook(write_only=True)
+    wb.properties.description = source_tag
+    ws_data = wb.create_sheet("data")
+
+    rows = 0
+    with csv_path.open("r", newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+
+        # check expected columns
+        missing = [c for c in CSV_COLUMNS if c not in header]
+        if missing:
+            print(f"[build_excel] ❌ Missing expected columns: {missing}")
+            return
+
+        # 1) Raw data
+        ws_data.append(header)
+        for row in reader:
+            ws_data.append([v if v != "" else None for v in row])
+            if feed_reports:
+                reports.add(dict(zip(header, row)))
+            rows += 1
+
+    print(f"[build_excel] Rows: {rows}")
+
+    # 2..n) Aggregate reports
+    for sheet_name, header_row, report_rows in reports.sheets():
+        ws = wb.create_sheet(sheet_name)
+        ws.append(header_row)
+        for r in report_rows:
+            ws.append(r)
+        print(f"[build_excel] Sheet {sheet_name}: {len(report_rows)} rows")
+
+    # n+1) Fill rate per (project, custom field), numbers as numbers
+    if fill_rate_path:
+        ws = wb.create_sheet(FILL_RATE_SHEET)
+        with fill_rate_path.open("r", newline="", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            ws.append(next(reader))
+            fill_rows = 0
+            for project, ref, name, total, filled, rate in reader:
+                ws.append([project, ref, name, int(total), int(filled), float(rate) if rate else None])
+                fill_rows += 1
+        print(f"[build_excel] Sheet {FILL_RATE_SHEET}: {fill_rows} rows")
+
+    wb.save(xlsx_path)
+    print(f"✅ Written Excel workbook: {xlsx_path}")
+
+
+# Original pandas implementation (EXCEL_MODE=pandas)
+def build_excel_pandas(csv_path, xlsx_path, fill_rate_path=None):
+    import pandas as pd
 
     df = pd.read_csv(csv_path, sep=",")
 
@@ -176,26 +507,172 @@ def build_excel():
         proj_custom_counts.to_excel(writer, sheet_name="projects_custom_fields", index=False)
         proc_proj_counts.to_excel(writer, sheet_name="process_projects", index=False)
         field_proj_counts.to_excel(writer, sheet_name="fields_project_counts", index=False)
+        if fill_rate_path:
+            pd.read_csv(fill_rate_path, sep=",").to_excel(writer, sheet_name=FILL_RATE_SHEET, index=False)
 
     print(f"✅ Written Excel workbook: {xlsx_path}")
 
 
-# --- MAIN ---
-BASE_DIR = Path(__file__).resolve().parent  # folder where this script lives
-
-# Config
-ADO_ORG = os.getenv("ADO_ORG")
-ADO_PAT = os.getenv("ADO_PAT")
-
-if not ADO_ORG or not ADO_PAT:
-    print("❌ Error: Environment variables ADO_ORG or ADO_PAT are missing.")
-    exit(1)
+# --- CATALOGUE ---
+# Stages: crawl (ADO -> CSV + online reports, history store, fill rate), excel (CSVs -> workbook) and
+# clusters (CSV -> process_clusters.csv). excel / clusters are skipped when their inputs hash the same
+# as at their last run (outputs/<ORG>/.dag_fields.json). stages=("excel",) skips the crawl and only
+# rebuilds the workbook.
+def catalog_fields(org, pat, *, crawl_mode="project", workers=8, http_cache=True, http_cache_mb=200,
+                   excel_mode="stream", history=True, fill_rate=True, fill_rate_full_days=7, incremental=True,
+                   cluster_threshold=DEFAULT_CLUSTER_THRESHOLD, stages=None, metrics=None):
+    metrics = metrics or Metrics("fields")
+    output_path = BASE_DIR / "outputs" / org
+    output_path.mkdir(parents=True, exist_ok=True)
+    csv_path = output_path / "ado_project_fields.csv"
+    fill_rate_path = output_path / "custom_field_fill_rate.csv"
+    fill_rate_state_path = output_path / ".fill_rate_state.json"
+
+    # aggregates collected during the crawl, handed to the workbook (None = collect them from the CSV)
+    reports = {}
+
+    def crawl():
+        # Get data from projects and dumpt it to csv as kind of db
+        reports["crawl"], recrawled = build_csv(org, pat, crawl_mode=crawl_mode, workers=workers,
+                                                http_cache=http_cache, http_cache_mb=http_cache_mb,
+                                                incremental=incremental, metrics=metrics)
+
+        # Temporal SQLite store (query with ado/history_store.py)
+        if history:
+            history_db = db_path_for(org, "fields")
+            with metrics.stage("history"):
+                recorded = record_csv(history_db, "project_fields", csv_path)
+            print(f"::notice::Recorded {recorded} project fields in history store {history_db}")
+
+        # Custom field fill rate, counted server-side by Analytics: for the re-crawled projects only,
+        # all of them after a full crawl and every fill_rate_full_days days.
+        # Needs the PAT's Analytics (read) scope; without it (or with Analytics unreachable) the
+        # previous report is kept - the field CSV is already written.
+        if fill_rate:
+            with metrics.stage("fill_rate"):
+                now = datetime.now(timezone.utc)
+                reason = full_count_reason(load_fill_rate_state(fill_rate_state_path), recrawled, now,
+                                           fill_rate_full_days)
+                if reason:
+                    print(f"::notice::Fill rate: counting every project ({reason})")
+                try:
+                    collect_fill_rates(org, pat, csv_path, fill_rate_path, projects=None if reason else recrawled,
+                                       workers=workers, metrics=metrics)
+                    if reason:
+                        save_fill_rate_state(fill_rate_state_path, now)
+                except (RuntimeError, requests.RequestException) as e:
+                    print(f"::warning::Fill rate report not updated: {e}")
+
+    # Create excel with original data on the first sheet,
+    #   and aggregate reports as additional sheets
+    def excel():
+        with metrics.stage("excel_write"):
+            build_excel(org, reports.get("crawl"), excel_mode)
+
+    # Process consolidation candidates from the project × field incidence index
+    def clusters():
+        from field_index import write_cluster_report
+
+        with metrics.stage("clusters"):
+            write_cluster_report(csv_path, clusters_path, cluster_threshold)
+
+    clusters_path = output_path / "process_clusters.csv"
+    dag = Dag("fields", output_path)
+    dag.add("crawl", crawl, outputs=[csv_path, fill_rate_path], always=True)
+    dag.add("excel", excel, inputs=[csv_path, fill_rate_path], outputs=[output_path / "ado_project_fields.xlsx"],
+            params={"excel_mode": excel_mode})
+    dag.add("clusters", clusters, inputs=[csv_path], outputs=[clusters_path], params={"threshold": cluster_threshold})
+    results = dag.run(only=stages)
+
+    failed = {name: outcome for name, outcome in results.items() if outcome not in (OK, UNCHANGED)}
+    if failed:
+        raise RuntimeError(f"Field catalogue stage(s) failed: {failed}")
+
+
+# --- CONFIG ---
+# catalog_fields() keyword arguments from the environment (exits on invalid values)
+def config_from_env():
+    ado_org = os.getenv("ADO_ORG")
+    ado_pat = os.getenv("ADO_PAT")
+
+    if not ado_org or not ado_pat:
+        print("❌ Error: Environment variables ADO_ORG or ADO_PAT are missing.")
+        exit(1)
+
+    # Parallel HTTP calls during the crawl (1 = sequential)
+    workers_str = os.getenv("CRAWL_WORKERS", "8")
+    try:
+        workers = max(1, int(workers_str))
+    except ValueError:
+        print(f"❌ Error: Invalid CRAWL_WORKERS: {workers_str}")
+        exit(1)
+
+    # project: process + fields looked up per project/WIT (one call per WIT per project)
+    # process: WIT definitions fetched once per process and reused for all its projects
+    crawl_mode = os.getenv("FIELDS_CRAWL_MODE", "project")
+    if crawl_mode not in ("project", "process"):
+        print(f"❌ Error: Invalid FIELDS_CRAWL_MODE: {crawl_mode}")
+        exit(1)
+
+    # Persistent HTTP cache under outputs/<ORG>/.http_cache (ADO_HTTP_CACHE=0 disables)
+    cache_mb_str = os.getenv("ADO_HTTP_CACHE_MB", "200")
+    try:
+        http_cache_mb = int(cache_mb_str)
+    except ValueError:
+        print(f"❌ Error: Invalid ADO_HTTP_CACHE_MB: {cache_mb_str}")
+        exit(1)
+
+    # stream: write-only workbook straight from the CSV, skipped if the CSV is unchanged (default)
+    # pandas: original DataFrame + ExcelWriter implementation
+    excel_mode = os.getenv("EXCEL_MODE", "stream")
+    if excel_mode not in ("stream", "pandas"):
+        print(f"❌ Error: Invalid EXCEL_MODE: {excel_mode}")
+        exit(1)
+
+    # Fill rates are counted for the re-crawled projects only, for all of them every FIELDS_FILL_RATE_FULL_DAYS days
+    fill_rate_days_str = os.getenv("FIELDS_FILL_RATE_FULL_DAYS", "7")
+    try:
+        fill_rate_full_days = float(fill_rate_days_str)
+    except ValueError:
+        print(f"❌ Error: Invalid FIELDS_FILL_RATE_FULL_DAYS: {fill_rate_days_str}")
+        exit(1)
+
+    # Jaccard similarity of their field sets from which two processes count as consolidation candidates
+    threshold_str = os.getenv("FIELDS_CLUSTER_THRESHOLD", str(DEFAULT_CLUSTER_THRESHOLD))
+    try:
+        cluster_threshold = float(threshold_str)
+        if not 0 < cluster_threshold <= 1:
+            raise ValueError
+    except ValueError:
+        print(f"❌ Error: Invalid FIELDS_CLUSTER_THRESHOLD: {threshold_str}")
+        exit(1)
+
+    return {
+        "org": ado_org,
+        "pat": ado_pat,
+        "crawl_mode": crawl_mode,
+        "workers": workers,
+        "http_cache": os.getenv("ADO_HTTP_CACHE", "1") != "0",
+        "http_cache_mb": http_cache_mb,
+        "excel_mode": excel_mode,
+        "history": os.getenv("ADO_HISTORY", "1") != "0",  # ADO_HISTORY=0 disables
+        "fill_rate": os.getenv("FIELDS_FILL_RATE", "1") != "0",  # FIELDS_FILL_RATE=0 disables
+        "fill_rate_full_days": fill_rate_full_days,
+        "incremental": os.getenv("FIELDS_INCREMENTAL", "1") != "0",  # FIELDS_INCREMENTAL=0 = full crawl
+        "cluster_threshold": cluster_threshold,
+    }
 
-# Get data from projects and dumpt it to csv as kind of db
-BUILD_CSV = True # takes several minutes, set to FALSE when testing other parts
-if BUILD_CSV:
-    build_csv()
 
-# Create excel with original data on the first sheet, 
-#   and aggregate reports as additional sheets
-build_excel()
+# --- MAIN ---
+def main():
+    config = config_from_env()
+    metrics = Metrics("fields")
+    try:
+        catalog_fields(**config, metrics=metrics)
+    finally:
+        # Per-endpoint HTTP stats + stage timings (JSON artifact + GitHub step summary)
+        metrics.write(BASE_DIR / "outputs" / config["org"])
+
+
+if __name__ == "__main__":
+    main()
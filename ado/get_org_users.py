@@ -1,88 +1,43 @@
-import requests
-import base64
 import os
-from datetime import datetime
+from datetime import datetime, timezone
 import csv
+import shutil
+from collections import Counter
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
-BASE_DIR = Path(__file__).resolve().parent  # folder where this script lives
-
-# --- CONFIG ---
-ADO_ORG = os.getenv("ADO_ORG")
-ADO_PAT = os.getenv("ADO_PAT")
-
-if not ADO_ORG or not ADO_PAT:
-    print("❌ Error: Environment variables ADO_ORG_URL or ADO_PAT are missing.")
-    exit(1)
-
-# --- AUTH ---
-encoded_pat = base64.b64encode(f":{ADO_PAT}".encode()).decode()
-headers = {
-    'Authorization': f'Basic {encoded_pat}',
-    'Content-Type': 'application/json'
-}
-
-# --- HELPER: Date Math ---
-def calculate_inactive_days(last_access_str, created_str):
-    # Parse ignoring the bogus 0001-01-01 date
-    def parse_dt(s):
-        if not s or s.startswith("0001-01-01"):
-            return None
-        return datetime.fromisoformat(s.replace("Z", "+00:00"))
-
-    last_dt = parse_dt(last_access_str)
-    created_dt = parse_dt(created_str)
-
-    # Use whichever is newer
-    if last_dt and created_dt:
-        ref_dt = max(last_dt, created_dt)
-    else:
-        ref_dt = last_dt or created_dt
+from ado_client import AdoClient, licensing_url
+from demotion_rules import load_rules, rules_sha256
+from hashing import file_sha256
+from history_store import db_path_for, record_csv
+from group_exemptions import resolve_exemptions
+from metrics import Metrics
+from user_audit import WATERMARK_OVERLAP, load_state, parse_dt, read_audit, resync_reason, save_state, to_iso
+from user_snapshot import DAYS_COLUMN, SNAPSHOT_COLUMNS, canonical, scanned_at, with_days_inactive, write_meta
 
-    # With your data, this should never happen anymore
-    if not ref_dt:
-        # fallback just in case Microsoft invents another surprise
-        return 0
-
-    now = datetime.now(ref_dt.tzinfo)
-    return (now - ref_dt).days
-
-
-print("\n--- Scanning Users ---")
-
-# API: User Entitlements (Contains License + Login Data)
-# LICENSING DOMAIN: Change 'dev.azure.com' to 'vsaex.dev.azure.com'
-LICENSING_ORG_URL = f"https://vsaex.dev.azure.com/{ADO_ORG}"
+BASE_DIR = Path(__file__).resolve().parent  # folder where this script lives
 
-url_users = f"{LICENSING_ORG_URL}/_apis/userentitlements?top=30000&api-version=7.1-preview.2"
-all_users = []
+# page size for the top/skip fallback of stream mode
+PAGE_SIZE = 1000
 
-res = requests.get(url_users, headers=headers)
-data = res.json()
+# single-entitlement GETs in flight during an incremental refresh
+REFRESH_WORKERS = 8
 
-total = data.get("totalCount") or 0
-items_count = len(data.get("items", []))
+FIELDNAMES = SNAPSHOT_COLUMNS
 
-print(f"totalCount from API: {total}")
-print(f"items on this page: {items_count}")
 
-if total != items_count:
-    print(f"::error::Mismatch between totalCount ({total}) and items on this page ({items_count}) – expected them to match with top=30000")
-else:
-    print("::notice::User entitlement counts match totalCount and items")
-    
-# Loop through the items in this page
-for item in data.get('items', []):
+# --- HELPER: entitlement JSON -> CSV row ---
+def to_row(item):
     user = item.get('user', {})
     access = item.get('accessLevel', {})
 
     email = user.get('principalName')
     license_type = access.get('licenseDisplayName')
     license_source = access.get('licensingSource') # 'account' vs 'msdn'
-    last_login_raw = item.get('lastAccessedDate')    
+    last_login_raw = item.get('lastAccessedDate')
     created_raw    = item.get("dateCreated")        # entitlement creation
 
-    all_users.append({
+    return {
         'UserEntitlementId': item.get('id'),          # ← PATCH target
         'Email': email,
         'License': license_type,
@@ -91,37 +46,516 @@ for item in data.get('items', []):
         'Created': created_raw,
         'Last Login Date': last_login_raw.split('T')[0] if last_login_raw else '',
         'Created Date': created_raw.split('T')[0] if created_raw else '',
-        'Days Inactive': calculate_inactive_days(last_login_raw, created_raw)
-    })
+    }
+
+
+# --- HELPER: entitlement JSON -> typed columns ---
+# Columnar counterpart of to_row(): one pass to pull the fields out of the JSON, then
+# vectorized column building for the whole batch. The repetitive columns are categorical
+# (License / Source / the *Date columns); IDs, e-mails and timestamps are unique per user and
+# stay plain Python strings.
+# Blank values are NaN, as in pd.read_csv(users_latest.csv) - set explicitly rather than via
+# astype("str"), which turns them into "nan" / "None" on pandas 2.
+def entitlements_to_frame(items):
+    import numpy as np
+    import pandas as pd
+
+    def text(values):
+        return pd.Series([v or np.nan for v in values], dtype=object)
+
+    users = [item.get('user') or {} for item in items]
+    access = [item.get('accessLevel') or {} for item in items]
+    last_raw = text(item.get('lastAccessedDate') for item in items)
+    created_raw = text(item.get('dateCreated') for item in items)
+
+    # ISO timestamps: the part before "T" is always the first 10 characters
+    def date_part(raw):
+        return raw.str.slice(0, 10).astype("category")
+
+    return pd.DataFrame({
+        'Email': text(u.get('principalName') for u in users),
+        'UserEntitlementId': text(item.get('id') for item in items),  # ← PATCH target
+        'License': pd.Series([a.get('licenseDisplayName') for a in access], dtype="category"),
+        'Source': pd.Series([a.get('licensingSource') for a in access], dtype="category"),  # 'account' vs 'msdn'
+        'Last Login': last_raw,
+        'Created': created_raw,
+        'Last Login Date': date_part(last_raw),
+        'Created Date': date_part(created_raw),
+    }, columns=FIELDNAMES)
+
+
+# Same bytes as csv.DictWriter over to_row() rows
+def write_frame_csv(df, f, header=True):
+    df.to_csv(f, index=False, header=header, lineterminator="\r\n")
+
+
+# --- FETCH: single call ---
+# Relies on top=30000 returning everything at once (see README API quirk)
+def fetch_single(client, licensing_org_url, metrics):
+    url_users = f"{licensing_org_url}/_apis/userentitlements?top=30000&api-version=7.1-preview.2"
+
+    with metrics.stage("fetch"):
+        res = client.get(url_users)
+        data = res.json()
+
+    total = data.get("totalCount") or 0
+    items_count = len(data.get("items", []))
+
+    print(f"totalCount from API: {total}")
+    print(f"items on this page: {items_count}")
+
+    if total != items_count:
+        print(f"::error::Mismatch between totalCount ({total}) and items on this page ({items_count}) – expected them to match with top=30000")
+    else:
+        print("::notice::User entitlement counts match totalCount and items")
+
+    return data.get('items', [])
+
+
+# --- FETCH: paged stream ---
+# Yields pages (lists of entitlement items) so callers never hold the whole org.
+# Only entitlement IDs are kept in memory, to dedupe across the fallback below.
+def iter_entitlement_pages(client, licensing_org_url, stats):
+    url_users = f"{licensing_org_url}/_apis/userentitlements"
+    seen = set()
+
+    def fresh(items):
+        page = [i for i in items if i.get("id") not in seen]
+        seen.update(i.get("id") for i in page)
+        return page
+
+    # 1) search endpoint with continuation tokens
+    token = None
+    while True:
+        params = {"api-version": "7.1-preview.3"}
+        if token:
+            params["continuationToken"] = token
+        data = client.get_json(url_users, params=params)
+
+        stats["total"] = data.get("totalCount") or stats["total"]
+        page = fresh(data.get("members") or data.get("items") or [])
+        stats["pages"] += 1
+        if page:
+            yield page
+
+        token = data.get("continuationToken")
+        if not token or not page:
+            break
+
+    # 2) quirk: continuationToken is often '' although totalCount > what we got.
+    #    Fall back to top/skip paging on the older api-version and skip IDs already written.
+    if stats["total"] and len(seen) < stats["total"]:
+        print(f"::warning::continuationToken ended after {len(seen)} of {stats['total']} entitlements, falling back to top/skip paging")
+        skip = 0
+        while len(seen) < stats["total"]:
+            data = client.get_json(url_users, params={"api-version": "7.1-preview.2", "top": PAGE_SIZE, "skip": skip})
+            items = data.get("items") or []
+            if not items:
+                break
+            skip += len(items)
+            stats["pages"] += 1
+            page = fresh(items)
+            if page:
+                yield page
+
+
+# Write rows page by page into one .partial file per first character of the UserEntitlementId,
+# then sort each bucket on its own and concatenate them into users_latest.csv.partial: the
+# snapshot comes out in canonical order (as in single mode) while only one bucket is ever held
+# in memory. Only replace users_latest.csv when the run is complete, so a crashed or short run
+# never clobbers the last good snapshot.
+def stream_to_csv(client, licensing_org_url, csv_file, transform="columnar"):
+    stats = {"total": 0, "pages": 0}
+    written = 0
+    partial = csv_file.with_name(csv_file.name + ".partial")
+    buckets = {}  # first ID character -> (path, file, DictWriter)
+
+    def bucket(key):
+        if key not in buckets:
+            path = csv_file.with_name(f"{csv_file.stem}.{key.encode().hex() or 'blank'}.partial")
+            f = path.open("w", newline="", encoding="utf-8")
+            buckets[key] = (path, f, csv.DictWriter(f, fieldnames=FIELDNAMES))
+        return buckets[key]
+
+    try:
+        for page in iter_entitlement_pages(client, licensing_org_url, stats):
+            if transform == "columnar":
+                frame = entitlements_to_frame(page)
+                keys = frame["UserEntitlementId"].fillna("").str.slice(0, 1)
+                for key, part in frame.groupby(keys, sort=False):
+                    write_frame_csv(part, bucket(key)[1], header=False)
+            else:
+                for row in map(to_row, page):
+                    bucket((row["UserEntitlementId"] or "")[:1])[2].writerow(row)
+            written += len(page)
+            print(f"page {stats['pages']}: {written} entitlements written")
+    finally:
+        for _, f, _ in buckets.values():
+            f.close()
+
+    print(f"totalCount from API: {stats['total']}")
+
+    if stats["total"] and written != stats["total"]:
+        for path, _, _ in buckets.values():
+            path.unlink()
+        raise RuntimeError(f"Mismatch between totalCount ({stats['total']}) and entitlements fetched ({written}) – keeping previous {csv_file.name}")
+
+    id_col = FIELDNAMES.index("UserEntitlementId")
+    with partial.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(FIELDNAMES)
+        for key in sorted(buckets):
+            path = buckets[key][0]
+            with path.open("r", newline="", encoding="utf-8") as b:
+                writer.writerows(sorted(csv.reader(b), key=lambda r: r[id_col]))
+            path.unlink()
+
+    partial.replace(csv_file)
+    return written
+
+
+# --- FETCH: incremental (audit log) ---
+# One entitlement by ID; None once it is gone (user removed from the org)
+def fetch_entitlement(client, licensing_org_url, entitlement_id):
+    url = f"{licensing_org_url}/_apis/userentitlements/{entitlement_id}"
+    resp = client.get(url, params={"api-version": "7.1-preview.3"})
+    if resp.status_code == 404:
+        return None
+    if resp.status_code != 200:
+        raise RuntimeError(f"GET {url} failed: {resp.status_code} {resp.text}")
+    return resp.json()
+
+
+# Entitlements of a principal name not in the snapshot yet (new users named by e-mail in the audit log)
+# (OData string literal: a quote in the name, e.g. o'brien@..., is doubled)
+def find_entitlements(client, licensing_org_url, name):
+    literal = name.replace("'", "''")
+    data = client.get_json(f"{licensing_org_url}/_apis/userentitlements",
+                           params={"$filter": f"name eq '{literal}'", "api-version": "7.1-preview.3"})
+    items = data.get("members") or data.get("items") or []
+    return [i for i in items if str((i.get("user") or {}).get("principalName", "")).lower() == name]
+
+
+def count_entitlements(client, licensing_org_url):
+    data = client.get_json(f"{licensing_org_url}/_apis/userentitlements",
+                           params={"top": 1, "api-version": "7.1-preview.2"})
+    return data.get("totalCount") or 0
+
+
+# Previous snapshot + licensing events since the watermark -> new snapshot (canonical order), without
+# re-pulling the org: only the users named in the audit log are re-fetched, so the cost follows churn.
+# The audit log has no logins, so Last Login of everyone else may lag until the next full resync; the
+# demotion step re-reads each candidate right before its PATCH, so that can't demote an active user.
+# Returns None when the result can't be trusted (events without a user, count mismatch); the caller
+# then falls back to a full resync.
+def refresh_from_audit(client, org, licensing_org_url, csv_file, state, now, metrics):
+    import pandas as pd
+
+    since = parse_dt(state["watermark"]) - WATERMARK_OVERLAP
+    with metrics.stage("audit"):
+        try:
+            delta = read_audit(client, org, since, now)
+        except RuntimeError as e:
+            print(f"::warning::Audit log not readable (PAT needs 'Read audit log'), full resync instead: {e}")
+            return None
+    if delta.resync:
+        print(f"::notice::Full resync instead: {delta.resync}")
+        return None
+
+    prev = pd.read_csv(csv_file, dtype=str)
+    ids = prev["UserEntitlementId"]
+    known = dict(zip(prev["Email"].str.lower(), ids))
+    named = delta.ids | {known[n] for n in delta.names if n in known}
+    unknown_names = sorted(n for n in delta.names if n not in known)
+    refetch = sorted(named)
+
+    with metrics.stage("refetch"), ThreadPoolExecutor(max_workers=REFRESH_WORKERS) as pool:
+        items = [i for i in pool.map(lambda eid: fetch_entitlement(client, licensing_org_url, eid), refetch) if i]
+        for found in pool.map(lambda n: find_entitlements(client, licensing_org_url, n), unknown_names):
+            items.extend(found)
+
+    with metrics.stage("transform"):
+        fresh = entitlements_to_frame(items)
+        rest = prev[~ids.isin(set(refetch) | set(fresh["UserEntitlementId"]))]
+        snapshot = canonical(pd.concat([rest, fresh], ignore_index=True).drop_duplicates("UserEntitlementId", keep="last"))
+
+    total = count_entitlements(client, licensing_org_url)
+    print(f"::notice::Audit log since {to_iso(since)}: {delta.events} licensing event(s); re-fetched "
+          f"{len(refetch)} users, {len(unknown_names)} looked up by name")
+    if total and len(snapshot) != total:
+        print(f"::warning::Incremental snapshot has {len(snapshot)} users, totalCount is {total} – full resync instead")
+        return None
+    return snapshot
+
+
+# --- SNAPSHOT AS A TABLE ---
+# Same frame pd.read_csv(users_latest.csv) would give (blanks as NaN), without the CSV round trip
+def rows_to_frame(rows):
+    import pandas as pd
+    import numpy as np
+
+    df = pd.DataFrame(rows, columns=FIELDNAMES)
+    return df.replace("", np.nan)
+
+
+# --- SCAN ---
+# Fetch all entitlements of an org into outputs/<ORG>/users_latest.csv (canonical order, scan time
+# in users_latest.meta.json), then write the changefeed vs the previous snapshot and record the history store.
+# With return_frame=True the snapshot comes back as a DataFrame (Days Inactive included) when it is
+# already in memory (single mode; None in stream mode), so a caller chaining into the demotion step
+# can skip re-reading the CSV.
+def scan_users(org, pat, *, fetch_mode="single", transform="columnar", refresh="full", full_resync_days=7,
+               rules=None, history=True, metrics=None, graph_cache_ttl_hours=24, return_frame=False):
+    metrics = metrics or Metrics("users")
+    client = AdoClient(pat, metrics=metrics)
+    rules = rules or load_rules()
+
+    print("\n--- Scanning Users ---")
+
+    # API: User Entitlements (Contains License + Login Data)
+    # LICENSING DOMAIN: Change 'dev.azure.com' to 'vsaex.dev.azure.com'
+    licensing_org_url = licensing_url(org)
+
+    # --- OUTPUT ---
+    output_path = BASE_DIR / "outputs" / org  # outputs/<ORG> next to the script
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    csv_file = output_path / f"users_latest.csv"
+
+    # keep a copy of the previous snapshot until the new one is written, for the changefeed
+    # (a file, not a DataFrame: the diff streams both CSVs, so stream mode stays bounded in memory)
+    prev_copy = None
+    prev_sha = None
+    prev_scanned = None
+    if csv_file.exists():
+        prev_sha = file_sha256(csv_file)
+        prev_scanned = scanned_at(csv_file)
+        with csv_file.open("r", newline="", encoding="utf-8") as f:
+            prev_header = next(csv.reader(f), [])
+
+        # Days Inactive as of the previous scan (older snapshots still carry the column)
+        if prev_scanned or DAYS_COLUMN in prev_header:
+            prev_copy = csv_file.with_name(csv_file.name + ".previous.partial")
+            shutil.copyfile(csv_file, prev_copy)
+        else:
+            print(f"::warning::No scan time recorded for the previous {csv_file.name}, skipping the changefeed")
+
+    # --- INCREMENTAL REFRESH ---
+    # Apply the audit log since the watermark to the previous snapshot; full resync (fetch_mode below)
+    # on the first run, every full_resync_days, or whenever the audit log can't be applied
+    audit_state_file = output_path / ".users_audit_state.json"
+    audit_state = load_state(audit_state_file)
+    scanned = datetime.now(timezone.utc)
+    snapshot = None
+    if refresh == "incremental":
+        reason = resync_reason(audit_state, prev_sha, scanned, full_resync_days)
+        if reason:
+            print(f"::notice::Full resync: {reason}")
+        else:
+            snapshot = refresh_from_audit(client, org, licensing_org_url, csv_file, audit_state, scanned, metrics)
+    full_resync = snapshot is None
+
+    if snapshot is not None:
+        with metrics.stage("csv_write"), csv_file.open("w", newline="", encoding="utf-8") as f:
+            write_frame_csv(snapshot, f)
+        user_count = len(snapshot)
+
+    elif fetch_mode == "stream":
+        # Bucketed by UserEntitlementId while paging, so the CSV comes out in canonical order
+        # (fetch, transform and CSV write are interleaved page by page, so timed as one stage)
+        with metrics.stage("fetch_transform_csv_write"):
+            user_count = stream_to_csv(client, licensing_org_url, csv_file, transform)
+        print(f"::notice::Scan Complete. Found {user_count} total users.")
+
+    elif transform == "columnar":
+        items = fetch_single(client, licensing_org_url, metrics)
+
+        # --- RESULTS ---
+        print(f"::notice::Scan Complete. Found {len(items)} total users.")
+
+        # Typed columns, canonical order (by UserEntitlementId)
+        with metrics.stage("transform"):
+            snapshot = canonical(entitlements_to_frame(items))
+        del items
+
+        # --- WRITE CSV ---
+        with metrics.stage("csv_write"), csv_file.open("w", newline="", encoding="utf-8") as f:
+            write_frame_csv(snapshot, f)
+
+        user_count = len(snapshot)
+
+    else:
+        items = fetch_single(client, licensing_org_url, metrics)
+
+        # --- RESULTS ---
+        print(f"::notice::Scan Complete. Found {len(items)} total users.")
+
+        # Loop through the items, canonical order (by UserEntitlementId)
+        with metrics.stage("transform"):
+            all_users = [to_row(item) for item in items]
+            all_users_sorted = sorted(all_users, key=lambda u: u["UserEntitlementId"] or "")
+
+        # --- WRITE CSV ---
+        with metrics.stage("csv_write"), csv_file.open("w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
+            writer.writeheader()
+            writer.writerows(all_users_sorted)
+
+        user_count = len(all_users)
+        if return_frame:
+            with metrics.stage("transform"):
+                snapshot = rows_to_frame(all_users_sorted)
+
+    write_meta(csv_file, scanned)
+    save_state(audit_state_file, watermark=scanned,
+               full_resync=scanned if full_resync else parse_dt(audit_state["full_resync"]),
+               snapshot_sha=file_sha256(csv_file))
+    if snapshot is not None:
+        snapshot = with_days_inactive(snapshot, scanned)
+
+    print(f"::notice::Written {user_count} users to {csv_file}")
+
+    # --- CHANGEFEED ---
+    # Delta vs the previous snapshot, so downstream steps can work on churn instead of the whole org
+    changes_file = output_path / "users_changes.json"
+    changes = None
+    if prev_copy is not None:
+        from user_changes import compute_changes, write_changes
+
+        try:
+            with metrics.stage("changefeed"):
+                changes = compute_changes(prev_copy, prev_scanned, csv_file, scanned, rules)
+                write_changes(changes_file, changes, prev_sha, file_sha256(csv_file), rules_sha256(rules))
+        except ValueError as e:
+            print(f"::warning::Skipping the changefeed: {e}")
+        finally:
+            prev_copy.unlink()
+
+    if changes is not None:
+        summary = ", ".join(f"{k}: {v}" for k, v in Counter(c["Change"] for c in changes).items()) or "no changes"
+        print(f"::notice::Changes since previous snapshot – {summary}")
+        print(f"::notice::Written changefeed to {changes_file}")
+    else:
+        # nothing to diff against; consumers fall back to a full rebuild
+        changes_file.unlink(missing_ok=True)
+
+    # --- ENRICHMENT: EXEMPT GROUPS ---
+    # Members of the rules' exempt_groups (service accounts, "License Keepers", ...) via Graph,
+    # expanded per group rather than looked up per user; the demotion step skips them.
+    exemptions_file = output_path / "users_exemptions.json"
+    exempt_groups = rules["exempt_groups"]
+    if exempt_groups:
+        if snapshot is not None:
+            emails = snapshot["Email"].dropna()
+        else:
+            with csv_file.open("r", newline="", encoding="utf-8") as f:
+                emails = [row["Email"] for row in csv.DictReader(f)]
+        with metrics.stage("enrich"):
+            try:
+                exempt_count = resolve_exemptions(
+                    org, pat, exempt_groups, emails, out_json=exemptions_file,
+                    cache_path=output_path / ".graph_cache.json", ttl_hours=graph_cache_ttl_hours, metrics=metrics,
+                )
+                print(f"::notice::Written {exempt_count} group-exempt users to {exemptions_file}")
+            except RuntimeError as e:
+                # previous file (if any) stays; the demotion step refuses to run without one
+                print(f"::warning::Exempt groups not resolved, keeping previous {exemptions_file.name}: {e}")
+    else:
+        exemptions_file.unlink(missing_ok=True)
+
+    # --- HISTORY ---
+    # Temporal SQLite store (query with ado/history_store.py)
+    if history:
+        history_db = db_path_for(org, "users")
+        with metrics.stage("history"):
+            recorded = record_csv(history_db, "entitlements", csv_file)
+        print(f"::notice::Recorded {recorded} entitlements in history store {history_db}")
+
+    return snapshot if return_frame else None
+
+
+# --- CONFIG ---
+# scan_users() keyword arguments from the environment (exits on invalid values)
+def config_from_env():
+    ado_org = os.getenv("ADO_ORG")
+    ado_pat = os.getenv("ADO_PAT")
+
+    if not ado_org or not ado_pat:
+        print("❌ Error: Environment variables ADO_ORG_URL or ADO_PAT are missing.")
+        exit(1)
+
+    # single: one userentitlements?top=30000 call, sorted CSV (default)
+    # stream: page through the search endpoint, append rows to the CSV as pages arrive
+    fetch_mode = os.getenv("USERS_FETCH_MODE", "single")
+    if fetch_mode not in ("single", "stream"):
+        print(f"❌ Error: Invalid USERS_FETCH_MODE: {fetch_mode}")
+        exit(1)
+
+    # columnar: typed columns + vectorized Days Inactive (default)
+    # rows: one dict per user via to_row()
+    transform = os.getenv("USERS_TRANSFORM", "columnar")
+    if transform not in ("columnar", "rows"):
+        print(f"❌ Error: Invalid USERS_TRANSFORM: {transform}")
+        exit(1)
+
+    # full: pull every entitlement (default)
+    # incremental: apply the audit log since the last run to the previous snapshot,
+    #              with a full resync every USERS_FULL_RESYNC_DAYS days
+    refresh = os.getenv("USERS_REFRESH", "full")
+    if refresh not in ("full", "incremental"):
+        print(f"❌ Error: Invalid USERS_REFRESH: {refresh}")
+        exit(1)
 
-# --- RESULTS ---
-print(f"::notice::Scan Complete. Found {len(all_users)} total users.")
+    resync_str = os.getenv("USERS_FULL_RESYNC_DAYS", "7")
+    try:
+        full_resync_days = float(resync_str)
+    except ValueError:
+        print(f"❌ Error: Invalid USERS_FULL_RESYNC_DAYS: {resync_str}")
+        exit(1)
 
-# Sort by Days Inactive (descending)
-all_users_sorted = sorted(all_users, key=lambda u: u["Days Inactive"], reverse=True)
+    # threshold used to detect users newly crossing it in the changefeed (same as the demotion step)
+    threshold_env = os.getenv("DEMOTE_THRESHOLD_DAYS")
+    try:
+        threshold_days = int(threshold_env) if threshold_env else None
+    except ValueError:
+        print(f"❌ Error: Invalid DEMOTE_THRESHOLD_DAYS: {threshold_env}")
+        exit(1)
+    rules = load_rules(Path(os.getenv("DEMOTE_RULES_FILE", BASE_DIR / "demotion_rules.json")), threshold_days)
 
+    # Graph group / membership / subject cache lifetime for the exempt_groups enrichment
+    ttl_str = os.getenv("GRAPH_CACHE_TTL_HOURS", "24")
+    try:
+        graph_cache_ttl_hours = float(ttl_str)
+    except ValueError:
+        print(f"❌ Error: Invalid GRAPH_CACHE_TTL_HOURS: {ttl_str}")
+        exit(1)
 
-# --- WRITE CSV ---
-output_path = BASE_DIR / "outputs" / ADO_ORG  # outputs/<ORG> next to the script
-output_path.mkdir(parents=True, exist_ok=True)
+    return {
+        "org": ado_org,
+        "pat": ado_pat,
+        "fetch_mode": fetch_mode,
+        "transform": transform,
+        "refresh": refresh,
+        "full_resync_days": full_resync_days,
+        "rules": rules,
+        "graph_cache_ttl_hours": graph_cache_ttl_hours,
+        "history": os.getenv("ADO_HISTORY", "1") != "0",  # ADO_HISTORY=0 disables
+    }
 
-csv_file = output_path / f"users_latest.csv"
 
-fieldnames = [
-    "Email",
-    "UserEntitlementId",
-    "License",
-    "Source",
-    "Last Login",
-    "Created",
-    "Last Login Date",
-    "Created Date",
-    "Days Inactive",
-]
+# --- MAIN ---
+def main():
+    config = config_from_env()
+    metrics = Metrics("users")
+    try:
+        scan_users(**config, metrics=metrics)
+    except RuntimeError as e:
+        print(f"::error::{e}")
+        exit(1)
+    finally:
+        # Per-endpoint HTTP stats + stage timings (JSON artifact + GitHub step summary)
+        metrics.write(BASE_DIR / "outputs" / config["org"])
 
-with csv_file.open("w", newline="", encoding="utf-8") as f:
-    writer = csv.DictWriter(f, fieldnames=fieldnames)
-    writer.writeheader()
-    writer.writerows(all_users_sorted)
 
-print(f"::notice::Written {len(all_users)} users to {csv_file}")
+if __name__ == "__main__":
+    main()
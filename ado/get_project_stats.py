@@ -0,0 +1,286 @@
+import os
+import csv
+import json
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from ado_client import AdoClient, org_url
+from metrics import Metrics
+
+BASE_DIR = Path(__file__).resolve().parent  # folder where this script lives
+
+API_VERSION = "7.0"
+
+# WIQL returns at most 20000 work items per query -> page on [System.Id]
+WIQL_PAGE_SIZE = 20000
+
+# workitemsbatch accepts at most 200 IDs per call
+BATCH_SIZE = 200
+
+# only what the stats need, not the full work item
+FIELDS = ["System.Id", "System.WorkItemType", "System.State", "System.ChangedDate", "System.ChangedBy"]
+
+SUMMARY_COLUMNS = ["Project", "WorkItems", "LastChanged", "ActiveContributors"]
+COUNTS_COLUMNS = ["Project", "WorkItemType", "State", "Count"]
+
+STATE_VERSION = 1
+
+
+# --- HELPER: dates ---
+def parse_dt(s):
+    return datetime.fromisoformat(s.replace("Z", "+00:00"))
+
+
+def to_iso(dt):
+    return dt.astimezone(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+# ChangedBy is an identity reference ({"uniqueName": ...}); older payloads send "Name <mail>"
+def identity_name(value):
+    if isinstance(value, dict):
+        return value.get("uniqueName") or value.get("displayName") or ""
+    return value or ""
+
+
+# --- WIQL: IDs only ---
+# All IDs of one project matching `condition`, in ID order, 20000 per query.
+def wiql_ids(client, base_url, project_id, condition=""):
+    wiql_url = f"{base_url}/{project_id}/_apis/wit/wiql"
+    ids = []
+    last_id = 0
+
+    while True:
+        query = (
+            "SELECT [System.Id] FROM WorkItems"
+            f" WHERE [System.TeamProject] = @project AND [System.Id] > {last_id}{condition}"
+            " ORDER BY [System.Id]"
+        )
+        data = client.post_json(
+            wiql_url, {"query": query},
+            params={"api-version": API_VERSION, "$top": WIQL_PAGE_SIZE, "timePrecision": "true"},
+        )
+        page = [w["id"] for w in data.get("workItems", [])]
+        ids.extend(page)
+        if len(page) < WIQL_PAGE_SIZE:
+            return ids
+        last_id = page[-1]
+
+
+# --- BATCH FETCH ---
+# id -> [type, state, changed date, changed by], 200 IDs per call.
+# errorPolicy=omit: items deleted between the WIQL query and the fetch come back as null.
+def fetch_items(client, base_url, ids):
+    batch_url = f"{base_url}/_apis/wit/workitemsbatch"
+    items = {}
+
+    for start in range(0, len(ids), BATCH_SIZE):
+        data = client.post_json(
+            batch_url,
+            {"ids": ids[start:start + BATCH_SIZE], "fields": FIELDS, "errorPolicy": "omit"},
+            params={"api-version": API_VERSION},
+        )
+        for wi in data.get("value", []):
+            if not wi:
+                continue
+            f = wi.get("fields", {})
+            items[str(wi["id"])] = [
+                f.get("System.WorkItemType", ""),
+                f.get("System.State", ""),
+                f.get("System.ChangedDate", ""),
+                identity_name(f.get("System.ChangedBy")),
+            ]
+    return items
+
+
+# Stored item last changed exactly at the watermark (compared at its millisecond precision)
+def seen_at(item, watermark):
+    return bool(item[2]) and to_iso(parse_dt(item[2])) == watermark
+
+
+# --- ONE PROJECT ---
+# First run (or no state): every work item is fetched.
+# Later runs: the full ID list is still queried (cheap, drops deleted/moved items),
+# but only items changed since the watermark or not seen before are fetched.
+def collect_project(client, base_url, project, state):
+    project_id = project.get("id")
+    known = state.get("items", {}) if state else {}
+    watermark = state.get("watermark") if state else None
+
+    all_ids = wiql_ids(client, base_url, project_id)
+
+    if watermark:
+        # >= : items changed in the watermark's own millisecond are not missed; the ones already stored
+        # with exactly that ChangedDate are what set the watermark and need no fetch
+        changed = set(wiql_ids(client, base_url, project_id, f" AND [System.ChangedDate] >= '{watermark}'"))
+        fetch = [i for i in all_ids if str(i) not in known or (i in changed and not seen_at(known[str(i)], watermark))]
+    else:
+        fetch = all_ids
+
+    fetched = fetch_items(client, base_url, fetch)
+
+    items = {}
+    for i in all_ids:
+        key = str(i)
+        item = fetched.get(key) or known.get(key)
+        if item:
+            items[key] = item
+
+    # watermark = newest ChangedDate seen (server clock, not ours)
+    changed_dates = [parse_dt(item[2]) for item in items.values() if item[2]]
+    new_watermark = to_iso(max(changed_dates)) if changed_dates else watermark
+
+    print(f"→ Project: {project.get('name')} ({len(items)} work items, {len(fetched)} fetched)")
+    return {"name": project.get("name"), "watermark": new_watermark, "items": items}
+
+
+# --- STATE ---
+# Per project: watermark + last known type/state/changed/changed-by of every work item.
+# Missing or unreadable state just means a full fetch.
+def state_path_for(org):
+    return BASE_DIR / "outputs" / org / ".project_stats_state.json"
+
+
+def load_state(path):
+    if not path.exists():
+        return {}
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            state = json.load(f)
+    except json.JSONDecodeError:
+        print(f"::warning::Ignoring unreadable {path.name}, fetching all work items")
+        return {}
+    if state.get("version") != STATE_VERSION:
+        return {}
+    return state.get("projects", {})
+
+
+def save_state(path, projects):
+    partial = path.with_name(path.name + ".partial")
+    with partial.open("w", encoding="utf-8") as f:
+        json.dump({"version": STATE_VERSION, "projects": projects}, f, separators=(",", ":"))
+    partial.replace(path)
+
+
+# --- AGGREGATE ---
+def summarize(project_states, active_days):
+    since = datetime.now(timezone.utc) - timedelta(days=active_days)
+    summary = []
+    counts = []
+
+    for state in sorted(project_states, key=lambda s: s["name"]):
+        items = state["items"].values()
+        changed = [(parse_dt(item[2]), item[3]) for item in items if item[2]]
+        active = {who for when, who in changed if when >= since and who}
+
+        summary.append([
+            state["name"],
+            len(items),
+            to_iso(max(when for when, _ in changed)) if changed else "",
+            len(active),
+        ])
+        by_type_state = Counter((item[0], item[1]) for item in items)
+        for (wit, wi_state), count in sorted(by_type_state.items()):
+            counts.append([state["name"], wit, wi_state, count])
+
+    return summary, counts
+
+
+def write_csv(path, columns, rows):
+    with path.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f, delimiter=",")
+        writer.writerow(columns)
+        writer.writerows(rows)
+
+
+# --- COLLECT ---
+def collect_stats(org, pat, *, workers=8, full_refresh=False, active_days=30, metrics=None):
+    metrics = metrics or Metrics("stats")
+    base_url = org_url(org)
+
+    # one pooled client for all project threads (shared rate budget + throttling backoff)
+    client = AdoClient(pat, pool_size=workers, metrics=metrics)
+
+    output_path = BASE_DIR / "outputs" / org  # outputs/<ORG> next to the script
+    output_path.mkdir(parents=True, exist_ok=True)
+    state_file = state_path_for(org)
+    previous = {} if full_refresh else load_state(state_file)
+
+    with metrics.stage("fetch"):
+        projects_data = client.get_json(f"{base_url}/_apis/projects", params={"api-version": API_VERSION})
+    projects = projects_data.get("value", [])
+
+    incremental = sum(1 for p in projects if previous.get(p.get("id"), {}).get("watermark"))
+    print(f"Found {len(projects)} projects in org ({incremental} incremental, {len(projects) - incremental} full)\n")
+
+    # projects run side by side; the batches of one project run in order
+    with metrics.stage("fetch"), ThreadPoolExecutor(max_workers=workers) as pool:
+        states = list(pool.map(lambda p: collect_project(client, base_url, p, previous.get(p.get("id"))), projects))
+
+    with metrics.stage("transform"):
+        summary, counts = summarize(states, active_days)
+
+    with metrics.stage("csv_write"):
+        write_csv(output_path / "project_stats.csv", SUMMARY_COLUMNS, summary)
+        write_csv(output_path / "project_workitem_counts.csv", COUNTS_COLUMNS, counts)
+
+    # state last: a failed run keeps the previous watermarks
+    save_state(state_file, {p.get("id"): s for p, s in zip(projects, states)})
+
+    total = sum(row[1] for row in summary)
+    print(f"\n✅ Written stats for {len(summary)} projects ({total} work items) to: {output_path}")
+    return summary
+
+
+# --- CONFIG ---
+# collect_stats() keyword arguments from the environment (exits on invalid values)
+def config_from_env():
+    ado_org = os.getenv("ADO_ORG")
+    ado_pat = os.getenv("ADO_PAT")
+
+    if not ado_org or not ado_pat:
+        print("❌ Error: Environment variables ADO_ORG or ADO_PAT are missing.")
+        exit(1)
+
+    # Projects queried in parallel (1 = sequential)
+    workers_str = os.getenv("CRAWL_WORKERS", "8")
+    try:
+        workers = max(1, int(workers_str))
+    except ValueError:
+        print(f"❌ Error: Invalid CRAWL_WORKERS: {workers_str}")
+        exit(1)
+
+    # Contributor = ChangedBy of a work item changed within this many days
+    active_days_str = os.getenv("STATS_ACTIVE_DAYS", "30")
+    try:
+        active_days = int(active_days_str)
+    except ValueError:
+        print(f"❌ Error: Invalid STATS_ACTIVE_DAYS: {active_days_str}")
+        exit(1)
+
+    return {
+        "org": ado_org,
+        "pat": ado_pat,
+        "workers": workers,
+        "full_refresh": os.getenv("STATS_FULL_REFRESH", "0") == "1",  # ignore watermarks, fetch everything
+        "active_days": active_days,
+    }
+
+
+# --- MAIN ---
+def main():
+    config = config_from_env()
+    metrics = Metrics("stats")
+    try:
+        collect_stats(**config, metrics=metrics)
+    except RuntimeError as e:
+        print(f"::error::{e}")
+        exit(1)
+    finally:
+        # Per-endpoint HTTP stats + stage timings (JSON artifact + GitHub step summary)
+        metrics.write(BASE_DIR / "outputs" / config["org"])
+
+
+if __name__ == "__main__":
+    main()
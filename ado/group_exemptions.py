@@ -0,0 +1,192 @@
+import json
+import time
+
+from ado_client import AdoClient, graph_url
+
+GRAPH_API_VERSION = "7.1-preview.1"
+
+# descriptors per subjectlookup call
+LOOKUP_BATCH_SIZE = 100
+
+# group descriptors (vssgp = ADO group, aadgp = Entra group); everything else is a user / service principal
+GROUP_DESCRIPTOR_PREFIXES = ("vssgp.", "aadgp.")
+
+CACHE_VERSION = 2  # 2: subjects map to [principal name, mail] (was: mail or principal name)
+
+
+# --- CACHE ---
+# outputs/<ORG>/.graph_cache.json, three maps with a fetch time per entry:
+#   groups:   configured group name -> group descriptors
+#   members:  group descriptor -> direct member descriptors
+#   subjects: user descriptor -> [principal name, mail], lower-case
+# Entries older than the TTL are fetched again, so a nightly scan inside the TTL makes no Graph calls.
+class GraphCache:
+    def __init__(self, path, ttl_hours):
+        self.path = path
+        self.ttl = ttl_hours * 3600
+        self.hits = 0
+        self.misses = 0
+        self.data = {"groups": {}, "members": {}, "subjects": {}}
+        if path.exists():
+            try:
+                with path.open("r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("version") == CACHE_VERSION:
+                    self.data.update({k: data.get(k, {}) for k in self.data})
+            except json.JSONDecodeError:
+                pass
+
+    def get(self, section, key):
+        entry = self.data[section].get(key)
+        if entry and time.time() - entry["fetched"] < self.ttl:
+            self.hits += 1
+            return entry["value"]
+        self.misses += 1
+        return None
+
+    def put(self, section, key, value):
+        self.data[section][key] = {"fetched": time.time(), "value": value}
+
+    def save(self):
+        partial = self.path.with_name(self.path.name + ".partial")
+        with partial.open("w", encoding="utf-8") as f:
+            json.dump({"version": CACHE_VERSION, **self.data}, f, separators=(",", ":"))
+        partial.replace(self.path)
+
+
+# --- GRAPH ---
+class GroupResolver:
+    def __init__(self, client, base_url, cache):
+        self.client = client
+        self.base_url = base_url
+        self.cache = cache
+
+    # "License Keepers" matches the display name (any project), "[KKEU]\License Keepers" the principal name
+    def find_groups(self, name):
+        key = name.lower()
+        descriptors = self.cache.get("groups", key)
+        if descriptors is None:
+            data = self.client.post_json(
+                f"{self.base_url}/_apis/graph/subjectquery",
+                {"query": name, "subjectKind": ["Group"]},
+                params={"api-version": GRAPH_API_VERSION},
+            )
+            descriptors = sorted(
+                g["descriptor"] for g in data.get("value", [])
+                if key in (str(g.get("displayName", "")).lower(), str(g.get("principalName", "")).lower())
+            )
+            self.cache.put("groups", key, descriptors)
+        return descriptors
+
+    def direct_members(self, group_descriptor):
+        members = self.cache.get("members", group_descriptor)
+        if members is None:
+            data = self.client.get_json(
+                f"{self.base_url}/_apis/graph/Memberships/{group_descriptor}",
+                params={"direction": "Down", "api-version": GRAPH_API_VERSION},
+            )
+            members = sorted(m["memberDescriptor"] for m in data.get("value", []))
+            self.cache.put("members", group_descriptor, members)
+        return members
+
+    # All user descriptors below the groups, nested groups expanded (each group read once)
+    def expand(self, group_descriptors):
+        seen = set(group_descriptors)
+        frontier = list(group_descriptors)
+        users = set()
+        while frontier:
+            nested = []
+            for group in frontier:
+                for member in self.direct_members(group):
+                    if member.startswith(GROUP_DESCRIPTOR_PREFIXES):
+                        if member not in seen:
+                            seen.add(member)
+                            nested.append(member)
+                    else:
+                        users.add(member)
+            frontier = nested
+        return users
+
+    # descriptor -> [principal name, mail] (lower-case), uncached ones resolved LOOKUP_BATCH_SIZE at a time
+    def names(self, user_descriptors):
+        result = {}
+        missing = []
+        for d in sorted(user_descriptors):
+            names = self.cache.get("subjects", d)
+            if names is None:
+                missing.append(d)
+            else:
+                result[d] = names
+
+        for start in range(0, len(missing), LOOKUP_BATCH_SIZE):
+            batch = missing[start:start + LOOKUP_BATCH_SIZE]
+            data = self.client.post_json(
+                f"{self.base_url}/_apis/graph/subjectlookup",
+                {"lookupKeys": [{"descriptor": d} for d in batch]},
+                params={"api-version": GRAPH_API_VERSION},
+            )
+            subjects = data.get("value", {})
+            for d in batch:
+                subject = subjects.get(d) or {}
+                names = [str(subject.get(k) or "").lower() for k in ("principalName", "mailAddress")]
+                self.cache.put("subjects", d, names)
+                result[d] = names
+        return result
+
+
+# --- ENRICHMENT ---
+# Which of the scanned users (emails) are in one of the exempt groups. Cost depends on the size of
+# the groups, not of the org: one query per group name, one membership call per (nested) group and
+# one lookup per 100 members, all cached for ttl_hours. Writes out_json and returns the exempt count.
+# Members are matched on their principal name (what the snapshot's Email holds), their mail address
+# only when that doesn't match. A group that can't be found raises: exemptions fail closed.
+# out_json holds nothing but the result, so it only changes (in git, and its hash for the
+# demotion step) when the exempt users do.
+def resolve_exemptions(org, pat, group_names, emails, *, out_json, cache_path, ttl_hours=24, metrics=None):
+    cache = GraphCache(cache_path, ttl_hours)
+    resolver = GroupResolver(AdoClient(pat, metrics=metrics), graph_url(org), cache)
+    scanned = {str(e).lower() for e in emails if e}
+
+    exempt = {}  # email -> configured group names
+    unresolved = []
+    try:
+        for name in group_names:
+            groups = resolver.find_groups(name)
+            if not groups:
+                unresolved.append(name)
+                continue
+            members = resolver.names(resolver.expand(groups))
+            matched = {next((n for n in names if n in scanned), None) for names in members.values()} - {None}
+            for email in matched:
+                exempt.setdefault(email, []).append(name)
+            print(f"::notice::Exempt group '{name}': {len(members)} members, {len(matched)} with an entitlement")
+    finally:
+        cache.save()
+        print(f"::notice::Graph cache: {cache.hits} hits, {cache.misses} misses (TTL {ttl_hours}h)")
+
+    if unresolved:
+        raise RuntimeError(f"Exempt group(s) not found in {org}: {', '.join(unresolved)}")
+
+    with out_json.open("w", encoding="utf-8") as f:
+        json.dump({
+            "groups": list(group_names),
+            "users": [{"Email": e, "Groups": exempt[e]} for e in sorted(exempt)],
+        }, f, indent=1)
+    return len(exempt)
+
+
+# Exempt e-mails for the demotion step. The file must have been resolved for exactly the
+# groups the rules list now; otherwise it could silently miss a newly added group.
+def load_exemptions(path, group_names):
+    if not group_names:
+        return set()
+    if not path.exists():
+        raise RuntimeError(f"Rules list exempt_groups but {path.name} is missing – run the users scan first")
+    with path.open("r", encoding="utf-8") as f:
+        data = json.load(f)
+    if sorted(data.get("groups", [])) != sorted(group_names):
+        raise RuntimeError(
+            f"{path.name} was resolved for groups {data.get('groups')}, rules now list {list(group_names)} – "
+            "run the users scan again"
+        )
+    return {u["Email"] for u in data.get("users", [])}
@@ -0,0 +1,10 @@
+import hashlib
+
+
+# Content hash of a file, read in chunks so large snapshots don't land in memory
+def file_sha256(path):
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
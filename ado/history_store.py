@@ -0,0 +1,229 @@
+import argparse
+import csv
+import os
+import sqlite3
+from datetime import datetime, timezone
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent  # folder where this script lives
+
+
+# --- SCHEMA ---
+# Temporal tables: one row per version of an entity, valid in [valid_from, valid_to).
+# valid_to IS NULL marks the current version. A new version is opened only when a
+# tracked column changes; volatile columns (last login) are updated in place.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id      INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind        TEXT NOT NULL,
+    ts          TEXT NOT NULL,
+    row_count   INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS entitlements (
+    entitlement_id  TEXT NOT NULL,
+    email           TEXT,
+    license         TEXT,
+    source          TEXT,
+    created         TEXT,
+    last_login      TEXT,
+    valid_from      TEXT NOT NULL,
+    valid_to        TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_entitlements_id ON entitlements(entitlement_id, valid_to);
+CREATE INDEX IF NOT EXISTS ix_entitlements_email ON entitlements(email);
+
+CREATE TABLE IF NOT EXISTS project_fields (
+    project         TEXT NOT NULL,
+    field_ref_name  TEXT NOT NULL,
+    process_name    TEXT,
+    field_name      TEXT,
+    field_type      TEXT,
+    is_identity     TEXT,
+    is_custom       TEXT,
+    valid_from      TEXT NOT NULL,
+    valid_to        TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_project_fields_project ON project_fields(project, field_ref_name, valid_to);
+CREATE INDEX IF NOT EXISTS ix_project_fields_field ON project_fields(field_ref_name);
+"""
+
+# table -> (key columns, tracked columns, in-place columns)
+TABLES = {
+    "entitlements": (["entitlement_id"], ["email", "license", "source", "created"], ["last_login"]),
+    "project_fields": (["project", "field_ref_name"], ["process_name", "field_name", "field_type", "is_identity", "is_custom"], []),
+}
+
+# CSV column -> table column
+USERS_CSV_COLUMNS = {
+    "UserEntitlementId": "entitlement_id",
+    "Email": "email",
+    "License": "license",
+    "Source": "source",
+    "Created": "created",
+    "Last Login": "last_login",
+}
+FIELDS_CSV_COLUMNS = {
+    "Project": "project",
+    "FieldRefName": "field_ref_name",
+    "ProcessName": "process_name",
+    "FieldName": "field_name",
+    "FieldType": "field_type",
+    "IsIdentity": "is_identity",
+    "IsCustom": "is_custom",
+}
+
+
+# One file per dataset ("users": entitlements, "fields": project_fields): the users and fields
+# workflows each persist their own, so overlapping runs never restore or overwrite each other's rows
+def db_path_for(org, dataset):
+    return BASE_DIR / "outputs" / org / f"history_{dataset}.sqlite"
+
+
+def connect(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+# --- RECORD ---
+# Bulk-load a full snapshot into a temp table, then close / open versions with set-based SQL.
+def record_snapshot(conn, table, rows, ts=None):
+    ts = ts or datetime.now(timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z")
+    keys, tracked, in_place = TABLES[table]
+    cols = keys + tracked + in_place
+
+    key_match = " AND ".join(f"s.{k} = t.{k}" for k in keys)
+    same_tracked = " AND ".join(f"s.{c} IS t.{c}" for c in tracked)
+
+    with conn:
+        conn.execute("DROP TABLE IF EXISTS temp.snap")
+        conn.execute(f"CREATE TEMP TABLE snap ({', '.join(cols)}, PRIMARY KEY ({', '.join(keys)}))")
+        conn.executemany(
+            f"INSERT OR REPLACE INTO snap VALUES ({', '.join('?' for _ in cols)})",
+            ([row.get(c) for c in cols] for row in rows),
+        )
+        row_count = conn.execute("SELECT COUNT(*) FROM snap").fetchone()[0]
+
+        # 1) close current versions that disappeared or whose tracked columns changed
+        conn.execute(f"""
+            UPDATE {table} AS t SET valid_to = ?
+            WHERE t.valid_to IS NULL
+              AND NOT EXISTS (SELECT 1 FROM snap s WHERE {key_match} AND {same_tracked})
+        """, (ts,))
+
+        # 2) open a version for every snapshot row without a current one
+        conn.execute(f"""
+            INSERT INTO {table} ({', '.join(cols)}, valid_from, valid_to)
+            SELECT {', '.join('s.' + c for c in cols)}, ?, NULL FROM snap s
+            WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE {key_match} AND t.valid_to IS NULL)
+        """, (ts,))
+
+        # 3) refresh volatile columns on current versions
+        for c in in_place:
+            conn.execute(f"""
+                UPDATE {table} AS t SET {c} = (SELECT s.{c} FROM snap s WHERE {key_match})
+                WHERE t.valid_to IS NULL
+            """)
+
+        conn.execute("INSERT INTO runs (kind, ts, row_count) VALUES (?, ?, ?)", (table, ts, row_count))
+        conn.execute("DROP TABLE temp.snap")
+
+    return row_count
+
+
+# Stream a snapshot CSV into the store without holding it in memory
+def record_csv(db_path, table, csv_path):
+    mapping = USERS_CSV_COLUMNS if table == "entitlements" else FIELDS_CSV_COLUMNS
+    conn = connect(db_path)
+    try:
+        with csv_path.open("r", newline="", encoding="utf-8") as f:
+            rows = ({col: (r.get(name) or None) for name, col in mapping.items()} for r in csv.DictReader(f))
+            return record_snapshot(conn, table, rows)
+    finally:
+        conn.close()
+
+
+# --- QUERIES ---
+def query_user(conn, who):
+    return conn.execute("""
+        SELECT valid_from, valid_to, email, license, source, last_login
+        FROM entitlements
+        WHERE entitlement_id IN (SELECT entitlement_id FROM entitlements WHERE email = ? COLLATE NOCASE OR entitlement_id = ?)
+        ORDER BY entitlement_id, valid_from
+    """, (who, who)).fetchall()
+
+
+def query_field(conn, field_ref, project=None):
+    sql = """
+        SELECT project, MIN(valid_from) AS first_seen,
+               CASE WHEN SUM(valid_to IS NULL) > 0 THEN NULL ELSE MAX(valid_to) END AS gone_since
+        FROM project_fields
+        WHERE field_ref_name = ?
+    """
+    params = [field_ref]
+    if project:
+        sql += " AND project = ?"
+        params.append(project)
+    sql += " GROUP BY project ORDER BY first_seen, project"
+    return conn.execute(sql, params).fetchall()
+
+
+def query_project(conn, project):
+    return conn.execute("""
+        SELECT valid_from, valid_to, field_ref_name, field_name, process_name
+        FROM project_fields
+        WHERE project = ?
+        ORDER BY valid_from, field_ref_name
+    """, (project,)).fetchall()
+
+
+def print_rows(headers, rows):
+    print("\t".join(headers))
+    for row in rows:
+        print("\t".join("" if v is None else str(v) for v in row))
+    if not rows:
+        print("(no history)")
+
+
+# --- MAIN ---
+# Query entry point, e.g.
+#   python ado/history_store.py user someone@takkt.com
+#   python ado/history_store.py field Custom.CostCenter --project "My Project"
+#   python ado/history_store.py project "My Project"
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query entitlement / field history")
+    parser.add_argument("--org", default=os.getenv("ADO_ORG"), help="ADO org (default: $ADO_ORG)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_user = sub.add_parser("user", help="license/source history of a user (email or entitlement ID)")
+    p_user.add_argument("who")
+
+    p_field = sub.add_parser("field", help="when a field appeared / disappeared per project")
+    p_field.add_argument("field_ref")
+    p_field.add_argument("--project")
+
+    p_project = sub.add_parser("project", help="field timeline of a project")
+    p_project.add_argument("project")
+
+    args = parser.parse_args(argv)
+    if not args.org:
+        parser.error("--org or ADO_ORG is required")
+
+    db_path = db_path_for(args.org, "users" if args.command == "user" else "fields")
+    if not db_path.exists():
+        print(f"❌ Error: No history store at {db_path}")
+        exit(1)
+
+    conn = connect(db_path)
+    if args.command == "user":
+        print_rows(["valid_from", "valid_to", "email", "license", "source", "last_login"], query_user(conn, args.who))
+    elif args.command == "field":
+        print_rows(["project", "first_seen", "gone_since"], query_field(conn, args.field_ref, args.project))
+    elif args.command == "project":
+        print_rows(["valid_from", "valid_to", "field_ref_name", "field_name", "process_name"], query_project(conn, args.project))
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+# latency histogram bucket upper bounds (ms); the last bucket is open-ended
+LATENCY_BUCKETS_MS = [50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+RATE_LIMIT_HEADERS = ["X-RateLimit-Resource", "X-RateLimit-Delay", "X-RateLimit-Limit",
+                      "X-RateLimit-Remaining", "X-RateLimit-Reset", "Retry-After"]
+
+GUID = re.compile(r"^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$")
+
+
+# --- ENDPOINT TEMPLATES ---
+# https://dev.azure.com/KKEU/My Project/_apis/wit/workitemtypes/Bug/fields
+#   -> dev.azure.com/{org}/{project}/_apis/wit/workitemtypes/{type}/fields
+# https://analytics.dev.azure.com/KKEU/_odata/v4.0-preview/WorkItems -> analytics.dev.azure.com/{org}/_odata/...
+def endpoint_template(url):
+    parts = urlsplit(url)
+    segments = [s for s in parts.path.split("/") if s]
+    api_root = next((s for s in segments if s in ("_apis", "_odata")), None)
+    if api_root is None:
+        return f"{parts.hostname}{parts.path}"
+
+    api = segments.index(api_root)
+    out = ["{org}"] + ["{project}"] * (api > 1)
+    prev = None
+    for seg in segments[api:]:
+        if GUID.match(seg) or seg.isdigit():
+            seg = "{id}"
+        elif prev == "workitemtypes":
+            seg = "{type}"
+        elif prev in ("Memberships", "memberships", "groups", "users") and seg.startswith(("aad", "vss", "msa", "svc")):
+            seg = "{descriptor}"
+        out.append(seg)
+        prev = seg
+    return f"{parts.hostname}/" + "/".join(out)
+
+
+class EndpointStats:
+    def __init__(self):
+        self.count = 0
+        self.retries = 0
+        self.bytes = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.statuses = {}
+        self.rate_limit = {}  # header -> {"min", "max", "seen"}
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "retries": self.retries,
+            "bytes": self.bytes,
+            "avg_ms": round(self.total_ms / self.count, 1) if self.count else 0,
+            "max_ms": round(self.max_ms, 1),
+            "latency_histogram_ms": {
+                **{f"<={b}": n for b, n in zip(LATENCY_BUCKETS_MS, self.histogram)},
+                f">{LATENCY_BUCKETS_MS[-1]}": self.histogram[-1],
+            },
+            "statuses": self.statuses,
+            "rate_limit_headers": self.rate_limit,
+        }
+
+
+# --- METRICS ---
+# Thread-safe collector shared by an AdoClient and the stage timers of one script run
+class Metrics:
+    def __init__(self, script):
+        self.script = script
+        self.started = datetime.now(timezone.utc)
+        self.endpoints = {}
+        self.stages = {}
+        self.lock = threading.Lock()
+
+    # One HTTP attempt (retries are recorded as separate attempts, flagged with retry=True)
+    def record_http(self, method, url, status, seconds, nbytes=0, retry=False, headers=None):
+        key = f"{method} {endpoint_template(url)}"
+        ms = seconds * 1000
+        bucket = next((i for i, b in enumerate(LATENCY_BUCKETS_MS) if ms <= b), len(LATENCY_BUCKETS_MS))
+
+        with self.lock:
+            s = self.endpoints.setdefault(key, EndpointStats())
+            s.count += 1
+            s.retries += int(retry)
+            s.bytes += nbytes
+            s.total_ms += ms
+            s.max_ms = max(s.max_ms, ms)
+            s.histogram[bucket] += 1
+            s.statuses[str(status)] = s.statuses.get(str(status), 0) + 1
+
+            for name in RATE_LIMIT_HEADERS:
+                value = (headers or {}).get(name)
+                if value is None:
+                    continue
+                seen = s.rate_limit.setdefault(name, {"seen": 0})
+                seen["seen"] += 1
+                try:
+                    num = float(value)
+                except ValueError:
+                    seen["last"] = value
+                    continue
+                seen["min"] = min(seen.get("min", num), num)
+                seen["max"] = max(seen.get("max", num), num)
+
+    @contextmanager
+    def stage(self, name):
+        t0 = time.monotonic()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.stages[name] = round(self.stages.get(name, 0) + time.monotonic() - t0, 3)
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                "script": self.script,
+                "started": self.started.isoformat(timespec="seconds").replace("+00:00", "Z"),
+                "stages_seconds": dict(self.stages),
+                "http": {k: v.to_dict() for k, v in sorted(self.endpoints.items())},
+            }
+
+    # JSON artifact + GitHub step summary table (when running in Actions)
+    def write(self, output_dir):
+        path = output_dir / f"metrics_{self.script}.json"
+        data = self.to_dict()
+        with path.open("w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1)
+        print(f"::notice::Metrics written to {path}")
+
+        summary_file = os.getenv("GITHUB_STEP_SUMMARY")
+        if summary_file:
+            with open(summary_file, "a", encoding="utf-8") as f:
+                f.write(self.markdown(data))
+
+    @staticmethod
+    def markdown(data):
+        lines = [f"### Metrics: {data['script']}", "", "| Stage | Seconds |", "|---|---|"]
+        lines += [f"| {name} | {sec} |" for name, sec in data["stages_seconds"].items()]
+        lines += ["", "| Endpoint | Calls | Retries | Avg ms | Max ms | KB | Statuses | Throttling |", "|---|---|---|---|---|---|---|---|"]
+        for endpoint, s in data["http"].items():
+            statuses = ", ".join(f"{k}: {v}" for k, v in sorted(s["statuses"].items()))
+            throttling = ", ".join(
+                f"{h}: {v.get('min', v.get('last'))}..{v.get('max', '')}" for h, v in s["rate_limit_headers"].items()
+            )
+            lines.append(f"| `{endpoint}` | {s['count']} | {s['retries']} | {s['avg_ms']} | {s['max_ms']} | "
+                         f"{s['bytes'] // 1024} | {statuses} | {throttling} |")
+        return "\n".join(lines) + "\n\n"
@@ -0,0 +1,162 @@
+import argparse
+import os
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent  # folder where this script lives
+if str(BASE_DIR) not in sys.path:
+    sys.path.insert(0, str(BASE_DIR))
+
+EXECUTION_MODES = ("DRY_RUN", "DEMOTE_ONE", "DEMOTE_ALL")
+
+# Every command imports its module only when it runs, so e.g. `history` never loads pandas
+# and `fields` (stream workbook) never loads pandas either; NumPy is loaded only by its clusters stage.
+
+
+# --- COMMANDS ---
+def cmd_users(args):
+    import get_org_users
+
+    get_org_users.main()
+
+
+def cmd_fields(args):
+    import get_org_fields
+    from metrics import Metrics
+
+    config = get_org_fields.config_from_env()
+    metrics = Metrics("fields")
+    try:
+        get_org_fields.catalog_fields(**config, stages=["excel"] if args.excel_only else None, metrics=metrics)
+    finally:
+        metrics.write(BASE_DIR / "outputs" / config["org"])
+
+
+def cmd_stats(args):
+    import get_project_stats
+
+    get_project_stats.main()
+
+
+def cmd_demote(args):
+    import demote_org_users
+
+    demote_org_users.main()
+
+
+# Users scan -> demotion in one process: the entitlement table goes straight from the
+# scan into analyze_and_flag, instead of a second interpreter re-reading users_latest.csv.
+def cmd_pipeline(args):
+    import get_org_users
+    import demote_org_users
+    from metrics import Metrics
+
+    users_config = get_org_users.config_from_env()
+    run = demote_org_users.DemoteRun(**demote_org_users.config_from_env())
+    users_metrics = Metrics("users")
+
+    try:
+        snapshot = get_org_users.scan_users(**users_config, metrics=users_metrics, return_frame=True)
+    except RuntimeError as e:
+        print(f"::error::{e}")
+        exit(1)
+    finally:
+        users_metrics.write(run.output_dir)
+
+    print(f"::notice:: Execution mode for demotion: {run.mode}")
+    try:
+        df_status, candidates = demote_org_users.load_status(run, snapshot)
+        demote_org_users.execute(run, df_status, candidates)
+    except RuntimeError as e:
+        print(f"::error::{e}")
+        exit(1)
+    finally:
+        run.metrics.write(run.output_dir)
+
+
+def cmd_history(args):
+    import history_store
+
+    history_store.main(args.rest)
+
+
+def cmd_index(args):
+    import field_index
+
+    field_index.main(args.rest)
+
+
+def cmd_orgs(args):
+    import run_orgs
+
+    run_orgs.main(args.rest)
+
+
+# --- MAIN ---
+# One entry point for all steps, e.g.
+#   python ado/pe_auto.py --org KKEU pipeline --mode DRY_RUN
+#   python ado/pe_auto.py fields --crawl-mode process
+#   python ado/pe_auto.py stats --full-refresh
+#   python ado/pe_auto.py history user someone@takkt.com
+#   python ado/pe_auto.py index similar "My Project"
+# Options override the matching env vars; everything else is configured via env as before.
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="pe-auto", description="Platform Engineering ADO automation")
+    parser.add_argument("--org", help="ADO org (sets ADO_ORG)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_users = sub.add_parser("users", help="scan user entitlements -> users_latest.csv")
+    p_users.add_argument("--fetch-mode", choices=["single", "stream"], help="sets USERS_FETCH_MODE")
+    p_users.add_argument("--refresh", choices=["full", "incremental"], help="sets USERS_REFRESH")
+    p_users.set_defaults(func=cmd_users)
+
+    p_fields = sub.add_parser("fields", help="field catalogue -> ado_project_fields.csv / .xlsx")
+    p_fields.add_argument("--crawl-mode", choices=["project", "process"], help="sets FIELDS_CRAWL_MODE")
+    p_fields.add_argument("--excel-only", action="store_true", help="skip the crawl, rebuild the workbook from the CSV")
+    p_fields.add_argument("--full-crawl", action="store_true", help="ignore the crawl state (sets FIELDS_INCREMENTAL=0)")
+    p_fields.set_defaults(func=cmd_fields)
+
+    p_stats = sub.add_parser("stats", help="work item stats per project -> project_stats.csv")
+    p_stats.add_argument("--full-refresh", action="store_true", help="ignore the ChangedDate watermarks (sets STATS_FULL_REFRESH)")
+    p_stats.set_defaults(func=cmd_stats)
+
+    p_demote = sub.add_parser("demote", help="flag (and demote) inactive users from users_latest.csv")
+    p_demote.add_argument("--mode", choices=EXECUTION_MODES, help="sets EXECUTION_MODE")
+    p_demote.set_defaults(func=cmd_demote)
+
+    p_pipeline = sub.add_parser("pipeline", help="users scan + demotion in one process (no CSV re-read)")
+    p_pipeline.add_argument("--fetch-mode", choices=["single", "stream"], help="sets USERS_FETCH_MODE")
+    p_pipeline.add_argument("--refresh", choices=["full", "incremental"], help="sets USERS_REFRESH")
+    p_pipeline.add_argument("--mode", choices=EXECUTION_MODES, help="sets EXECUTION_MODE")
+    p_pipeline.set_defaults(func=cmd_pipeline)
+
+    p_history = sub.add_parser("history", help="query the history store (see history_store.py)", add_help=False)
+    p_history.add_argument("rest", nargs=argparse.REMAINDER)
+    p_history.set_defaults(func=cmd_history)
+
+    p_index = sub.add_parser("index", help="query the project × field index (see field_index.py)", add_help=False)
+    p_index.add_argument("rest", nargs=argparse.REMAINDER)
+    p_index.set_defaults(func=cmd_index)
+
+    p_orgs = sub.add_parser("orgs", help="run all steps for several orgs (see run_orgs.py)", add_help=False)
+    p_orgs.add_argument("rest", nargs=argparse.REMAINDER)
+    p_orgs.set_defaults(func=cmd_orgs)
+
+    args = parser.parse_args(argv)
+
+    overrides = {
+        "ADO_ORG": args.org,
+        "USERS_FETCH_MODE": getattr(args, "fetch_mode", None),
+        "USERS_REFRESH": getattr(args, "refresh", None),
+        "FIELDS_CRAWL_MODE": getattr(args, "crawl_mode", None),
+        "EXECUTION_MODE": getattr(args, "mode", None),
+        "STATS_FULL_REFRESH": "1" if getattr(args, "full_refresh", False) else None,
+        "FIELDS_INCREMENTAL": "0" if getattr(args, "full_crawl", False) else None,
+    }
+    os.environ.update({k: v for k, v in overrides.items() if v})
+
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
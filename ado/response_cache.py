@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlencode
+
+
+# --- TTLs ---
+# (path regex, seconds a stored response is served without asking ADO at all)
+# Past the TTL the entry is revalidated with If-None-Match / If-Modified-Since,
+# so an unchanged resource costs a 304 instead of a full download.
+DEFAULT_TTLS = [
+    (r"/_apis/wit/fields$", 12 * 3600),
+    (r"/_apis/work/processes$", 12 * 3600),
+    (r"/_apis/wit/workitemtypes(/[^/]+/fields)?$", 12 * 3600),
+    (r"/_apis/projects(/[^/]+)?$", 3600),
+]
+
+
+# --- CACHE ---
+# One JSON file per (URL, params) under the cache dir; file mtime doubles as
+# "last used" for LRU eviction, so no shared index has to be kept in sync.
+# Shared by the crawl threads: the size total and the hit / revalidated / miss counters
+# only change under self.lock.
+class ResponseCache:
+    def __init__(self, root, *, max_bytes=200 * 1024 * 1024, ttls=None):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttls = [(re.compile(pattern), ttl) for pattern, ttl in (ttls or DEFAULT_TTLS)]
+        self.lock = threading.Lock()
+        self.total_bytes = sum(f.stat().st_size for f in self.root.glob("*.json"))
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(url, params=None):
+        query = urlencode(sorted((params or {}).items()))
+        return hashlib.sha256(f"{url}?{query}".encode()).hexdigest()
+
+    def ttl_for(self, url):
+        path = url.split("?", 1)[0]
+        for pattern, ttl in self.ttls:
+            if pattern.search(path):
+                return ttl
+        return 0
+
+    def load(self, url, params=None):
+        path = self.root / f"{self.key(url, params)}.json"
+        try:
+            with path.open("r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        try:
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            return None  # evicted by another thread meanwhile: a miss
+        return entry
+
+    def is_fresh(self, url, entry):
+        return time.time() - entry["stored_at"] < self.ttl_for(url)
+
+    # A fresh entry was served without asking ADO
+    def count_hit(self):
+        with self.lock:
+            self.hits += 1
+
+    # Conditional headers for revalidating a stored entry
+    @staticmethod
+    def validators(entry):
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def store(self, url, params, resp):
+        entry = {
+            "url": url,
+            "params": params or {},
+            "etag": resp.headers.get("ETag"),
+            "last_modified": resp.headers.get("Last-Modified"),
+            "stored_at": time.time(),
+            "body": resp.text,
+        }
+        self._write(self.key(url, params), entry)
+        with self.lock:
+            self.misses += 1
+            over_budget = self.total_bytes > self.max_bytes
+        if over_budget:
+            self.evict()
+
+    # 304 Not Modified: keep the body, restart the TTL clock
+    def refresh(self, url, params, entry):
+        entry["stored_at"] = time.time()
+        self._write(self.key(url, params), entry)
+        with self.lock:
+            self.revalidated += 1
+
+    def _write(self, key, entry):
+        # write-then-rename so concurrent crawl threads never see a half-written file
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        size = os.path.getsize(tmp)
+        path = self.root / f"{key}.json"
+        with self.lock:
+            # an overwritten entry gives its old size back
+            try:
+                old_size = path.stat().st_size
+            except FileNotFoundError:
+                old_size = 0
+            os.replace(tmp, path)
+            self.total_bytes += size - old_size
+
+    # Drop least recently used entries until the cache is back under 90% of max_bytes
+    def evict(self):
+        with self.lock:
+            files = []
+            for path in self.root.glob("*.json"):
+                try:
+                    st = path.stat()
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= 0.9 * self.max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+            self.total_bytes = total
+
+    def summary(self):
+        return f"cache hits: {self.hits}, revalidated (304): {self.revalidated}, misses: {self.misses}"
+
@@ -0,0 +1,166 @@
+import contextlib
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent  # folder where this script lives
+
+# Stages per org (pe_auto.py commands) inside one worker process; orgs run side by side.
+# users -> demote is a chain, fields and stats are independent, so those run in parallel
+# (one rate budget per org, shared by its stages). The ADO stages always run; the dry run is
+# skipped when the snapshot, rules and exemptions hash the same as last time (see dag.py).
+STEPS = [
+    ("users", ["users"]),
+    ("demote", ["demote", "--mode", "DRY_RUN"]),
+    ("fields", ["fields"]),
+    ("stats", ["stats"]),
+]
+
+
+# "KKEU,OTHER:5" -> [("KKEU", None), ("OTHER", 5.0)]  (optional requests/sec budget per org)
+def parse_orgs(spec):
+    orgs = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        org, _, rps = part.partition(":")
+        orgs.append((org, float(rps) if rps else None))
+    return orgs
+
+
+def count_csv_rows(path, where=None):
+    if not path.exists():
+        return None
+    with path.open("r", newline="", encoding="utf-8") as f:
+        return sum(1 for row in csv.DictReader(f) if where is None or where(row))
+
+
+# --- WORKER ---
+# Stages of one org as a DAG (inputs / outputs per stage)
+def org_dag(org, output_dir):
+    import pe_auto
+    from dag import Dag
+
+    commands = dict(STEPS)
+
+    def command(name):
+        return lambda: pe_auto.main(commands[name])
+
+    rules_file = Path(os.getenv("DEMOTE_RULES_FILE", BASE_DIR / "demotion_rules.json"))
+    snapshot = output_dir / "users_latest.csv"
+    exemptions = output_dir / "users_exemptions.json"
+
+    dag = Dag("run_orgs", output_dir)
+    dag.add("users", command("users"), outputs=[snapshot, exemptions], always=True)
+    dag.add("demote", command("demote"), inputs=[snapshot, exemptions, rules_file],
+            outputs=[output_dir / "users_with_status.csv"],
+            params={"threshold_days": os.getenv("DEMOTE_THRESHOLD_DAYS")})
+    dag.add("fields", command("fields"), outputs=[output_dir / "ado_project_fields.csv"], always=True)
+    dag.add("stats", command("stats"), outputs=[output_dir / "project_stats.csv"], always=True)
+    return dag
+
+
+# Runs every stage of one org in this process; script output goes to outputs/<ORG>/run.log
+def run_org(org, rps):
+    output_dir = BASE_DIR / "outputs" / org
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    os.environ["ADO_ORG"] = org
+    if rps:
+        os.environ["ADO_MAX_RPS"] = str(rps)
+    else:
+        os.environ.pop("ADO_MAX_RPS", None)
+    if str(BASE_DIR) not in sys.path:
+        sys.path.insert(0, str(BASE_DIR))
+    from ado_client import share_rate_budget
+
+    # parallel stages share the org's budget instead of each getting its own
+    share_rate_budget(rps or float(os.getenv("ADO_MAX_RPS", "10")))
+
+    result = {"org": org, "rps": rps, "steps": {}}
+    started = time.monotonic()
+
+    with (output_dir / "run.log").open("w", encoding="utf-8") as log:
+        with contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+            dag = org_dag(org, output_dir)
+            outcomes = dag.run()
+        for name, status in outcomes.items():
+            result["steps"][name] = {"status": status, "seconds": dag.seconds.get(name)}
+
+    result["seconds"] = round(time.monotonic() - started, 1)
+    result["users"] = count_csv_rows(output_dir / "users_latest.csv")
+    result["demote_candidates"] = count_csv_rows(
+        output_dir / "users_with_status.csv", lambda r: r.get("Demotion_Status") == "Demote"
+    )
+    result["field_rows"] = count_csv_rows(output_dir / "ado_project_fields.csv")
+    result["stats_projects"] = count_csv_rows(output_dir / "project_stats.csv")
+    return result
+
+
+# --- SUMMARY ---
+def print_summary(results):
+    step_names = [name for name, _ in STEPS]
+    header = ["Org", *step_names, "Users", "Demote candidates", "Field rows", "Stats projects", "Seconds"]
+    print("| " + " | ".join(header) + " |")
+    print("|" + "---|" * len(header))
+    for r in results:
+        steps = [r["steps"].get(name, {}).get("status", "skipped") for name in step_names]
+        cells = [r["org"], *steps, r["users"], r["demote_candidates"], r["field_rows"], r["stats_projects"], r["seconds"]]
+        print("| " + " | ".join("" if c is None else str(c) for c in cells) + " |")
+
+
+# --- MAIN ---
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    spec = " ".join(argv) or os.getenv("ADO_ORGS", "")
+    orgs = parse_orgs(spec.replace(" ", ","))
+
+    if not orgs or not os.getenv("ADO_PAT"):
+        print("❌ Error: pass orgs as arguments or ADO_ORGS (e.g. KKEU,OTHER:5), and set ADO_PAT.")
+        exit(1)
+
+    workers = int(os.getenv("ORG_WORKERS", str(len(orgs))))
+    print(f"::notice::Running {len(orgs)} org(s) with {workers} worker process(es): {', '.join(o for o, _ in orgs)}")
+
+    started = time.monotonic()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_org, org, rps): org for org, rps in orgs}
+        for future in as_completed(futures):
+            org = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"org": org, "rps": None, "steps": {}, "seconds": None, "error": repr(e),
+                          "users": None, "demote_candidates": None, "field_rows": None, "stats_projects": None}
+            print(f"::notice::{org} finished in {result['seconds']}s (log: ado/outputs/{org}/run.log)")
+            results.append(result)
+
+    results.sort(key=lambda r: r["org"])
+    wall = round(time.monotonic() - started, 1)
+    print(f"\n::notice::All orgs done in {wall}s\n")
+    print_summary(results)
+
+    summary_file = BASE_DIR / "outputs" / "run_summary.json"
+    with summary_file.open("w", encoding="utf-8") as f:
+        json.dump({
+            "finished": datetime.now(timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z"),
+            "wall_seconds": wall,
+            "orgs": results,
+        }, f, indent=1)
+    print(f"\n::notice::Summary written to {summary_file}")
+
+    failed = [r["org"] for r in results if r.get("error") or any(s["status"] not in ("ok", "unchanged") for s in r["steps"].values())]
+    if failed:
+        print(f"::error::Failed org(s): {', '.join(failed)}")
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+from ado_client import audit_url
+
+AUDIT_API_VERSION = "7.1-preview.1"
+AUDIT_BATCH_SIZE = 200
+
+# audit entries can show up a few minutes late; reading an event twice only re-fetches that user again
+WATERMARK_OVERLAP = timedelta(minutes=15)
+
+# ADO keeps the audit log for 90 days; an older watermark would silently miss events
+AUDIT_RETENTION = timedelta(days=90)
+
+# entitlement events: Licensing.Assigned (new user / license), .Modified, .Removed (user or license removed)
+LICENSING_PREFIX = "Licensing."
+
+# group rules re-license many users at once, without one event per user -> full resync
+BULK_PREFIXES = ("Licensing.GroupRule",)
+
+# event data keys that name the affected user, by entitlement (= identity) ID or by principal name
+TARGET_ID_KEYS = ("UserId", "TargetUserId")
+TARGET_NAME_KEYS = ("UserIdentifier", "UserPrincipalName", "TargetUserPrincipalName")
+
+STATE_VERSION = 1
+
+
+def to_iso(dt):
+    return dt.astimezone(timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z")
+
+
+def parse_dt(s):
+    return datetime.fromisoformat(s.replace("Z", "+00:00"))
+
+
+# --- AUDIT LOG ---
+# Users touched by licensing events in a time window
+class AuditDelta:
+    def __init__(self):
+        self.events = 0
+        self.ids = set()
+        self.names = set()  # lower-case principal names
+        self.resync = None  # why the events can't be applied one by one
+
+
+def read_audit(client, org, since, until):
+    delta = AuditDelta()
+    url = f"{audit_url(org)}/_apis/audit/auditlog"
+    params = {
+        "startTime": to_iso(since),
+        "endTime": to_iso(until),
+        "batchSize": AUDIT_BATCH_SIZE,
+        "skipAggregation": "true",
+        "api-version": AUDIT_API_VERSION,
+    }
+
+    while True:
+        data = client.get_json(url, params=params)
+        for entry in data.get("decoratedAuditLogEntries") or []:
+            action = entry.get("actionId") or ""
+            if not action.startswith(LICENSING_PREFIX):
+                continue
+            delta.events += 1
+            if action.startswith(BULK_PREFIXES):
+                delta.resync = f"{action} at {entry.get('timestamp')}"
+                continue
+
+            event = entry.get("data") or {}
+            ids = {str(event[k]) for k in TARGET_ID_KEYS if event.get(k)}
+            names = {str(event[k]).lower() for k in TARGET_NAME_KEYS if event.get(k)}
+            if not ids and not names:
+                delta.resync = f"{action} at {entry.get('timestamp')} names no user"
+            delta.ids |= ids
+            delta.names |= names
+
+        token = data.get("continuationToken")
+        if not data.get("hasMore") or not token:
+            break
+        params = {**params, "continuationToken": token}
+
+    return delta
+
+
+# --- STATE ---
+# outputs/<ORG>/.users_audit_state.json: audit watermark, time of the last full resync and
+# the snapshot both belong to (persisted via actions/cache in CI)
+def load_state(path):
+    if not path.exists():
+        return {}
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            state = json.load(f)
+    except json.JSONDecodeError:
+        print(f"::warning::Ignoring unreadable {path.name}")
+        return {}
+    if state.get("version") != STATE_VERSION:
+        return {}
+    return state
+
+
+def save_state(path, *, watermark, full_resync, snapshot_sha):
+    partial = path.with_name(path.name + ".partial")
+    with partial.open("w", encoding="utf-8") as f:
+        json.dump({
+            "version": STATE_VERSION,
+            "watermark": to_iso(watermark),
+            "full_resync": to_iso(full_resync),
+            "snapshot_sha256": snapshot_sha,
+        }, f, indent=1)
+    partial.replace(path)
+
+
+# Why this run has to re-pull the whole org, or None when the audit log can be applied
+def resync_reason(state, snapshot_sha, now, full_resync_days):
+    if snapshot_sha is None:
+        return "no previous snapshot"
+    if not state:
+        return "no audit watermark"
+    if state.get("snapshot_sha256") != snapshot_sha:
+        return "users_latest.csv was written without the watermark (other run or manual edit)"
+    if now - parse_dt(state["watermark"]) > AUDIT_RETENTION:
+        return "watermark is older than the audit log retention"
+    age = now - parse_dt(state["full_resync"])
+    if age >= timedelta(days=full_resync_days):
+        return f"last full resync {age.days} day(s) ago (USERS_FULL_RESYNC_DAYS={full_resync_days:g})"
+    return None
@@ -0,0 +1,92 @@
+import csv
+import json
+from collections import Counter
+
+from demotion_rules import threshold_for
+from user_snapshot import row_days_inactive
+
+
+# --- CHANGE KINDS ---
+ADDED = "added"
+REMOVED = "removed"
+LICENSE_CHANGED = "license_changed"
+SOURCE_CHANGED = "source_changed"
+CROSSED_THRESHOLD = "crossed_threshold"  # either direction: went inactive, or logged in again
+
+
+# Snapshot rows with an ID, checked to be in canonical order (the merge below relies on it)
+def sorted_rows(path):
+    last = ""
+    with path.open("r", newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            key = row.get("UserEntitlementId") or ""
+            if not key:
+                continue  # can't be matched (nor demoted)
+            if key < last:
+                raise ValueError(f"{path.name} is not ordered by UserEntitlementId")
+            last = key
+            yield row
+
+
+# Delta between two entitlement snapshots, keyed by UserEntitlementId.
+# Both CSVs are in canonical order, so this is a merge of two sorted streams: one row of each
+# in memory, whatever the size of the org. Days Inactive of each side is taken as of its own
+# scan time; a threshold crossing is judged against the threshold of the *new* license.
+# Returns one dict per (user, change kind): UserEntitlementId, Email, Change, Old, New.
+def compute_changes(prev_csv, prev_scanned, new_csv, new_scanned, rules):
+    changes = []
+
+    def change(row, kind, old, new):
+        changes.append({"UserEntitlementId": row["UserEntitlementId"], "Email": row.get("Email") or "",
+                        "Change": kind, "Old": old, "New": new})
+
+    prev_rows, new_rows = sorted_rows(prev_csv), sorted_rows(new_csv)
+    old, new = next(prev_rows, None), next(new_rows, None)
+    while old is not None or new is not None:
+        if new is None or (old is not None and old["UserEntitlementId"] < new["UserEntitlementId"]):
+            change(old, REMOVED, old.get("License") or "", "")
+            old = next(prev_rows, None)
+            continue
+        if old is None or new["UserEntitlementId"] < old["UserEntitlementId"]:
+            change(new, ADDED, "", new.get("License") or "")
+            new = next(new_rows, None)
+            continue
+
+        if (old.get("License") or "") != (new.get("License") or ""):
+            change(new, LICENSE_CHANGED, old.get("License") or "", new.get("License") or "")
+        if (old.get("Source") or "") != (new.get("Source") or ""):
+            change(new, SOURCE_CHANGED, old.get("Source") or "", new.get("Source") or "")
+
+        threshold = threshold_for(new.get("License") or "", rules)
+        days_old = row_days_inactive(old, prev_scanned)
+        days_new = row_days_inactive(new, new_scanned)
+        if (days_old >= threshold) != (days_new >= threshold):
+            change(new, CROSSED_THRESHOLD, days_old, days_new)
+
+        old, new = next(prev_rows, None), next(new_rows, None)
+
+    return changes
+
+
+# The changes file pins the snapshot pair it was computed from, and the rules that judged the
+# threshold crossings, so consumers can tell whether it applies to their own state.
+def write_changes(path, changes, base_sha, snapshot_sha, rules_sha):
+    doc = {
+        "base_sha256": base_sha,
+        "snapshot_sha256": snapshot_sha,
+        "rules_sha256": rules_sha,
+        "counts": dict(Counter(c["Change"] for c in changes)),
+        "changes": changes,
+    }
+    with path.open("w", encoding="utf-8") as f:
+        json.dump(doc, f, ensure_ascii=False, indent=1)
+
+
+def load_changes(path):
+    if not path.exists():
+        return None
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            return json.load(f)
+    except json.JSONDecodeError:
+        return None
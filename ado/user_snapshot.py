@@ -0,0 +1,125 @@
+import json
+from datetime import datetime, timezone
+
+from hashing import file_sha256
+
+# What users_latest.csv stores: source fields only, one row per entitlement, ordered by
+# UserEntitlementId. Nothing in it depends on the day of the scan, so nightly commits only
+# show real changes (new / removed users, logins, license moves).
+SNAPSHOT_COLUMNS = [
+    "Email",
+    "UserEntitlementId",
+    "License",
+    "Source",
+    "Last Login",
+    "Created",
+    "Last Login Date",
+    "Created Date",
+]
+
+# derived on read, as of the scan time recorded next to the snapshot
+DAYS_COLUMN = "Days Inactive"
+
+
+# --- SCAN TIME ---
+# users_latest.meta.json: when the snapshot was taken, pinned to its content hash
+def meta_path(csv_path):
+    return csv_path.with_name(csv_path.stem + ".meta.json")
+
+
+def write_meta(csv_path, scanned):
+    with meta_path(csv_path).open("w", encoding="utf-8") as f:
+        json.dump({
+            "scanned": scanned.isoformat(timespec="seconds").replace("+00:00", "Z"),
+            "sha256": file_sha256(csv_path),
+        }, f, indent=1)
+
+
+# Scan time of the snapshot, or None when the meta file is missing or belongs to other content
+def scanned_at(csv_path):
+    path = meta_path(csv_path)
+    if not path.exists() or not csv_path.exists():
+        return None
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except json.JSONDecodeError:
+        return None
+    if meta.get("sha256") != file_sha256(csv_path):
+        return None
+    return datetime.fromisoformat(meta["scanned"].replace("Z", "+00:00"))
+
+
+# --- DAYS INACTIVE ---
+# ADO timestamps (UTC, "...Z", 7 fractional digits) -> datetime64[us] in one numpy call;
+# the bogus 0001-01-01 date and blanks become NaT
+def parse_timestamps(raw):
+    import numpy as np
+    import pandas as pd
+
+    raw = pd.Series(raw, dtype=object)
+    if raw.str.endswith("Z", na=True).all():
+        dt = raw.str.removesuffix("Z").fillna("NaT").to_numpy(dtype="datetime64[us]")
+    else:
+        # anything else ISO 8601 (e.g. explicit offsets) goes through pandas
+        dt = pd.to_datetime(raw, utc=True, errors="coerce", format="ISO8601").dt.tz_localize(None).to_numpy("datetime64[us]")
+    return np.where(dt < np.datetime64("0002-01-01"), np.datetime64("NaT"), dt)
+
+
+# Whole days from Last Login or Created (whichever is newer) to asof; neither -> 0
+def days_inactive(df, asof=None):
+    import numpy as np
+
+    asof = np.datetime64((asof or datetime.now(timezone.utc)).astimezone(timezone.utc).replace(tzinfo=None), "us")
+    # fmax skips NaT
+    ref = np.fmax(parse_timestamps(df["Last Login"]), parse_timestamps(df["Created"]))
+    known = ~np.isnat(ref)
+    days = np.zeros(len(df), dtype=np.int16)
+    days[known] = (asof - ref[known]) // np.timedelta64(1, "D")
+    return days
+
+
+# Row-at-a-time counterpart of days_inactive() for consumers that stream the CSV (changefeed)
+def row_days_inactive(row, asof):
+    if row.get(DAYS_COLUMN):
+        return int(float(row[DAYS_COLUMN]))  # older snapshot that still stored it
+    refs = []
+    for key in ("Last Login", "Created"):
+        try:
+            dt = datetime.fromisoformat(row.get(key) or "")
+        except ValueError:
+            continue
+        dt = dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+        if dt.year >= 2:  # the bogus 0001-01-01 date
+            refs.append(dt)
+    return (asof - max(refs)).days if refs else 0
+
+
+# df plus the Days Inactive column (kept as is when already there, e.g. an older snapshot
+# that still stored it)
+def with_days_inactive(df, asof=None):
+    if DAYS_COLUMN in df.columns:
+        return df
+    df = df.copy()
+    # right after the snapshot columns, where it used to be stored
+    pos = df.columns.get_loc("Created Date") + 1 if "Created Date" in df.columns else len(df.columns)
+    df.insert(pos, DAYS_COLUMN, days_inactive(df, asof))
+    return df
+
+
+# users_latest.csv as a table with Days Inactive as of its scan (now, if the scan time is unknown)
+def read_snapshot(csv_path):
+    import pandas as pd
+
+    return with_days_inactive(pd.read_csv(csv_path), scanned_at(csv_path))
+
+
+# Report order: most inactive first, ties in snapshot order
+def by_inactivity(df):
+    return df.sort_values(DAYS_COLUMN, ascending=False, kind="stable")
+
+
+# Stored order: by UserEntitlementId (blank IDs first), without derived columns
+def canonical(df):
+    df = df.drop(columns=[DAYS_COLUMN], errors="ignore")
+    return df.sort_values("UserEntitlementId", kind="stable", key=lambda ids: ids.fillna(""), ignore_index=True)
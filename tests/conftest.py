@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# the scripts under ado/ import each other as top-level modules (python ado/<script>.py)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "ado"))
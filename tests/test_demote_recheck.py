@@ -0,0 +1,61 @@
+import pandas as pd
+import pytest
+
+import demote_org_users
+import get_org_users
+
+STALE = "00000000-0000-0000-0000-00000000000a"     # still inactive in ADO
+ACTIVE = "00000000-0000-0000-0000-00000000000b"    # logged in after the scan
+GONE = "00000000-0000-0000-0000-00000000000c"      # left the org (404)
+BROKEN = "00000000-0000-0000-0000-00000000000d"    # GET fails
+
+
+def entitlement(entitlement_id, last_login):
+    return {"id": entitlement_id, "user": {"principalName": f"{entitlement_id[-1]}@example.com"},
+            "accessLevel": {"licenseDisplayName": "Basic", "licensingSource": "account"},
+            "lastAccessedDate": last_login, "dateCreated": "2023-01-10T08:00:00Z"}
+
+
+ADO = {
+    STALE: entitlement(STALE, "2024-03-01T09:00:00Z"),
+    ACTIVE: entitlement(ACTIVE, pd.Timestamp.now(tz="UTC").strftime("%Y-%m-%dT%H:%M:%SZ")),
+    GONE: None,
+}
+
+
+def fake_fetch(client, licensing_org_url, entitlement_id):
+    if entitlement_id == BROKEN:
+        raise RuntimeError("GET failed: 500")
+    return ADO[entitlement_id]
+
+
+@pytest.fixture
+def run(tmp_path, monkeypatch):
+    monkeypatch.setattr(demote_org_users, "BASE_DIR", tmp_path)
+    monkeypatch.setattr(get_org_users, "fetch_entitlement", fake_fetch)
+    run = demote_org_users.DemoteRun("TEST", "pat", mode="DEMOTE_ALL", rules_file=tmp_path / "no_rules.json")
+    run.output_dir.mkdir(parents=True)
+    return run
+
+
+# The snapshot flagged all four; only the one still inactive in ADO is patched
+def test_demote_all_patches_only_users_still_eligible(run, monkeypatch):
+    patched = []
+    monkeypatch.setattr(demote_org_users, "demote_batch", lambda run, ids: patched.extend(ids) or {i: None for i in ids})
+
+    ids = [STALE, ACTIVE, GONE, BROKEN]
+    df_status = pd.DataFrame({
+        "Email": [f"{i[-1]}@example.com" for i in ids], "UserEntitlementId": ids, "License": "Basic",
+        "Source": "account", "Days Inactive": 600, "Demotion_Status": "Demote",
+        "Demotion_Reason": "inactive_over_threshold",
+    })
+
+    with pytest.raises(RuntimeError, match="Some demotions failed"):
+        demote_org_users.demote_all(run, df_status, df_status.copy())
+
+    assert patched == [STALE]
+    status = dict(zip(df_status["UserEntitlementId"], zip(df_status["Demotion_Status"], df_status["Demotion_Reason"])))
+    assert status[STALE] == ("Demote DONE", "inactive_over_threshold")
+    assert status[ACTIVE] == ("", "below_threshold")
+    assert status[GONE] == ("", "not_in_org")
+    assert status[BROKEN] == ("Demote", "inactive_over_threshold")
@@ -0,0 +1,103 @@
+import csv
+import shutil
+from datetime import datetime, timezone
+
+import pandas as pd
+import pytest
+
+import demote_org_users
+from demotion_rules import rules_sha256
+from hashing import file_sha256
+from user_changes import CROSSED_THRESHOLD, compute_changes, write_changes
+from user_snapshot import SNAPSHOT_COLUMNS, write_meta
+
+FIRST_SCAN = datetime(2026, 1, 1, 6, 0, tzinfo=timezone.utc)
+SECOND_SCAN = datetime(2026, 1, 2, 6, 0, tzinfo=timezone.utc)
+
+ACTIVE = "00000000-0000-0000-0000-00000000000a"
+INACTIVE = "00000000-0000-0000-0000-00000000000b"
+
+
+def user(entitlement_id, email, last_login):
+    return {
+        "Email": email,
+        "UserEntitlementId": entitlement_id,
+        "License": "Basic",
+        "Source": "account",
+        "Last Login": last_login,
+        "Created": "2023-01-10T08:00:00.0000000Z",
+        "Last Login Date": last_login[:10],
+        "Created Date": "2023-01-10",
+    }
+
+
+def write_snapshot(path, rows, scanned):
+    with path.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=SNAPSHOT_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+    write_meta(path, scanned)
+
+
+# Scan step: new snapshot + changefeed vs the previous one, as get_org_users.scan_users() writes them
+def rescan(run, rows, scanned, rules):
+    previous = run.input_csv.with_name("users_latest.previous.csv")
+    shutil.copyfile(run.input_csv, previous)
+    base_sha = file_sha256(previous)
+
+    write_snapshot(run.input_csv, rows, scanned)
+    changes = compute_changes(previous, FIRST_SCAN, run.input_csv, scanned, rules)
+    write_changes(run.changes_json, changes, base_sha, file_sha256(run.input_csv), rules_sha256(rules))
+    return changes
+
+
+@pytest.fixture
+def run(tmp_path, monkeypatch):
+    monkeypatch.setattr(demote_org_users, "BASE_DIR", tmp_path)
+    run = demote_org_users.DemoteRun("TEST", "pat", threshold_days=90, rules_file=tmp_path / "no_rules.json")
+    run.output_dir.mkdir(parents=True)
+    write_snapshot(run.input_csv, [
+        user(ACTIVE, "active@example.com", "2025-12-30T09:00:00.0000000Z"),
+        user(INACTIVE, "inactive@example.com", "2024-03-01T09:00:00.0000000Z"),
+    ], FIRST_SCAN)
+    return run
+
+
+def status_of(run, entitlement_id):
+    df = pd.read_csv(run.output_csv, dtype={"UserEntitlementId": str}).fillna("")
+    row = df[df["UserEntitlementId"] == entitlement_id].iloc[0]
+    return row["Demotion_Status"], row["Demotion_Reason"]
+
+
+# A flagged user who logs in again must lose the Demote flag on the incremental path
+def test_login_clears_demote_flag_incrementally(run, capsys):
+    demote_org_users.analyze_and_flag(run)
+    assert status_of(run, INACTIVE) == ("Demote", "inactive_over_threshold")
+
+    changes = rescan(run, [
+        user(ACTIVE, "active@example.com", "2025-12-30T09:00:00.0000000Z"),
+        user(INACTIVE, "inactive@example.com", "2026-01-02T05:00:00.0000000Z"),
+    ], SECOND_SCAN, run.rules)
+    assert [(c["UserEntitlementId"], c["Change"]) for c in changes] == [(INACTIVE, CROSSED_THRESHOLD)]
+
+    capsys.readouterr()
+    demote_org_users.analyze_and_flag(run)
+    assert "Changefeed applies" in capsys.readouterr().out
+    assert status_of(run, INACTIVE) == ("", "below_threshold")
+    assert status_of(run, ACTIVE) == ("", "below_threshold")
+
+
+# Crossings judged with other rules than the demotion step's don't apply: full rebuild
+def test_changefeed_from_other_rules_forces_full_rebuild(run, capsys):
+    demote_org_users.analyze_and_flag(run)
+
+    scan_rules = {**run.rules, "threshold_days": 1000}
+    rescan(run, [
+        user(ACTIVE, "active@example.com", "2025-12-30T09:00:00.0000000Z"),
+        user(INACTIVE, "inactive@example.com", "2026-01-02T05:00:00.0000000Z"),
+    ], SECOND_SCAN, scan_rules)
+
+    capsys.readouterr()
+    demote_org_users.analyze_and_flag(run)
+    assert "Changefeed applies" not in capsys.readouterr().out
+    assert status_of(run, INACTIVE) == ("", "below_threshold")
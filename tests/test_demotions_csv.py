@@ -0,0 +1,34 @@
+import json
+
+import demote_org_users
+
+
+def event(ts, entitlement_id, days_inactive):
+    return {"ts": ts, "org": "TEST", "userEntitlementId": entitlement_id, "email": f"{entitlement_id}@example.com",
+            "oldLicense": "Basic", "newLicense": "Stakeholder", "daysInactive": days_inactive, "thresholdDays": 90,
+            "source": "account", "mode": "DEMOTE_ALL", "ghRunId": "1", "ghSha": "abc"}
+
+
+def append(run, *events):
+    with run.demotions_log.open("a", encoding="utf-8") as f:
+        for e in events:
+            f.write(json.dumps(e) + "\n")
+
+
+# Incremental prepends and a full rebuild of the same log write the same bytes,
+# also when an event has no daysInactive (pandas used to turn that column into floats)
+def test_incremental_and_full_rebuild_match(tmp_path, monkeypatch):
+    monkeypatch.setattr(demote_org_users, "BASE_DIR", tmp_path)
+    run = demote_org_users.DemoteRun("TEST", "pat", rules_file=tmp_path / "no_rules.json")
+    run.output_dir.mkdir(parents=True)
+
+    append(run, event("2026-01-01T06:00:00Z", "a", 175), event("2026-01-01T06:00:00Z", "b", None))
+    demote_org_users.rebuild_demotions_csv(run)
+    append(run, event("2026-01-02T06:00:00Z", "c", 120))
+    demote_org_users.rebuild_demotions_csv(run)
+    incremental = run.demotions_csv.read_bytes()
+
+    run.demotions_checkpoint.unlink()
+    demote_org_users.rebuild_demotions_csv(run)
+    assert run.demotions_csv.read_bytes() == incremental
+    assert b",175," in incremental and b".0," not in incremental
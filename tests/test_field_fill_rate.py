@@ -0,0 +1,76 @@
+import csv
+import re
+
+import pytest
+
+import field_fill_rate
+from ado_client import AdoHttpError
+
+WORK_ITEMS = {"A": 10, "B": 4}
+FILLED = {("A", "Custom_Risk"): 5, ("B", "Custom_Risk"): 1, ("A", "Custom_Team"): 10}
+NOT_IN_ANALYTICS = "Custom_New"
+
+
+# Analytics answers for the queries count_filled() sends; a property it doesn't know rejects the query
+class FakeAnalytics:
+    queries = []
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def get_json(self, url, params=None):
+        apply = params["$apply"]
+        FakeAnalytics.queries.append(apply)
+        counted = re.findall(r"iif\((\w+) ne null, 1, 0\) as (\w+)", apply)
+        if any(prop == NOT_IN_ANALYTICS for prop, _ in counted):
+            raise AdoHttpError(f"GET {url} failed: 400 Could not find a property named '{NOT_IN_ANALYTICS}'", 400)
+        projects = re.findall(r"'(\w+)'", apply)
+        return {"value": [{"Project": {"ProjectName": p}, "Count": WORK_ITEMS[p],
+                           **{alias: FILLED.get((p, prop), 0) for prop, alias in counted}} for p in projects]}
+
+
+@pytest.fixture(autouse=True)
+def fake_analytics(monkeypatch):
+    monkeypatch.setattr(field_fill_rate, "AdoClient", FakeAnalytics)
+    FakeAnalytics.queries = []
+
+
+def write_catalog(path, rows):
+    with path.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Project", "ProcessName", "FieldName", "FieldRefName", "FieldType", "IsIdentity", "IsCustom"])
+        for project, ref in rows:
+            writer.writerow([project, "Agile", ref.split(".")[1], ref, "string", "No", "Yes"])
+
+
+# Several fields share one query; a field Analytics doesn't know is skipped, the others still counted
+def test_fields_share_queries_and_unknown_field_is_skipped(tmp_path):
+    write_catalog(tmp_path / "catalog.csv", [("A", "Custom.Risk"), ("B", "Custom.Risk"), ("A", "Custom.Team"),
+                                             ("B", "Custom.New")])
+    rows = field_fill_rate.collect_fill_rates("TEST", "pat", tmp_path / "catalog.csv", tmp_path / "fill.csv")
+
+    assert rows == 3
+    with (tmp_path / "fill.csv").open(newline="", encoding="utf-8") as f:
+        assert list(csv.reader(f))[1:] == [
+            ["A", "Custom.Risk", "Risk", "10", "5", "50.0"],
+            ["B", "Custom.Risk", "Risk", "4", "1", "25.0"],
+            ["A", "Custom.Team", "Team", "10", "10", "100.0"],
+        ]
+    # the batch of three, its halves ([New], [Risk, Team]) and the totals without the unknown field
+    assert len(FakeAnalytics.queries) == 4
+
+
+# Incremental: only the re-crawled project is counted, the other keeps its earlier row
+def test_only_recrawled_projects_are_counted(tmp_path):
+    write_catalog(tmp_path / "catalog.csv", [("A", "Custom.Risk"), ("B", "Custom.Risk")])
+    out = tmp_path / "fill.csv"
+    out.write_text("Project,FieldRefName,FieldName,WorkItems,Filled,FillRate\n"
+                   "A,Custom.Risk,Risk,8,2,25.0\n"
+                   "B,Custom.Risk,Risk,3,3,100.0\n", encoding="utf-8")
+
+    field_fill_rate.collect_fill_rates("TEST", "pat", tmp_path / "catalog.csv", out, projects={"A"})
+
+    assert out.read_text(encoding="utf-8").splitlines()[1:] == ["A,Custom.Risk,Risk,10,5,50.0",
+                                                                "B,Custom.Risk,Risk,3,3,100.0"]
+    assert FakeAnalytics.queries == ["filter(Project/ProjectName in ('A'))/compute(iif(Custom_Risk ne null, 1, 0) as F0)"
+                                     "/groupby((Project/ProjectName), aggregate($count as Count, F0 with sum as F0))"]
@@ -0,0 +1,33 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import field_index
+import get_org_fields
+
+ADO_DIR = Path(__file__).resolve().parent.parent / "ado"
+
+
+def test_cluster_threshold_defaults_match():
+    assert get_org_fields.DEFAULT_CLUSTER_THRESHOLD == field_index.DEFAULT_CLUSTER_THRESHOLD
+
+
+# `pe_auto.py fields` (stream workbook + clusters) runs without pandas; NumPy only comes with the clusters stage
+def test_fields_never_loads_pandas(tmp_path):
+    csv_path = tmp_path / "ado_project_fields.csv"
+    csv_path.write_text(
+        "Project,ProcessName,FieldName,FieldRefName,FieldType,IsIdentity,IsCustom\n"
+        "A,Agile,Title,System.Title,string,No,No\n"
+        "A,Agile,Risk,Custom.Risk,string,No,Yes\n"
+        "B,Agile,Title,System.Title,string,No,No\n",
+        encoding="utf-8",
+    )
+    script = (
+        "import sys, get_org_fields\n"
+        "assert 'numpy' not in sys.modules\n"
+        "from field_index import FieldIndex\n"
+        f"index = FieldIndex.from_csv({str(csv_path)!r})\n"
+        "assert index.unique_fields('A') == [('Custom.Risk', 'Risk', True)]\n"
+        "assert 'pandas' not in sys.modules\n"
+    )
+    subprocess.run([sys.executable, "-c", script], cwd=ADO_DIR, check=True)
@@ -0,0 +1,33 @@
+import os
+from pathlib import Path
+
+import pytest
+
+import get_org_fields
+
+
+# A crawl state is only reused by the crawl mode that wrote it
+def test_crawl_state_from_other_mode_is_not_reused(tmp_path):
+    path = tmp_path / ".fields_crawl_state.json"
+    state = {"version": get_org_fields.CRAWL_STATE_VERSION, "crawl_mode": "process", "projects": {"p1": {}}}
+    get_org_fields.save_crawl_state(path, state)
+
+    assert get_org_fields.load_crawl_state(path, "process") == state
+    assert get_org_fields.load_crawl_state(path, "project") == {}
+
+
+def open_files():
+    fds = Path("/proc/self/fd")
+    return {os.path.realpath(fd) for fd in fds.iterdir()}
+
+
+# The tag check of an unchanged workbook must not leave the file open
+@pytest.mark.skipif(not Path("/proc/self/fd").exists(), reason="needs /proc to list open files")
+def test_unchanged_workbook_check_closes_the_file(tmp_path):
+    csv_path, xlsx_path = tmp_path / "ado_project_fields.csv", tmp_path / "ado_project_fields.xlsx"
+    csv_path.write_text(",".join(get_org_fields.CSV_COLUMNS) + "\nA,Agile,Title,System.Title,string,No,No\n",
+                        encoding="utf-8")
+    get_org_fields.build_excel_stream(csv_path, xlsx_path)
+    get_org_fields.build_excel_stream(csv_path, xlsx_path)  # unchanged: only reads the tag
+
+    assert os.path.realpath(xlsx_path) not in open_files()
@@ -0,0 +1,56 @@
+import pytest
+
+import group_exemptions
+
+GROUP = "vssgp.keepers"
+MEMBERS = {
+    "aad.1": {"principalName": "Ann@Corp.com", "mailAddress": "ann.alias@corp.com"},  # mail differs from UPN
+    "aad.2": {"principalName": "bob-ext@corp.com", "mailAddress": "bob@corp.com"},     # only the mail was scanned
+    "aad.3": {"principalName": "carl@corp.com", "mailAddress": "carl@corp.com"},       # no entitlement
+}
+
+
+# Graph answers for one "License Keepers" group with the members above
+class FakeGraph:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def post_json(self, url, body, params=None):
+        if url.endswith("/subjectquery"):
+            found = body["query"] == "License Keepers"
+            return {"value": [{"descriptor": GROUP, "displayName": "License Keepers"}] if found else []}
+        return {"value": {d: MEMBERS[d] for d in (k["descriptor"] for k in body["lookupKeys"])}}
+
+    def get_json(self, url, params=None):
+        return {"value": [{"memberDescriptor": d} for d in MEMBERS]}
+
+
+@pytest.fixture(autouse=True)
+def fake_graph(monkeypatch):
+    monkeypatch.setattr(group_exemptions, "AdoClient", FakeGraph)
+
+
+def resolve(tmp_path, groups, out="users_exemptions.json"):
+    return group_exemptions.resolve_exemptions(
+        "TEST", "pat", groups, ["ann@corp.com", "bob@corp.com", "dora@corp.com"],
+        out_json=tmp_path / out, cache_path=tmp_path / ".graph_cache.json",
+    )
+
+
+def test_members_match_on_principal_name_then_mail(tmp_path):
+    assert resolve(tmp_path, ["License Keepers"]) == 2
+    exempt = group_exemptions.load_exemptions(tmp_path / "users_exemptions.json", ["License Keepers"])
+    assert exempt == {"ann@corp.com", "bob@corp.com"}
+
+
+# Same members -> same bytes, whatever the time of the scan (the file's hash gates the demotion step)
+def test_exemptions_file_is_stable(tmp_path):
+    resolve(tmp_path, ["License Keepers"], "first.json")
+    resolve(tmp_path, ["License Keepers"], "second.json")
+    assert (tmp_path / "first.json").read_bytes() == (tmp_path / "second.json").read_bytes()
+
+
+def test_missing_group_fails_closed(tmp_path):
+    with pytest.raises(RuntimeError, match="Nobody"):
+        resolve(tmp_path, ["License Keepers", "Nobody"])
+    assert not (tmp_path / "users_exemptions.json").exists()
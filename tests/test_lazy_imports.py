@@ -0,0 +1,11 @@
+import subprocess
+import sys
+from pathlib import Path
+
+ADO_DIR = Path(__file__).resolve().parent.parent / "ado"
+
+
+# Importing a script must not pull in pandas; only the functions that need it load it
+def test_demote_module_does_not_load_pandas():
+    script = "import sys, demote_org_users\nassert 'pandas' not in sys.modules\n"
+    subprocess.run([sys.executable, "-c", script], cwd=ADO_DIR, check=True)
@@ -0,0 +1,30 @@
+import get_project_stats
+
+WATERMARK = "2026-01-01T06:00:00.123Z"
+
+
+# WIQL + workitemsbatch for one project: items 1-3, of which 2 and 3 match ChangedDate >= watermark
+class FakeWit:
+    def __init__(self):
+        self.fetched = []
+
+    def post_json(self, url, payload, params=None):
+        if url.endswith("/wiql"):
+            if "[System.Id] > 0" not in payload["query"]:
+                return {"workItems": []}
+            ids = [2, 3] if "ChangedDate" in payload["query"] else [1, 2, 3]
+            return {"workItems": [{"id": i} for i in ids]}
+        self.fetched += payload["ids"]
+        return {"value": [{"id": i, "fields": {"System.ChangedDate": "2026-01-02T08:00:00Z"}} for i in payload["ids"]]}
+
+
+# The item that set the watermark matches the >= query again, but is not fetched again
+def test_item_at_watermark_is_not_refetched():
+    client = FakeWit()
+    state = {"watermark": WATERMARK, "items": {
+        "1": ["Bug", "Active", "2025-12-01T06:00:00Z", "a"],
+        "2": ["Bug", "Active", "2026-01-01T06:00:00.1230000Z", "a"],  # the watermark itself
+        "3": ["Bug", "Active", "2025-12-01T06:00:00Z", "a"],          # changed since
+    }}
+    get_project_stats.collect_project(client, "https://ado", {"id": "p", "name": "P"}, state)
+    assert client.fetched == [3]
@@ -0,0 +1,34 @@
+from response_cache import ResponseCache
+
+
+class Response:
+    def __init__(self, text):
+        self.text = text
+        self.headers = {"ETag": '"1"'}
+
+
+def disk_bytes(cache):
+    return sum(f.stat().st_size for f in cache.root.glob("*.json"))
+
+
+# Overwriting or refreshing an entry must not grow the size total (it drives eviction)
+def test_total_bytes_follows_overwrites(tmp_path):
+    cache = ResponseCache(tmp_path)
+    for body in ("x" * 1000, "y" * 10, "z" * 500):
+        cache.store("https://ado/_apis/projects", None, Response(body))
+    cache.refresh("https://ado/_apis/projects", None, cache.load("https://ado/_apis/projects"))
+    assert cache.total_bytes == disk_bytes(cache)
+    assert (cache.misses, cache.revalidated) == (3, 1)
+
+
+# An entry evicted between reading it and touching it is a miss, not a crash
+def test_load_of_evicted_entry_is_a_miss(tmp_path, monkeypatch):
+    cache = ResponseCache(tmp_path)
+    cache.store("https://ado/_apis/projects", None, Response("{}"))
+
+    def evicted(path, *args):
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr("response_cache.os.utime", evicted)
+    assert cache.load("https://ado/_apis/projects") is None
+
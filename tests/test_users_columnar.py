@@ -0,0 +1,38 @@
+import csv
+import io
+
+import get_org_users
+
+ITEMS = [
+    {"id": "b", "user": {"principalName": "someone@example.com"},
+     "accessLevel": {"licenseDisplayName": "Basic", "licensingSource": "account"},
+     "lastAccessedDate": "2024-01-01T10:00:00.1234567Z", "dateCreated": "2023-01-01T10:00:00Z"},
+    # never logged in, no user / access level data: blanks, never "nan" or "None"
+    {"id": "a", "user": {}, "accessLevel": {}, "lastAccessedDate": None, "dateCreated": ""},
+]
+
+
+# USERS_TRANSFORM=columnar writes the same CSV bytes as the DictWriter rows path
+def test_columnar_csv_matches_rows():
+    columnar = io.StringIO()
+    get_org_users.write_frame_csv(get_org_users.canonical(get_org_users.entitlements_to_frame(ITEMS)), columnar)
+
+    rows = io.StringIO()
+    writer = csv.DictWriter(rows, fieldnames=get_org_users.FIELDNAMES)
+    writer.writeheader()
+    writer.writerows(sorted(map(get_org_users.to_row, ITEMS), key=lambda r: r["UserEntitlementId"] or ""))
+
+    assert columnar.getvalue() == rows.getvalue()
+    assert "nan" not in columnar.getvalue() and "None" not in columnar.getvalue()
+
+
+# Audit log names go into an OData string literal: quotes are doubled, the user is still found
+def test_find_entitlements_escapes_quotes():
+    item = {"id": "c", "user": {"principalName": "o'brien@example.com"}}
+
+    class Client:
+        def get_json(self, url, params=None):
+            assert params["$filter"] == "name eq 'o''brien@example.com'"
+            return {"members": [item]}
+
+    assert get_org_users.find_entitlements(Client(), "https://vsaex", "o'brien@example.com") == [item]